@@ -0,0 +1,279 @@
+import logging
+import random
+import sqlite3
+import threading
+import time
+
+from telebot.apihelper import ApiTelegramException
+
+import metricas
+from limites import BaldeTokens
+from persistencia import RETENCAO_RESOLVIDOS
+
+# Estados de uma concessão de acesso ao grupo
+PENDENTE = "pendente"  # aprovar assim que houver vaga na taxa
+AGUARDANDO_PEDIDO = "aguardando_pedido"  # o usuário ainda não pediu para entrar
+CONCEDIDO = "concedido"
+FALHOU = "falhou"
+
+# Por quanto tempo uma concessão retirada da fila fica reservada ao worker que a pegou (segundos)
+RESERVA = 60
+
+# Espera máxima entre consultas à fila (concessões inseridas por outras instâncias)
+ESPERA_MAXIMA = 5
+
+# Intervalo da limpeza das concessões antigas já encerradas (segundos)
+INTERVALO_LIMPEZA = 3600
+
+
+def _sem_pedido(erro):
+    return "HIDE_REQUESTER_MISSING" in (erro.description or "")
+
+
+def _ja_participa(erro):
+    return "USER_ALREADY_PARTICIPANT" in (erro.description or "")
+
+
+class FilaAdmissaoGrupo:
+    """
+    Fila durável das aprovações de entrada no grupo
+
+    Cada pagamento aprovado vira uma concessão gravada em SQLite (chave
+    payment_id, então conceder duas vezes não duplica nada). Um worker
+    retira as concessões vencidas em lotes e chama `aprovar(user_id)` no
+    ritmo de `taxa` por segundo; um 429 do Telegram pausa a fila pelo
+    retry_after informado. Outras falhas são repetidas com backoff até
+    `max_tentativas`.
+
+    Se o usuário ainda não pediu para entrar no grupo, a concessão fica
+    AGUARDANDO_PEDIDO até `pedido_recebido(user_id)` (o update
+    chat_join_request), e então é aprovada. A cada mudança relevante,
+    `avisar(user_id, chat_id, estado)` é chamada para informar o usuário.
+
+    Várias instâncias podem usar o mesmo banco: uma concessão retirada fica
+    reservada por RESERVA segundos para quem a retirou.
+    """
+
+    def __init__(self, caminho, aprovar, avisar, taxa=5, lote=50, max_tentativas=8,
+                 backoff_inicial=2.0, backoff_max=600.0):
+        self.caminho = caminho
+        self._aprovar = aprovar
+        self._avisar = avisar
+        self._balde = BaldeTokens(taxa)
+        self.lote = max(1, int(lote))
+        self.max_tentativas = max(1, int(max_tentativas))
+        self.backoff_inicial = float(backoff_inicial)
+        self.backoff_max = float(backoff_max)
+        self._lock = threading.Lock()
+        self._acordar = threading.Event()
+        self._rodando = False
+        self._thread = None
+        self._ultima_limpeza = 0.0
+        self._conexao = sqlite3.connect(caminho, timeout=10, check_same_thread=False, isolation_level=None)
+        self._conexao.execute("PRAGMA journal_mode=WAL")
+        self._conexao.execute("PRAGMA synchronous=NORMAL")
+        self._conexao.execute(
+            "CREATE TABLE IF NOT EXISTS admissoes_grupo ("
+            " payment_id TEXT PRIMARY KEY,"
+            " user_id INTEGER NOT NULL,"
+            " chat_id INTEGER,"
+            " estado TEXT NOT NULL,"
+            " tentativas INTEGER NOT NULL DEFAULT 0,"
+            " proxima_em REAL NOT NULL,"
+            " atualizado_em REAL NOT NULL)"
+        )
+        self._conexao.execute("CREATE INDEX IF NOT EXISTS idx_admissoes_fila ON admissoes_grupo(estado, proxima_em)")
+        self._conexao.execute("CREATE INDEX IF NOT EXISTS idx_admissoes_user ON admissoes_grupo(user_id, estado)")
+
+    def conceder(self, payment_id, user_id, chat_id):
+        """
+        Registra o acesso ao grupo de um pagamento aprovado (não bloqueia na rede)
+
+        Returns:
+            bool: False se este pagamento já tinha uma concessão
+        """
+        agora = time.time()
+        with self._lock:
+            cursor = self._conexao.execute(
+                "INSERT OR IGNORE INTO admissoes_grupo (payment_id, user_id, chat_id, estado, proxima_em, atualizado_em)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (str(payment_id), user_id, chat_id, PENDENTE, agora, agora)
+            )
+        if cursor.rowcount != 1:
+            return False
+        self._acordar.set()
+        return True
+
+    def pedido_recebido(self, user_id):
+        """
+        Libera as concessões do usuário que esperavam o pedido de entrada
+
+        Returns:
+            bool: True se o usuário tinha acesso a receber (o pedido será aprovado)
+        """
+        agora = time.time()
+        with self._lock:
+            cursor = self._conexao.execute(
+                "UPDATE admissoes_grupo SET estado = ?, tentativas = 0, proxima_em = ?, atualizado_em = ?"
+                " WHERE user_id = ? AND estado IN (?, ?)",
+                (PENDENTE, agora, agora, user_id, AGUARDANDO_PEDIDO, FALHOU)
+            )
+        if cursor.rowcount == 0:
+            return False
+        self._acordar.set()
+        return True
+
+    def _reservar(self):
+        """Retira até `lote` concessões vencidas, reservando-as por RESERVA segundos"""
+        agora = time.time()
+        with self._lock:
+            self._conexao.execute("BEGIN IMMEDIATE")
+            try:
+                linhas = self._conexao.execute(
+                    "SELECT payment_id, user_id, chat_id, tentativas FROM admissoes_grupo"
+                    " WHERE estado = ? AND proxima_em <= ? ORDER BY proxima_em LIMIT ?",
+                    (PENDENTE, agora, self.lote)
+                ).fetchall()
+                self._conexao.executemany(
+                    "UPDATE admissoes_grupo SET proxima_em = ? WHERE payment_id = ?",
+                    [(agora + RESERVA, linha[0]) for linha in linhas]
+                )
+            except Exception:
+                self._conexao.execute("ROLLBACK")
+                raise
+            self._conexao.execute("COMMIT")
+        return linhas
+
+    def _atualizar(self, payment_id, estado, tentativas, proxima_em=0.0):
+        with self._lock:
+            self._conexao.execute(
+                "UPDATE admissoes_grupo SET estado = ?, tentativas = ?, proxima_em = ?, atualizado_em = ?"
+                " WHERE payment_id = ?",
+                (estado, tentativas, proxima_em, time.time(), payment_id)
+            )
+
+    def _espera_proxima(self):
+        with self._lock:
+            linha = self._conexao.execute(
+                "SELECT MIN(proxima_em) FROM admissoes_grupo WHERE estado = ?", (PENDENTE,)
+            ).fetchone()
+        if linha[0] is None:
+            return ESPERA_MAXIMA
+        return min(ESPERA_MAXIMA, max(0.0, linha[0] - time.time()))
+
+    def _limpar_antigas(self):
+        agora = time.time()
+        if agora - self._ultima_limpeza < INTERVALO_LIMPEZA:
+            return
+        self._ultima_limpeza = agora
+        with self._lock:
+            self._conexao.execute(
+                "DELETE FROM admissoes_grupo WHERE estado IN (?, ?) AND atualizado_em < ?",
+                (CONCEDIDO, FALHOU, agora - RETENCAO_RESOLVIDOS)
+            )
+
+    def _aguardar_vaga(self):
+        """Bloqueia até a taxa permitir mais uma aprovação; False ao parar"""
+        while self._rodando:
+            espera = self._balde.consumir()
+            if espera <= 0:
+                return True
+            time.sleep(espera)
+        return False
+
+    def _processar(self, payment_id, user_id, chat_id, tentativas):
+        contexto = {'payment_id': payment_id, 'user_id': user_id}
+        try:
+            self._aprovar(user_id)
+        except ApiTelegramException as e:
+            if e.error_code == 429:
+                retry_after = (e.result_json.get('parameters') or {}).get('retry_after', 1)
+                logging.warning(f"Telegram limitou as aprovações no grupo, aguardando {retry_after}s")
+                metricas.admissoes_grupo.inc(resultado="limitado")
+                self._balde.esvaziar_por(retry_after)
+                self._atualizar(payment_id, PENDENTE, tentativas, time.time() + retry_after)
+                return
+            if _ja_participa(e):
+                metricas.admissoes_grupo.inc(resultado="ja_participa")
+                self._atualizar(payment_id, CONCEDIDO, tentativas)
+                return
+            if _sem_pedido(e):
+                logging.info(f"Usuário {user_id} ainda não pediu para entrar no grupo; aprovação aguardando o pedido",
+                             extra=contexto)
+                metricas.admissoes_grupo.inc(resultado=AGUARDANDO_PEDIDO)
+                self._atualizar(payment_id, AGUARDANDO_PEDIDO, tentativas)
+                self._avisar(user_id, chat_id, AGUARDANDO_PEDIDO)
+                return
+            erro = e
+        except Exception as e:
+            erro = e
+        else:
+            logging.info(f"Usuário {user_id} adicionado ao grupo automaticamente", extra=contexto)
+            metricas.admissoes_grupo.inc(resultado=CONCEDIDO)
+            self._atualizar(payment_id, CONCEDIDO, tentativas)
+            self._avisar(user_id, chat_id, CONCEDIDO)
+            return
+
+        tentativas += 1
+        metricas.admissoes_grupo.inc(resultado="erro")
+        if tentativas >= self.max_tentativas:
+            logging.warning(f"Não foi possível aprovar automaticamente usuário {user_id} após {tentativas} tentativas: {erro}",
+                            extra=contexto)
+            self._atualizar(payment_id, FALHOU, tentativas)
+            self._avisar(user_id, chat_id, FALHOU)
+            return
+        atraso = min(self.backoff_max, self.backoff_inicial * 2 ** tentativas) * random.uniform(0.5, 1.0)
+        logging.warning(f"Erro ao aprovar usuário {user_id} no grupo (tentativa {tentativas}), nova tentativa em {atraso:.0f}s: {erro}",
+                        extra=contexto)
+        self._atualizar(payment_id, PENDENTE, tentativas, time.time() + atraso)
+
+    def _loop(self):
+        while self._rodando:
+            # Limpo antes de ler a fila: uma concessão inserida durante a leitura acorda o próximo wait
+            self._acordar.clear()
+            try:
+                self._limpar_antigas()
+                itens = self._reservar()
+            except Exception:
+                logging.error("Erro ao ler a fila de aprovações no grupo", exc_info=True)
+                itens = []
+
+            if not itens:
+                self._acordar.wait(self._espera_proxima())
+                continue
+
+            for payment_id, user_id, chat_id, tentativas in itens:
+                if not self._aguardar_vaga():
+                    return
+                try:
+                    self._processar(payment_id, user_id, chat_id, tentativas)
+                except Exception:
+                    logging.error(f"Erro ao processar aprovação no grupo do pagamento {payment_id}", exc_info=True)
+
+    def iniciar(self):
+        """Inicia o worker que aprova as entradas no grupo"""
+        if self._thread is not None:
+            return
+        self._rodando = True
+        self._thread = threading.Thread(target=self._loop, name="admissao-grupo")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def parar(self, timeout=None):
+        """Para o worker, esperando a aprovação em andamento até `timeout` (o resto fica no banco)"""
+        self._rodando = False
+        self._acordar.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def estatisticas(self):
+        """
+        Returns:
+            dict: quantidade de concessões por estado (pendente, aguardando_pedido,
+            concedido, falhou), no banco inteiro
+        """
+        with self._lock:
+            contagens = dict(self._conexao.execute(
+                "SELECT estado, COUNT(*) FROM admissoes_grupo GROUP BY estado"
+            ).fetchall())
+        return {estado: contagens.get(estado, 0) for estado in (PENDENTE, AGUARDANDO_PEDIDO, CONCEDIDO, FALHOU)}
@@ -0,0 +1,301 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+
+class _FilaAgendamentos:
+    """
+    Heap de verificações ordenado pelo horário previsto (uso interno)
+
+    Cada chave tem no máximo uma entrada válida; reagendar ou cancelar só
+    invalida a entrada antiga, que é descartada quando chega ao topo.
+    Cancelar uma chave em execução também impede que ela seja reagendada
+    pelo retorno da própria execução.
+    """
+
+    def __init__(self):
+        self._heap = []  # (quando, seq, chave)
+        self._agendados = {}  # chave -> seq da entrada válida no heap
+        self._executando = {}  # chave -> quantas execuções em andamento
+        self._cancelados = set()  # chaves canceladas durante a execução
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._em_execucao = 0
+        self._executadas = 0
+        self._ultimo_atraso = 0.0
+        self._atraso_maximo = 0.0
+
+    def _notificar(self):
+        """Acorda quem espera por verificações (chamado com o lock adquirido)"""
+        self._cond.notify()
+
+    def _inserir(self, chave, atraso):
+        """Põe `chave` no heap (chamado com o lock adquirido)"""
+        seq = next(self._seq)
+        self._agendados[chave] = seq
+        heapq.heappush(self._heap, (time.monotonic() + max(0.0, atraso), seq, chave))
+        self._notificar()
+
+    def agendar(self, chave, atraso=0.0):
+        """Agenda (ou reagenda) a verificação de `chave` para daqui `atraso` segundos"""
+        with self._cond:
+            self._cancelados.discard(chave)
+            self._inserir(chave, atraso)
+
+    def cancelar(self, chave):
+        """Remove a verificação agendada; a entrada antiga é descartada ao sair do heap"""
+        with self._cond:
+            self._agendados.pop(chave, None)
+            if chave in self._executando:
+                self._cancelados.add(chave)
+
+    def agendado(self, chave):
+        with self._cond:
+            return chave in self._agendados
+
+    def _descartar_invalidas(self):
+        # Remove do topo entradas canceladas ou substituídas por um reagendamento
+        while self._heap and self._agendados.get(self._heap[0][2]) != self._heap[0][1]:
+            heapq.heappop(self._heap)
+
+    def _retirar_vencida(self):
+        """
+        Retira a próxima verificação vencida (chamado com o lock adquirido)
+
+        Returns:
+            tuple: (chave, None) se havia uma vencida, ou (None, espera) com os
+            segundos até a próxima (espera None se o heap está vazio)
+        """
+        self._descartar_invalidas()
+        if not self._heap:
+            return None, None
+
+        quando, _, chave = self._heap[0]
+        espera = quando - time.monotonic()
+        if espera > 0:
+            return None, espera
+
+        heapq.heappop(self._heap)
+        del self._agendados[chave]
+        self._executando[chave] = self._executando.get(chave, 0) + 1
+        self._em_execucao += 1
+        self._ultimo_atraso = -espera
+        self._atraso_maximo = max(self._atraso_maximo, -espera)
+        return chave, None
+
+    def _concluir(self, chave, proximo_atraso):
+        with self._cond:
+            self._em_execucao -= 1
+            self._executadas += 1
+            restantes = self._executando[chave] - 1
+            if restantes:
+                self._executando[chave] = restantes
+            else:
+                del self._executando[chave]
+            cancelada = chave in self._cancelados
+            if not restantes:
+                self._cancelados.discard(chave)
+            # Só reagenda se ninguém reagendou nem cancelou a chave enquanto ela executava
+            if proximo_atraso is not None and not cancelada and chave not in self._agendados:
+                self._inserir(chave, proximo_atraso)
+            if self._em_execucao == 0:
+                self._cond.notify_all()
+
+    def _aguardar_ociosos(self, timeout=None):
+        """Espera as verificações em andamento terminarem; retorna False no timeout"""
+        limite = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._em_execucao > 0:
+                restante = None if limite is None else limite - time.monotonic()
+                if restante is not None and restante <= 0:
+                    return False
+                self._cond.wait(restante)
+            return True
+
+    def exportar(self):
+        """
+        Chaves agendadas e quando vencem, para retomar em outro processo
+
+        Returns:
+            list: [(chave, quando)] em ordem de vencimento, com `quando` em
+            epoch (o relógio monotônico não vale entre processos)
+        """
+        with self._cond:
+            deslocamento = time.time() - time.monotonic()
+            validas = [(quando, chave) for quando, seq, chave in self._heap if self._agendados.get(chave) == seq]
+        return [(chave, quando + deslocamento) for quando, chave in sorted(validas, key=lambda item: item[0])]
+
+    def estatisticas(self):
+        """
+        Retorna o estado do agendador
+
+        Returns:
+            dict: fila, em_execucao, workers, executadas, atraso_atual,
+            ultimo_atraso e atraso_maximo (segundos)
+        """
+        with self._cond:
+            self._descartar_invalidas()
+            atraso_atual = 0.0
+            if self._heap:
+                atraso_atual = max(0.0, time.monotonic() - self._heap[0][0])
+            return {
+                'fila': len(self._agendados),
+                'em_execucao': self._em_execucao,
+                'workers': self._num_workers,
+                'executadas': self._executadas,
+                'atraso_atual': atraso_atual,
+                'ultimo_atraso': self._ultimo_atraso,
+                'atraso_maximo': self._atraso_maximo,
+            }
+
+
+class AgendadorVerificacoes(_FilaAgendamentos):
+    """
+    Agendador único das verificações de pagamento
+
+    Mantém um heap ordenado pelo horário previsto de cada verificação e um
+    pool fixo de workers que as executa. O número de threads não depende
+    de quantos pagamentos estão pendentes.
+
+    A função `verificar` recebe a chave agendada e retorna o atraso em
+    segundos até a próxima verificação, ou None para encerrar.
+    """
+
+    def __init__(self, verificar, workers=4):
+        super().__init__()
+        self._verificar = verificar
+        self._num_workers = max(1, int(workers))
+        self._threads = []
+        self._rodando = False
+
+    def iniciar(self):
+        """Inicia o pool de workers"""
+        with self._cond:
+            if self._rodando:
+                return
+            self._rodando = True
+        for i in range(self._num_workers):
+            thread = threading.Thread(target=self._loop, name=f"verificador-{i}")
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+        logging.info(f"Agendador iniciado com {self._num_workers} workers")
+
+    def parar(self, timeout=None):
+        """
+        Para de retirar verificações e espera as que estão em andamento
+
+        O que continua agendado (inclusive o reagendamento das que estavam em
+        execução) fica no heap, para `exportar`.
+
+        Returns:
+            bool: False se alguma verificação ainda rodava ao fim do timeout
+        """
+        with self._cond:
+            self._rodando = False
+            self._cond.notify_all()
+        return self._aguardar_ociosos(timeout)
+
+    def _proxima(self):
+        """Bloqueia até haver uma verificação vencida; retorna a chave ou None ao parar"""
+        with self._cond:
+            while self._rodando:
+                chave, espera = self._retirar_vencida()
+                if chave is not None:
+                    return chave
+                self._cond.wait(espera)
+            return None
+
+    def _loop(self):
+        while True:
+            chave = self._proxima()
+            if chave is None:
+                return
+
+            proximo_atraso = None
+            try:
+                proximo_atraso = self._verificar(chave)
+            except Exception:
+                logging.error(f"Erro na verificação agendada de {chave}", exc_info=True)
+            finally:
+                self._concluir(chave, proximo_atraso)
+
+
+class AgendadorAssincrono(_FilaAgendamentos):
+    """
+    Versão asyncio do agendador, com a mesma interface
+
+    Uma única tarefa no loop acompanha o heap; cada verificação vencida
+    (bloqueante, com chamadas ao SDK) roda em um executor limitado, com no
+    máximo `concorrencia` verificações em andamento. `agendar` pode ser
+    chamado de qualquer thread.
+    """
+
+    def __init__(self, verificar, executor, concorrencia=32):
+        super().__init__()
+        self._verificar = verificar
+        self._executor = executor
+        self._num_workers = max(1, int(concorrencia))
+        self._loop = None
+        self._acordar = None
+        self._semaforo = None
+        self._tarefa = None
+
+    def _notificar(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._acordar.set)
+
+    def iniciar(self):
+        """Inicia a tarefa do agendador (chamar de dentro do loop asyncio)"""
+        if self._tarefa is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._acordar = asyncio.Event()
+        self._semaforo = asyncio.Semaphore(self._num_workers)
+        self._tarefa = self._loop.create_task(self._executar())
+        logging.info(f"Agendador assíncrono iniciado (até {self._num_workers} verificações simultâneas)")
+
+    def parar(self, timeout=None):
+        """
+        Cancela a tarefa do agendador e espera as verificações no executor
+
+        Chamar fora do loop (ex.: de uma thread do executor): a espera
+        depende do loop para concluir as verificações.
+
+        Returns:
+            bool: False se alguma verificação ainda rodava ao fim do timeout
+        """
+        if self._tarefa is not None:
+            self._loop.call_soon_threadsafe(self._tarefa.cancel)
+            self._tarefa = None
+        return self._aguardar_ociosos(timeout)
+
+    async def _executar(self):
+        while True:
+            self._acordar.clear()
+            await self._semaforo.acquire()
+            with self._cond:
+                chave, espera = self._retirar_vencida()
+
+            if chave is not None:
+                self._loop.create_task(self._rodar(chave))
+                continue
+
+            self._semaforo.release()
+            try:
+                await asyncio.wait_for(self._acordar.wait(), espera)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _rodar(self, chave):
+        proximo_atraso = None
+        try:
+            proximo_atraso = await self._loop.run_in_executor(self._executor, self._verificar, chave)
+        except Exception:
+            logging.error(f"Erro na verificação agendada de {chave}", exc_info=True)
+        finally:
+            self._semaforo.release()
+            self._concluir(chave, proximo_atraso)
@@ -0,0 +1,366 @@
+"""
+Benchmark do fluxo de pagamento sem credenciais: python benchmark.py
+
+Substitui o SDK do Mercado Pago e a API do Telegram por versões falsas em
+memória (com latência, taxa de erro e tempo até o pagamento configuráveis)
+e leva N usuários simulados do /pagar até a aprovação, usando o mesmo
+main.py de produção: agendador, política de verificação, persistência e
+fila de envio reais.
+
+Ao final mostra vazão, p50/p99 do tempo até a aprovação, chamadas ao
+Mercado Pago por pagamento aprovado, pico de threads e pico de memória.
+
+Exemplos:
+    python benchmark.py --usuarios 1000 --chegada 50
+    python benchmark.py --modo lote --latencia-mp 0.2 --erro-mp 0.05
+"""
+import argparse
+import datetime
+import itertools
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DIRETORIO_BOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def _esperar(latencia):
+    if latencia > 0:
+        time.sleep(random.uniform(0.5, 1.5) * latencia)
+
+
+class MercadoPagoFalso:
+    """
+    Stand-in do `mercadopago.SDK` com a API de pagamentos em memória
+
+    Cada pagamento criado é "pago" pelo usuário simulado depois de um tempo
+    sorteado entre `pagamento_min` e `pagamento_max` segundos, exceto uma
+    fração `abandono` que nunca paga. Chamadas falham (ConnectionError,
+    como um timeout da sessão HTTP) com probabilidade `erro`.
+    """
+
+    def __init__(self, latencia=0.05, erro=0.0, pagamento_min=1.0, pagamento_max=5.0, abandono=0.0):
+        self.latencia = latencia
+        self.erro = erro
+        self.pagamento_min = pagamento_min
+        self.pagamento_max = pagamento_max
+        self.abandono = abandono
+        self._ids = itertools.count(10**10)
+        self._pagamentos = {}  # id -> {'criado', 'pago_em', 'date_created'}
+        self._lock = threading.Lock()
+        self.chamadas = {'create': 0, 'get': 0, 'search': 0}
+        self.erros = 0
+
+    def payment(self):
+        return self
+
+    def _chamada(self, operacao):
+        with self._lock:
+            self.chamadas[operacao] += 1
+        _esperar(self.latencia)
+        if random.random() < self.erro:
+            with self._lock:
+                self.erros += 1
+            raise ConnectionError(f"Falha simulada no {operacao}")
+
+    def _status(self, pagamento):
+        if pagamento['pago_em'] is not None and time.monotonic() >= pagamento['pago_em']:
+            return 'approved'
+        return 'pending'
+
+    def pagantes(self):
+        """Quantos pagamentos criados serão pagos (os demais foram abandonados)"""
+        with self._lock:
+            return sum(1 for pagamento in self._pagamentos.values() if pagamento['pago_em'] is not None)
+
+    def create(self, dados):
+        self._chamada('create')
+        agora = time.monotonic()
+        pago_em = None
+        if random.random() >= self.abandono:
+            pago_em = agora + random.uniform(self.pagamento_min, self.pagamento_max)
+        with self._lock:
+            payment_id = next(self._ids)
+            self._pagamentos[payment_id] = {
+                'criado': agora,
+                'pago_em': pago_em,
+                'date_created': datetime.datetime.now().astimezone(),
+            }
+        return {
+            'status': 201,
+            'response': {
+                'id': payment_id,
+                'status': 'pending',
+                'transaction_amount': dados['transaction_amount'],
+                'point_of_interaction': {
+                    'transaction_data': {
+                        'qr_code': f"00020126BENCH{payment_id}",
+                        'qr_code_base64': "",
+                    }
+                },
+            },
+        }
+
+    def get(self, payment_id):
+        self._chamada('get')
+        pagamento = self._pagamentos.get(int(payment_id))
+        if pagamento is None:
+            return {'status': 404, 'response': {'message': 'Payment not found'}}
+        return {'status': 200, 'response': {'id': int(payment_id), 'status': self._status(pagamento)}}
+
+    def search(self, filtros):
+        self._chamada('search')
+        desde = datetime.datetime.fromisoformat(filtros['begin_date'])
+        with self._lock:
+            encontrados = [
+                {'id': payment_id, 'status': self._status(pagamento)}
+                for payment_id, pagamento in self._pagamentos.items()
+                if pagamento['date_created'] >= desde
+            ]
+        offset = filtros.get('offset', 0)
+        limite = filtros.get('limit', 30)
+        return {
+            'status': 200,
+            'response': {
+                'results': encontrados[offset:offset + limite],
+                'paging': {'total': len(encontrados), 'offset': offset, 'limit': limite},
+            },
+        }
+
+
+class TelegramFalso:
+    """
+    Stand-in dos métodos da API do Telegram usados pelo bot
+
+    Registra quando cada usuário foi aprovado no grupo, que é o fim do
+    fluxo medido. Só `send_message` sofre a taxa de erro, para exercitar
+    as novas tentativas da fila de envio.
+    """
+
+    def __init__(self, latencia=0.03, erro=0.0):
+        self.latencia = latencia
+        self.erro = erro
+        self.enviadas = 0
+        self.aprovados = {}  # user_id -> time.monotonic() da aprovação
+        self._lock = threading.Lock()
+        self.todos_aprovados = threading.Event()
+        self.esperados = None  # definido quando todos os /pagar terminam
+
+    def send_message(self, chat_id, texto, **kwargs):
+        _esperar(self.latencia)
+        if random.random() < self.erro:
+            raise ConnectionError("Falha simulada no sendMessage")
+        with self._lock:
+            self.enviadas += 1
+
+    def approve_chat_join_request(self, chat_id, user_id):
+        _esperar(self.latencia)
+        with self._lock:
+            self.aprovados.setdefault(user_id, time.monotonic())
+            if self.esperados is not None and len(self.aprovados) >= self.esperados:
+                self.todos_aprovados.set()
+        return True
+
+
+class _AmostradorThreads(threading.Thread):
+    """Acompanha o pico de threads vivas durante a execução"""
+
+    def __init__(self, intervalo=0.05):
+        super().__init__(name="amostrador", daemon=True)
+        self.intervalo = intervalo
+        self.pico = threading.active_count()
+        self._parar = threading.Event()
+
+    def run(self):
+        while not self._parar.wait(self.intervalo):
+            self.pico = max(self.pico, threading.active_count())
+
+    def parar(self):
+        self._parar.set()
+        self.join()
+
+
+def _pico_rss_mb():
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KB; macOS em bytes
+    return pico / (1024 * 1024) if sys.platform == "darwin" else pico / 1024
+
+
+def _percentil(valores, p):
+    if not valores:
+        return float("nan")
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(p * len(ordenados)))]
+
+
+def _argumentos():
+    parser = argparse.ArgumentParser(description="Benchmark do fluxo /pagar -> aprovação com stand-ins locais")
+    parser.add_argument("--usuarios", type=int, default=200, help="usuários simulados (padrão: 200)")
+    parser.add_argument("--chegada", type=float, default=50.0, help="/pagar por segundo (padrão: 50)")
+    parser.add_argument("--handlers", type=int, default=2,
+                        help="threads que executam os handlers, como no TeleBot (padrão: 2)")
+    parser.add_argument("--modo", choices=["individual", "lote"], default="individual",
+                        help="MODO_VERIFICACAO (padrão: individual)")
+    parser.add_argument("--politica", default="adaptativa", help="POLITICA_VERIFICACAO (padrão: adaptativa)")
+    parser.add_argument("--escala", type=float, default=0.01,
+                        help="fator aplicado aos intervalos de verificação (padrão: 0.01, 10s vira 0.1s)")
+    parser.add_argument("--latencia-mp", type=float, default=0.05, help="latência média do Mercado Pago (s)")
+    parser.add_argument("--erro-mp", type=float, default=0.0, help="fração de chamadas ao Mercado Pago que falham")
+    parser.add_argument("--pagamento-min", type=float, default=0.5, help="tempo mínimo até o usuário pagar (s)")
+    parser.add_argument("--pagamento-max", type=float, default=5.0, help="tempo máximo até o usuário pagar (s)")
+    parser.add_argument("--abandono", type=float, default=0.0, help="fração de usuários que nunca paga")
+    parser.add_argument("--latencia-telegram", type=float, default=0.03, help="latência média do Telegram (s)")
+    parser.add_argument("--erro-telegram", type=float, default=0.0, help="fração de envios ao Telegram que falham")
+    parser.add_argument("--limite", type=float, default=120.0, help="tempo máximo de execução (s)")
+    parser.add_argument("--semente", type=int, default=None, help="semente do sorteio, para repetir uma execução")
+    return parser.parse_args()
+
+
+def _preparar_ambiente(args):
+    """Configura o bot por variáveis de ambiente"""
+    os.environ.update(
+        TELEGRAM_TOKEN="123456:benchmark",
+        MERCADOPAGO_ACCESS_TOKEN="TEST-benchmark",
+        PUBLIC_KEY="TEST-benchmark",
+        MY_CHAT_ID="1",
+        GROUP_CHAT_ID="-1001",
+        GROUP_INVITE_LINK="https://t.me/+benchmark",
+        MODO_VERIFICACAO=args.modo,
+        POLITICA_VERIFICACAO=args.politica,
+        MP_WEBHOOK_ATIVO="false",
+        MP_WEBHOOK_URL="",
+        MODO_TELEGRAM="polling",
+        METRICAS_ATIVO="false",
+        # As aprovações no grupo vão ao Telegram falso: sem limite de taxa real a respeitar
+        GRUPO_TAXA="1000",
+    )
+    sys.path.insert(0, DIRETORIO_BOT)
+
+
+def executar(args):
+    if args.semente is not None:
+        random.seed(args.semente)
+    _preparar_ambiente(args)
+
+    # pendentes.db/pendentes.json do benchmark não se misturam com os reais
+    anterior = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="bench-bot-") as diretorio:
+        os.chdir(diretorio)
+        try:
+            return _simular(args)
+        finally:
+            os.chdir(anterior)
+
+
+def _simular(args):
+    import main
+    from politica_verificacao import criar_politica
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    mp = MercadoPagoFalso(args.latencia_mp, args.erro_mp, args.pagamento_min, args.pagamento_max, args.abandono)
+    telegram = TelegramFalso(args.latencia_telegram, args.erro_telegram)
+    main.config.get_mercadopago_sdk = lambda: mp
+    main.bot.send_message = telegram.send_message
+    main.bot.approve_chat_join_request = telegram.approve_chat_join_request
+
+    # Comprime a escala de tempo da verificação para caber em segundos
+    parametros = {
+        chave: valor * args.escala if chave != 'crescimento' else valor
+        for chave, valor in main.config.PARAMETROS_POLITICA.items()
+    }
+    main.politica = criar_politica(args.politica, **parametros)
+    main.INTERVALO_APOS_ERRO = main.INTERVALO_APOS_ERRO * args.escala
+    main.config.INTERVALO_CONCILIACAO = main.config.INTERVALO_CONCILIACAO * args.escala
+
+    amostrador = _AmostradorThreads()
+    amostrador.start()
+
+    main.retomar_pendentes()
+    main.enviador.iniciar()
+    main.fila_grupo.iniciar()
+    main.agendador.iniciar()
+    main.roda_expiracao.iniciar()
+
+    usuarios = [100000 + i for i in range(args.usuarios)]
+    pagar_em = {}
+    handlers = ThreadPoolExecutor(max_workers=args.handlers, thread_name_prefix="handler")
+
+    def pagar(user_id):
+        main.cmd_pagar(SimpleNamespace(
+            text="/pagar",
+            from_user=SimpleNamespace(id=user_id, username=f"bench{user_id}"),
+            chat=SimpleNamespace(id=user_id),
+        ))
+
+    inicio = time.monotonic()
+    for i, user_id in enumerate(usuarios):
+        espera = inicio + i / args.chegada - time.monotonic()
+        if espera > 0:
+            time.sleep(espera)
+        # Conta a partir do envio do /pagar, incluindo a espera por um handler livre
+        pagar_em[user_id] = time.monotonic()
+        handlers.submit(pagar, user_id)
+    handlers.shutdown(wait=True)
+
+    # Só quem conseguiu criar o PIX e não abandonou pode ser aprovado
+    pagantes = mp.pagantes()
+    with telegram._lock:
+        telegram.esperados = pagantes
+        if len(telegram.aprovados) >= pagantes:
+            telegram.todos_aprovados.set()
+    telegram.todos_aprovados.wait(max(0.0, inicio + args.limite - time.monotonic()))
+    fim = time.monotonic()
+
+    main.enviador.aguardar_vazio(timeout=5)
+    main.agendador.parar()
+    main.fila_grupo.parar()
+    main.enviador.parar()
+    amostrador.parar()
+
+    return _relatorio(args, main, mp, telegram, pagar_em, inicio, fim, pagantes, amostrador.pico)
+
+
+def _relatorio(args, main, mp, telegram, pagar_em, inicio, fim, pagantes, pico_threads):
+    aprovados = dict(telegram.aprovados)
+    ate_aprovacao = [momento - pagar_em[user_id] for user_id, momento in aprovados.items()]
+    duracao = fim - inicio
+    chamadas = sum(mp.chamadas.values())
+    criados = main.metricas.pagamentos.valor(resultado="criado")
+    rss = _pico_rss_mb()
+
+    linhas = [
+        "=" * 60,
+        f"Benchmark: {args.usuarios} usuários, {args.chegada:g}/s, modo {args.modo}, política {args.politica}",
+        "=" * 60,
+        f"PIX criados:            {criados} de {args.usuarios} ({args.usuarios - criados} falharam)",
+        f"Aprovados:              {len(aprovados)} de {pagantes} que pagaram"
+        + ("" if len(aprovados) >= pagantes else " (limite de tempo atingido)"),
+        f"Duração:                {duracao:.2f}s",
+        f"Vazão:                  {len(aprovados) / duracao:.1f} aprovações/s",
+        f"Tempo até aprovação:    p50 {_percentil(ate_aprovacao, 0.5):.2f}s, p99 {_percentil(ate_aprovacao, 0.99):.2f}s",
+        f"Chamadas ao MP:         {chamadas} (create {mp.chamadas['create']}, get {mp.chamadas['get']}, "
+        f"search {mp.chamadas['search']}; {mp.erros} com erro)",
+        f"Chamadas por aprovação: {chamadas / len(aprovados):.2f}" if aprovados else "Chamadas por aprovação: n/d",
+        f"Mensagens enviadas:     {telegram.enviadas} ({main.enviador.estatisticas()['agrupadas']} agrupadas)",
+        f"Pico de threads:        {pico_threads}",
+        f"Pico de memória (RSS):  {f'{rss:.1f} MB' if rss is not None else 'n/d'}",
+    ]
+    return "\n".join(linhas)
+
+
+if __name__ == "__main__":
+    print(executar(_argumentos()))
@@ -0,0 +1,129 @@
+"""
+Benchmark de memória dos pendentes: python benchmark_memoria.py
+
+Compara o formato antigo ({payment_id: dict}) com o registro Pendente
+(__slots__, ids int e momentos epoch) em dois pontos:
+
+- memória por pendente, medida com tracemalloc ao montar o dicionário
+  (o texto do QR é o mesmo objeto em todos, para medir só a estrutura);
+- tempo para carregar os pendentes de um banco SQLite com N registros
+  (armazenamento sozinho, como antes, e RegistroPendentes.carregar;
+  melhor de 3 execuções).
+
+Exemplos:
+    python benchmark_memoria.py
+    python benchmark_memoria.py --tamanhos 10000 100000
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+DIRETORIO_BOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, DIRETORIO_BOT)
+
+from persistencia import ArmazenamentoSqlite  # noqa: E402
+from registro import Pendente, RegistroPendentes  # noqa: E402
+
+# Código PIX de tamanho realista, compartilhado por todos os pendentes
+QR_CODE = "00020126580014br.gov.bcb.pix0136" + "0" * 150
+
+VALIDADE = 24 * 3600
+
+
+def _dados(i, agora):
+    """Formato gravado no armazenamento (e mantido em memória antes do Pendente)"""
+    return {
+        'user_id': 100000 + i,
+        'chat_id': 100000 + i,
+        'valor': 25,
+        'criado_em': agora - i,
+        'expira_em': agora - i + VALIDADE,
+        'qr_code': QR_CODE,
+    }
+
+
+def _memoria(montar):
+    """Bytes alocados (e mantidos) por `montar()`"""
+    gc.collect()
+    tracemalloc.start()
+    antes = tracemalloc.get_traced_memory()[0]
+    resultado = montar()
+    depois = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del resultado
+    gc.collect()
+    return depois - antes
+
+
+def _medir_memoria(n):
+    agora = time.time()
+    dicts = _memoria(lambda: {str(10**10 + i): _dados(i, agora) for i in range(n)})
+    slots = _memoria(lambda: {
+        10**10 + i: Pendente(10**10 + i, 100000 + i, 100000 + i, 25, agora - i, agora - i + VALIDADE, QR_CODE)
+        for i in range(n)
+    })
+    return dicts / n, slots / n
+
+
+def _melhor_tempo(funcao, repeticoes=3):
+    """Menor duração entre algumas execuções (a primeira paga cache frio e alocação de memória)"""
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        gc.collect()
+        inicio = time.perf_counter()
+        resultado = funcao()
+        melhor = min(melhor, time.perf_counter() - inicio)
+        del resultado
+    return melhor
+
+
+def _medir_carga(n, diretorio):
+    """Grava n pendentes em um banco novo e mede o tempo de carregá-los"""
+    caminho = os.path.join(diretorio, f"pendentes-{n}.db")
+    armazenamento = ArmazenamentoSqlite(caminho)
+    agora = time.time()
+    with armazenamento._transacao() as conexao:
+        conexao.executemany(
+            "INSERT INTO pendentes (payment_id, user_id, dados) VALUES (?, ?, ?)",
+            ((str(10**10 + i), 100000 + i, json.dumps(_dados(i, agora))) for i in range(n))
+        )
+    registro = RegistroPendentes(armazenamento)
+    so_armazenamento = _melhor_tempo(armazenamento.carregar)
+    com_registro = _melhor_tempo(registro.carregar)
+
+    armazenamento.fechar()
+    return so_armazenamento, com_registro
+
+
+def _argumentos():
+    parser = argparse.ArgumentParser(description="Memória e tempo de carga dos pendentes")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=[100000, 1000000],
+                        help="quantidades de pendentes (padrão: 100000 1000000)")
+    return parser.parse_args()
+
+
+def executar(args):
+    linhas = [
+        "=" * 72,
+        f"{'Pendentes':>10} | {'dict (B)':>9} | {'Pendente (B)':>12} | {'economia':>8} | {'carga SQLite':>12} | {'+ registro':>10}",
+        "=" * 72,
+    ]
+    with tempfile.TemporaryDirectory(prefix="bench-memoria-") as diretorio:
+        for n in args.tamanhos:
+            por_dict, por_slots = _medir_memoria(n)
+            so_armazenamento, com_registro = _medir_carga(n, diretorio)
+            linhas.append(
+                f"{n:>10} | {por_dict:>9.0f} | {por_slots:>12.0f} | {1 - por_slots / por_dict:>8.0%} | "
+                f"{so_armazenamento:>11.2f}s | {com_registro:>9.2f}s"
+            )
+    linhas.append("Memória por pendente sem o texto do QR (igual nos dois formatos).")
+    return "\n".join(linhas)
+
+
+if __name__ == "__main__":
+    print(executar(_argumentos()))
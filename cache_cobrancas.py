@@ -0,0 +1,69 @@
+import threading
+import time
+
+# Não reaproveita um PIX com menos tempo que isso até expirar (segundos)
+MARGEM_MINIMA = 15 * 60
+
+
+class CacheCobrancas:
+    """
+    Cache com TTL das cobranças PIX ainda válidas, por (user_id, valor)
+
+    Permite reenviar o mesmo código copia-e-cola quando o usuário repete o
+    /pagar, sem criar outro pagamento no Mercado Pago. Uma entrada sai do
+    cache quando o pagamento é resolvido ou quando a validade termina.
+    """
+
+    def __init__(self, margem_minima=MARGEM_MINIMA):
+        self._margem_minima = margem_minima
+        self._entradas = {}  # (user_id, valor) -> (payment_id, qr_code, expira_em)
+        self._chave_por_pagamento = {}  # payment_id -> (user_id, valor)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entradas)
+
+    def guardar(self, user_id, valor, payment_id, qr_code, expira_em):
+        with self._lock:
+            chave = (user_id, valor)
+            anterior = self._entradas.get(chave)
+            if anterior is not None:
+                self._chave_por_pagamento.pop(anterior[0], None)
+            self._entradas[chave] = (payment_id, qr_code, expira_em)
+            self._chave_por_pagamento[payment_id] = chave
+
+    def obter(self, user_id, valor):
+        """
+        Retorna a cobrança ainda válida do usuário para o valor
+
+        Returns:
+            tuple | None: (payment_id, qr_code, expira_em), ou None se não há
+            cobrança ou se ela expira dentro da margem mínima
+        """
+        with self._lock:
+            chave = (user_id, valor)
+            entrada = self._entradas.get(chave)
+            if entrada is None:
+                return None
+            if entrada[2] - time.time() < self._margem_minima:
+                del self._entradas[chave]
+                self._chave_por_pagamento.pop(entrada[0], None)
+                return None
+            return entrada
+
+    def descartar(self, payment_id):
+        """Remove a cobrança de um pagamento resolvido"""
+        with self._lock:
+            chave = self._chave_por_pagamento.pop(payment_id, None)
+            if chave is not None:
+                self._entradas.pop(chave, None)
+
+    def remover_expirados(self):
+        """Remove todas as cobranças vencidas; retorna quantas saíram"""
+        limite = time.time() + self._margem_minima
+        with self._lock:
+            vencidas = [chave for chave, entrada in self._entradas.items() if entrada[2] < limite]
+            for chave in vencidas:
+                payment_id = self._entradas.pop(chave)[0]
+                self._chave_por_pagamento.pop(payment_id, None)
+            return len(vencidas)
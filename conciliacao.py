@@ -0,0 +1,78 @@
+import logging
+
+import metricas
+
+# Limite de resultados por página aceito pela busca de pagamentos
+TAMANHO_PAGINA = 100
+
+
+def _formatar_data(momento):
+    """Formata um datetime no padrão aceito pelos filtros de data do Mercado Pago"""
+    if momento.tzinfo is None:
+        momento = momento.astimezone()
+    return momento.isoformat(timespec='milliseconds')
+
+
+def _buscar_pagina(sdk, filtros):
+    with metricas.chamada_mp("search"):
+        return sdk.payment().search(filtros)
+
+
+def consultar_status_em_lote(sdk, desde, tamanho_pagina=TAMANHO_PAGINA, disjuntor=None):
+    """
+    Busca de uma vez o status de todos os pagamentos criados a partir de `desde`
+
+    Usa `sdk.payment().search` com filtro por intervalo de `date_created`,
+    paginando até o total informado pela API. O custo é uma chamada por
+    página, e não uma por pagamento.
+
+    Args:
+        sdk: Instância do SDK do Mercado Pago
+        desde: datetime do pagamento pendente mais antigo
+        tamanho_pagina: Resultados por página
+        disjuntor: Se informado, cada página passa por ele (Disjuntor)
+
+    Returns:
+        dict: {payment_id (int): status}
+
+    Raises:
+        CircuitoAberto: Se o disjuntor recusou alguma página
+        Exception: Se alguma página vier com resposta inválida
+    """
+    filtros = {
+        'sort': 'date_created',
+        'criteria': 'asc',
+        'range': 'date_created',
+        'begin_date': _formatar_data(desde),
+        'end_date': 'NOW',
+        'payment_method_id': 'pix',
+        'limit': tamanho_pagina,
+    }
+
+    status_por_id = {}
+    offset = 0
+    paginas = 0
+    while True:
+        filtros['offset'] = offset
+        if disjuntor is not None:
+            resultado = disjuntor.chamar(_buscar_pagina, sdk, filtros)
+        else:
+            resultado = _buscar_pagina(sdk, filtros)
+        paginas += 1
+
+        if not resultado or resultado.get('status') != 200 or 'response' not in resultado:
+            raise Exception(f"Resposta inválida na busca de pagamentos: {resultado}")
+
+        resposta = resultado['response']
+        resultados = resposta.get('results') or []
+        for pagamento in resultados:
+            if pagamento.get('id') is not None:
+                status_por_id[int(pagamento['id'])] = pagamento.get('status')
+
+        total = resposta.get('paging', {}).get('total', 0)
+        offset += len(resultados)
+        if not resultados or offset >= total:
+            break
+
+    logging.debug("Conciliação: %d pagamentos em %d página(s)", len(status_por_id), paginas)
+    return status_por_id
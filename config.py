@@ -1,7 +1,17 @@
+import logging
 import os
+import socket
 import sys
+import threading
+import time
 from dotenv import load_dotenv
 import mercadopago
+from disjuntor import FECHADO, Disjuntor
+import requests
+from mercadopago.config import RequestOptions
+from mercadopago.http import HttpClient
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 
 # Carrega as variáveis de ambiente do arquivo .env (apenas se existir)
 if os.path.exists('.env'):
@@ -32,12 +42,229 @@ try:
 except (ValueError, TypeError):
     pass  # Será tratado na validação
 
+# ⏱️ Verificação de pagamentos
+VERIFICADOR_WORKERS = int(os.getenv("VERIFICADOR_WORKERS", "4"))
+# "individual": um GET por pagamento | "lote": busca paginada de todos os pendentes
+MODO_VERIFICACAO = os.getenv("MODO_VERIFICACAO", "individual").lower()
+INTERVALO_CONCILIACAO = float(os.getenv("INTERVALO_CONCILIACAO", "15"))
+# Retomada após restart: pendentes por lote e segundos entre lotes
+RECUPERACAO_LOTE = int(os.getenv("RECUPERACAO_LOTE", "50"))
+RECUPERACAO_INTERVALO = float(os.getenv("RECUPERACAO_INTERVALO", "2"))
+# Encerramento (SIGTERM/SIGINT): segundos para terminar o que está em andamento
+# antes de salvar o estado para o próximo processo (abaixo do prazo até o SIGKILL)
+ENCERRAMENTO_TIMEOUT = float(os.getenv("ENCERRAMENTO_TIMEOUT", "20"))
+# "adaptativa": densa no início e espaçada depois | "fixa": intervalo constante
+POLITICA_VERIFICACAO = os.getenv("POLITICA_VERIFICACAO", "adaptativa").lower()
+if POLITICA_VERIFICACAO == "fixa":
+    PARAMETROS_POLITICA = {
+        "intervalo": float(os.getenv("VERIFICACAO_INTERVALO", "10")),
+    }
+else:
+    PARAMETROS_POLITICA = {
+        "densa_por": float(os.getenv("VERIFICACAO_DENSA_POR", "300")),
+        "intervalo_denso": float(os.getenv("VERIFICACAO_INTERVALO_DENSO", "10")),
+        "crescimento": float(os.getenv("VERIFICACAO_CRESCIMENTO", "0.25")),
+        "intervalo_max": float(os.getenv("VERIFICACAO_INTERVALO_MAX", "1800")),
+    }
+
+# 📝 Logs: escritos por uma thread própria (quem loga só enfileira)
+LOG_FORMATO = os.getenv("LOG_FORMATO", "texto").lower()  # "texto" ou "json"
+LOG_NIVEL = (os.getenv("LOG_NIVEL") or "INFO").upper()
+LOG_AMOSTRAGEM_DEBUG = float(os.getenv("LOG_AMOSTRAGEM_DEBUG", "1"))
+LOG_FILA_MAX = int(os.getenv("LOG_FILA_MAX", "10000"))
+
+# 🔌 Conexões com a API do Mercado Pago
+MP_TIMEOUT_CONEXAO = float(os.getenv("MP_TIMEOUT_CONEXAO", "3"))
+MP_TIMEOUT_LEITURA = float(os.getenv("MP_TIMEOUT_LEITURA", "10"))
+MP_POOL_CONEXOES = int(os.getenv("MP_POOL_CONEXOES", "20"))
+MP_RETRIES = int(os.getenv("MP_RETRIES", "3"))
+
+# ⚡ Modo asyncio (main_async.py): threads do executor para chamadas bloqueantes
+ASYNC_EXECUTOR_WORKERS = int(os.getenv("ASYNC_EXECUTOR_WORKERS", "8"))
+
+# ⏰ Resolução (segundos) da roda que expira os pendentes cujo PIX venceu
+EXPIRACAO_RESOLUCAO = float(os.getenv("EXPIRACAO_RESOLUCAO", "1"))
+
+# 💾 Persistência dos pendentes: "sqlite" (incremental, WAL) ou "json" (arquivo único)
+PERSISTENCIA = os.getenv("PERSISTENCIA", "sqlite").lower()
+
+# 🧩 Várias instâncias do bot dividindo os pendentes pelo mesmo banco SQLite
+# (cada pendente tem um dono com lease; se uma instância morre, outra assume)
+MULTI_INSTANCIA = os.getenv("MULTI_INSTANCIA", "false").lower() == "true"
+INSTANCIA_ID = os.getenv("INSTANCIA_ID") or f"{socket.gethostname()}-{os.getpid()}"
+ARQUIVO_BANCO = os.getenv("ARQUIVO_BANCO", "pendentes.db")
+LEASE_DURACAO = float(os.getenv("LEASE_DURACAO", "60"))
+LEASE_INTERVALO = float(os.getenv("LEASE_INTERVALO", "15"))
+LEASE_LOTE = int(os.getenv("LEASE_LOTE", "500"))
+
+# 🌐 Servidor HTTP embutido (webhooks)
+HTTP_PORTA = int(os.getenv("PORT", "8080"))
+
+# 📊 Métricas no formato do Prometheus em GET /metrics (no servidor HTTP embutido)
+METRICAS_ATIVO = os.getenv("METRICAS_ATIVO", "false").lower() == "true"
+
+# 🩺 GET /health (o processo responde) e GET /ready (pronto para atender) no servidor HTTP embutido
+SAUDE_ATIVO = os.getenv("SAUDE_ATIVO", "false").lower() == "true"
+
+# 🔔 Webhook do Mercado Pago (com ele, o polling vira só uma rede de segurança)
+MP_WEBHOOK_ATIVO = os.getenv("MP_WEBHOOK_ATIVO", "false").lower() == "true"
+MP_WEBHOOK_SECRET = os.getenv("MP_WEBHOOK_SECRET")
+MP_WEBHOOK_URL = os.getenv("MP_WEBHOOK_URL")
+INTERVALO_VERIFICACAO_WEBHOOK = float(os.getenv("INTERVALO_VERIFICACAO_WEBHOOK", "300"))
+
+# 📨 Recebimento de updates do Telegram: "polling" (infinity_polling), "webhook"
+# ou "nenhum" (instância extra que só verifica pagamentos)
+MODO_TELEGRAM = os.getenv("MODO_TELEGRAM", "polling").lower()
+TELEGRAM_WEBHOOK_URL = os.getenv("TELEGRAM_WEBHOOK_URL")
+TELEGRAM_WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET")
+TELEGRAM_FILA_MAX = int(os.getenv("TELEGRAM_FILA_MAX", "1000"))
+TELEGRAM_WORKERS = int(os.getenv("TELEGRAM_WORKERS", "4"))
+
+# 🧵 Despacho dos updates para os handlers: updates de um usuário em ordem, com
+# workers separados para comandos rápidos e para os que chamam o Mercado Pago
+# (TELEGRAM_FILA_MAX limita os updates aguardando)
+DESPACHO_WORKERS_RAPIDOS = int(os.getenv("DESPACHO_WORKERS_RAPIDOS", "4"))
+DESPACHO_WORKERS_LENTOS = int(os.getenv("DESPACHO_WORKERS_LENTOS", "8"))
+DESPACHO_COMANDOS_LENTOS = [
+    comando.strip().lstrip("/") for comando in os.getenv("DESPACHO_COMANDOS_LENTOS", "pagar,limpar_pendentes").split(",")
+    if comando.strip()
+]
+
+# ✉️ Envio de mensagens: limites de taxa (mensagens/s) e workers da fila de envio
+TELEGRAM_TAXA_GLOBAL = float(os.getenv("TELEGRAM_TAXA_GLOBAL", "25"))
+TELEGRAM_TAXA_POR_CHAT = float(os.getenv("TELEGRAM_TAXA_POR_CHAT", "1"))
+TELEGRAM_ENVIO_WORKERS = int(os.getenv("TELEGRAM_ENVIO_WORKERS", "4"))
+
+# 🔥 Aquecimento do Mercado Pago: conexões abertas e métodos de pagamento em cache
+MP_CONEXOES_AQUECIDAS = int(os.getenv("MP_CONEXOES_AQUECIDAS", "2"))
+MP_METODOS_INTERVALO = float(os.getenv("MP_METODOS_INTERVALO", "3600"))
+
+# 🚦 Controle de admissão do /pagar: criações por minuto e rajada por usuário,
+# criações simultâneas no Mercado Pago e fila de espera (pedidos e segundos)
+ADMISSAO_POR_MINUTO = float(os.getenv("ADMISSAO_POR_MINUTO", "2"))
+ADMISSAO_RAJADA = int(os.getenv("ADMISSAO_RAJADA", "3"))
+ADMISSAO_SIMULTANEAS = int(os.getenv("ADMISSAO_SIMULTANEAS", "8"))
+ADMISSAO_FILA_MAX = int(os.getenv("ADMISSAO_FILA_MAX", "50"))
+ADMISSAO_ESPERA_MAX = float(os.getenv("ADMISSAO_ESPERA_MAX", "5"))
+
+# 👥 Aprovação das entradas no grupo: aprovações por segundo, concessões por lote
+# e tentativas antes de desistir e mandar o link de convite
+GRUPO_TAXA = float(os.getenv("GRUPO_TAXA", "5"))
+GRUPO_LOTE = int(os.getenv("GRUPO_LOTE", "50"))
+GRUPO_TENTATIVAS_MAX = int(os.getenv("GRUPO_TENTATIVAS_MAX", "8"))
+
+# 📊 Estatísticas de vendas do /stats: intervalo de gravação no banco (s) e fuso
+# horário (horas em relação ao UTC) que define a virada do dia
+ESTATISTICAS_INTERVALO = float(os.getenv("ESTATISTICAS_INTERVALO", "60"))
+ESTATISTICAS_FUSO_HORAS = float(os.getenv("ESTATISTICAS_FUSO_HORAS", "-3"))
+
+# ⚡ Disjuntor das chamadas ao Mercado Pago: abre com LIMITE_ERROS de falhas (ou 80% de
+# chamadas acima de CHAMADA_LENTA s) em JANELA s, e sonda a volta após TEMPO_ABERTO s
+DISJUNTOR_JANELA = int(os.getenv("DISJUNTOR_JANELA", "30"))
+DISJUNTOR_MIN_CHAMADAS = int(os.getenv("DISJUNTOR_MIN_CHAMADAS", "10"))
+DISJUNTOR_LIMITE_ERROS = float(os.getenv("DISJUNTOR_LIMITE_ERROS", "0.5"))
+DISJUNTOR_CHAMADA_LENTA = float(os.getenv("DISJUNTOR_CHAMADA_LENTA", "5"))
+DISJUNTOR_TEMPO_ABERTO = float(os.getenv("DISJUNTOR_TEMPO_ABERTO", "30"))
+DISJUNTOR_TEMPO_ABERTO_MAX = float(os.getenv("DISJUNTOR_TEMPO_ABERTO_MAX", "300"))
+# Pedidos de /pagar guardados para criar quando o Mercado Pago voltar
+REPROCESSO_FILA_MAX = int(os.getenv("REPROCESSO_FILA_MAX", "500"))
+
 # 💰 SDK do Mercado Pago - Lazy Loading
 _sdk = None
 _mp_inicializado = False
+_lock_sdk = threading.Lock()
+
+# Estado do aquecimento, lido por estado_mercadopago()
+_metodos_pagamento = None
+_saude_mp = {
+    'pronto': False,
+    'ultimo_sucesso': None,
+    'ultimo_erro': None,
+    'falhas_seguidas': 0,
+}
+_thread_aquecimento = None
+
+def _resposta_com_falha(resultado):
+    """Respostas do SDK que indicam o Mercado Pago fora do ar (uso interno)"""
+    status = resultado.get("status") if isinstance(resultado, dict) else None
+    return status is not None and (status >= 500 or status == 429)
+
+# Todas as chamadas ao Mercado Pago passam por este disjuntor
+disjuntor_mp = Disjuntor(
+    "mercadopago",
+    janela=DISJUNTOR_JANELA,
+    min_chamadas=DISJUNTOR_MIN_CHAMADAS,
+    limite_erros=DISJUNTOR_LIMITE_ERROS,
+    chamada_lenta=DISJUNTOR_CHAMADA_LENTA,
+    tempo_aberto=DISJUNTOR_TEMPO_ABERTO,
+    tempo_aberto_max=DISJUNTOR_TEMPO_ABERTO_MAX,
+    falha=_resposta_com_falha
+)
+
+class _ClienteHttpMercadoPago(HttpClient):
+    """
+    Cliente HTTP do SDK com uma sessão compartilhada (uso interno)
+
+    O HttpClient padrão abre uma sessão nova a cada chamada e usa timeout de
+    60s. Aqui a sessão é única, com keep-alive, pool limitado, timeouts de
+    conexão/leitura separados e retry com backoff aleatório só para GET
+    (idempotente). POSTs nunca são repetidos automaticamente.
+    """
+
+    def __init__(self):
+        retry_kwargs = dict(
+            total=MP_RETRIES,
+            connect=MP_RETRIES,
+            read=MP_RETRIES,
+            status=MP_RETRIES,
+            backoff_factor=0.3,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=frozenset(["GET"]),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        try:
+            retry = Retry(backoff_jitter=0.5, **retry_kwargs)
+        except TypeError:
+            # urllib3 < 2 não tem backoff_jitter
+            retry = Retry(**retry_kwargs)
+
+        adaptador = HTTPAdapter(
+            pool_connections=MP_POOL_CONEXOES,
+            pool_maxsize=MP_POOL_CONEXOES,
+            pool_block=True,
+            max_retries=retry,
+        )
+        self._sessao = requests.Session()
+        self._sessao.mount("https://", adaptador)
+        self._timeout = (MP_TIMEOUT_CONEXAO, MP_TIMEOUT_LEITURA)
+
+    def request(self, method, url, maxretries=None, **kwargs):
+        # Timeouts e retries vêm da sessão, não dos parâmetros do SDK
+        kwargs["timeout"] = self._timeout
+        api_result = self._sessao.request(method, url, **kwargs)
+        return {
+            "status": api_result.status_code,
+            "response": api_result.json()
+        }
+
+def _criar_sdk():
+    """Cria o SDK do Mercado Pago com o cliente HTTP compartilhado (uso interno)"""
+    opcoes = RequestOptions(connection_timeout=MP_TIMEOUT_LEITURA, max_retries=MP_RETRIES)
+    return mercadopago.SDK(
+        TOKEN_MERCADOPAGO,
+        http_client=_ClienteHttpMercadoPago(),
+        request_options=opcoes
+    )
 
 def _inicializar_mercadopago():
-    """Inicializa o SDK do Mercado Pago (uso interno)"""
+    """
+    Inicializa o SDK do Mercado Pago (uso interno)
+
+    Só monta o SDK, sem chamadas de rede: a primeira requisição de um
+    usuário não espera nenhuma ida ao Mercado Pago além da sua. A conexão
+    é testada em segundo plano por aquecer_mercadopago().
+    """
     global _sdk, _mp_inicializado
 
     if _mp_inicializado:
@@ -46,27 +273,124 @@ def _inicializar_mercadopago():
     if not TOKEN_MERCADOPAGO:
         return False
 
-    try:
-        # Inicializa o SDK
-        _sdk = mercadopago.SDK(TOKEN_MERCADOPAGO)
-
-        # Testa a conexão fazendo uma chamada simples
-        test_response = _sdk.payment_methods().list_all()
-
-        if test_response.get("status") == 200:
+    with _lock_sdk:
+        if _mp_inicializado:
+            return True
+        try:
+            _sdk = _criar_sdk()
             _mp_inicializado = True
             if DEBUG:
                 print("✅ SDK Mercado Pago inicializado com sucesso (lazy loading)")
             return True
-        else:
-            _mp_inicializado = True  # SDK criado, mas resposta não confirmada
+        except Exception as e:
+            if DEBUG:
+                print(f"❌ ERRO ao inicializar SDK Mercado Pago: {str(e)}")
+            return False
+
+def _atualizar_metodos_pagamento():
+    """
+    Consulta os métodos de pagamento e abre as conexões do pool (uso interno)
+
+    Faz MP_CONEXOES_AQUECIDAS consultas simultâneas: cada uma deixa uma
+    conexão keep-alive (TLS já negociado) no pool da sessão compartilhada.
+    """
+    global _metodos_pagamento
+    sdk = get_mercadopago_sdk()
+    respostas = [None] * max(1, MP_CONEXOES_AQUECIDAS)
+
+    def consultar(i):
+        try:
+            respostas[i] = disjuntor_mp.chamar(sdk.payment_methods().list_all)
+        except Exception as e:
+            respostas[i] = e
+
+    threads = [threading.Thread(target=consultar, args=(i,)) for i in range(len(respostas))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for resposta in respostas:
+        if isinstance(resposta, dict) and resposta.get("status") == 200:
+            _metodos_pagamento = {metodo.get("id"): metodo for metodo in resposta.get("response") or []}
+            _saude_mp.update(pronto=True, ultimo_sucesso=time.time(), ultimo_erro=None, falhas_seguidas=0)
             return True
 
-    except Exception as e:
-        if DEBUG:
-            print(f"❌ ERRO ao inicializar SDK Mercado Pago: {str(e)}")
-        _mp_inicializado = False
-        return False
+    erro = respostas[0]
+    if isinstance(erro, dict):
+        erro = f"HTTP {erro.get('status')}"
+    _saude_mp.update(ultimo_erro=str(erro), falhas_seguidas=_saude_mp['falhas_seguidas'] + 1)
+    return False
+
+def _loop_aquecimento(intervalo):
+    espera_erro = 5
+    while True:
+        try:
+            ok = _atualizar_metodos_pagamento()
+        except Exception as e:
+            _saude_mp.update(ultimo_erro=str(e), falhas_seguidas=_saude_mp['falhas_seguidas'] + 1)
+            ok = False
+
+        if ok:
+            logging.info(f"🔥 Mercado Pago pronto: {len(_metodos_pagamento)} métodos de pagamento em cache")
+            espera_erro = 5
+            time.sleep(intervalo)
+        else:
+            logging.warning(f"⚠️ Falha ao aquecer o Mercado Pago ({_saude_mp['ultimo_erro']}), nova tentativa em {espera_erro}s")
+            time.sleep(espera_erro)
+            espera_erro = min(espera_erro * 2, intervalo)
+
+def aquecer_mercadopago(intervalo=None):
+    """
+    Aquece o SDK do Mercado Pago em segundo plano (não bloqueia)
+
+    Monta o SDK, abre as conexões do pool e guarda os métodos de pagamento
+    em cache, atualizando-os a cada `intervalo` segundos (padrão:
+    MP_METODOS_INTERVALO). Falhas são repetidas com backoff e aparecem em
+    estado_mercadopago().
+    """
+    global _thread_aquecimento
+    if _thread_aquecimento is not None or not TOKEN_MERCADOPAGO:
+        return
+    _thread_aquecimento = threading.Thread(
+        target=_loop_aquecimento,
+        args=(intervalo or MP_METODOS_INTERVALO,),
+        name="aquecimento-mp",
+        daemon=True
+    )
+    _thread_aquecimento.start()
+
+def metodo_pagamento(metodo_id):
+    """
+    Retorna os metadados em cache de um método de pagamento (ex.: "pix")
+
+    Returns:
+        dict | None: None se o cache ainda não foi carregado ou o método não existe
+    """
+    if _metodos_pagamento is None:
+        return None
+    return _metodos_pagamento.get(metodo_id)
+
+def estado_mercadopago():
+    """
+    Estado de prontidão e saúde da integração com o Mercado Pago
+
+    Returns:
+        dict: pronto (aquecimento concluído ao menos uma vez), saudavel
+        (última atualização deu certo e o disjuntor está fechado), ultimo_sucesso
+        (epoch), ultimo_erro, falhas_seguidas, metodos (quantos em cache) e
+        circuito (estado do disjuntor)
+    """
+    circuito = disjuntor_mp.estado
+    return {
+        'pronto': _saude_mp['pronto'],
+        'saudavel': _saude_mp['pronto'] and _saude_mp['falhas_seguidas'] == 0 and circuito == FECHADO,
+        'circuito': circuito,
+        'ultimo_sucesso': _saude_mp['ultimo_sucesso'],
+        'ultimo_erro': _saude_mp['ultimo_erro'],
+        'falhas_seguidas': _saude_mp['falhas_seguidas'],
+        'metodos': len(_metodos_pagamento) if _metodos_pagamento is not None else 0,
+    }
 
 def validar_config(silencioso=False):
     """
@@ -186,10 +510,77 @@ __all__ = [
     'GROUP_INVITE_LINK',
     'GROUP_CHAT_ID',
     'get_mercadopago_sdk',
+    'aquecer_mercadopago',
+    'metodo_pagamento',
+    'estado_mercadopago',
+    'MP_CONEXOES_AQUECIDAS',
+    'MP_METODOS_INTERVALO',
+    'ADMISSAO_POR_MINUTO',
+    'ADMISSAO_RAJADA',
+    'ADMISSAO_SIMULTANEAS',
+    'ADMISSAO_FILA_MAX',
+    'ADMISSAO_ESPERA_MAX',
+    'GRUPO_TAXA',
+    'GRUPO_LOTE',
+    'GRUPO_TENTATIVAS_MAX',
+    'ESTATISTICAS_INTERVALO',
+    'ESTATISTICAS_FUSO_HORAS',
+    'DISJUNTOR_JANELA',
+    'DISJUNTOR_MIN_CHAMADAS',
+    'DISJUNTOR_LIMITE_ERROS',
+    'DISJUNTOR_CHAMADA_LENTA',
+    'DISJUNTOR_TEMPO_ABERTO',
+    'DISJUNTOR_TEMPO_ABERTO_MAX',
+    'REPROCESSO_FILA_MAX',
+    'disjuntor_mp',
     'sdk_disponivel',
     'validar_config',
     'DEBUG',
-    'AMBIENTE'
+    'LOG_FORMATO',
+    'LOG_NIVEL',
+    'LOG_AMOSTRAGEM_DEBUG',
+    'LOG_FILA_MAX',
+    'mascara_token',
+    'AMBIENTE',
+    'VERIFICADOR_WORKERS',
+    'MODO_VERIFICACAO',
+    'INTERVALO_CONCILIACAO',
+    'RECUPERACAO_LOTE',
+    'RECUPERACAO_INTERVALO',
+    'ENCERRAMENTO_TIMEOUT',
+    'POLITICA_VERIFICACAO',
+    'PARAMETROS_POLITICA',
+    'ASYNC_EXECUTOR_WORKERS',
+    'EXPIRACAO_RESOLUCAO',
+    'PERSISTENCIA',
+    'MULTI_INSTANCIA',
+    'INSTANCIA_ID',
+    'ARQUIVO_BANCO',
+    'LEASE_DURACAO',
+    'LEASE_INTERVALO',
+    'LEASE_LOTE',
+    'MP_TIMEOUT_CONEXAO',
+    'MP_TIMEOUT_LEITURA',
+    'MP_POOL_CONEXOES',
+    'MP_RETRIES',
+    'HTTP_PORTA',
+    'METRICAS_ATIVO',
+    'SAUDE_ATIVO',
+    'MP_WEBHOOK_ATIVO',
+    'MP_WEBHOOK_SECRET',
+    'MP_WEBHOOK_URL',
+    'INTERVALO_VERIFICACAO_WEBHOOK',
+    'MODO_TELEGRAM',
+    'TELEGRAM_WEBHOOK_URL',
+    'TELEGRAM_WEBHOOK_SECRET',
+    'TELEGRAM_FILA_MAX',
+    'TELEGRAM_WORKERS',
+    'DESPACHO_WORKERS_RAPIDOS',
+    'DESPACHO_WORKERS_LENTOS',
+    'DESPACHO_COMANDOS_LENTOS',
+    'TELEGRAM_TAXA_GLOBAL',
+    'TELEGRAM_TAXA_POR_CHAT',
+    'TELEGRAM_ENVIO_WORKERS'
 ]
 
 # ============================================================
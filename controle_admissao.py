@@ -0,0 +1,119 @@
+import threading
+import time
+from collections import deque
+
+import metricas
+from limites import BaldeTokens
+
+# Intervalo da limpeza de baldes de usuários ociosos (segundos)
+INTERVALO_LIMPEZA = 60
+
+# Motivos de recusa retornados por ControleAdmissao.entrar
+RECUSA_USUARIO = "usuario"
+RECUSA_LOTADO = "lotado"
+
+
+class ControleAdmissao:
+    """
+    Controle de admissão das criações de pagamento no Mercado Pago
+
+    Três limites, verificados nesta ordem:
+    - um balde de tokens por usuário (`taxa_por_usuario` criações por
+      segundo, com rajada de `rajada_por_usuario`);
+    - no máximo `max_simultaneas` criações em andamento no processo;
+    - uma fila de espera de até `max_fila` pedidos, atendida em ordem de
+      chegada, em que cada pedido espera no máximo `espera_max` segundos.
+
+    Com a fila cheia (ou a espera esgotada) o pedido é recusado na hora,
+    para que o usuário receba uma resposta rápida em vez de ficar sem
+    retorno durante um pico.
+    """
+
+    def __init__(self, taxa_por_usuario, rajada_por_usuario=1, max_simultaneas=8, max_fila=50, espera_max=5.0):
+        self._taxa_por_usuario = taxa_por_usuario
+        self._rajada_por_usuario = rajada_por_usuario
+        self.max_simultaneas = max(1, int(max_simultaneas))
+        self.max_fila = max(0, int(max_fila))
+        self.espera_max = espera_max
+        self._baldes = {}  # user_id -> BaldeTokens
+        self._fila = deque()  # threading.Event de cada pedido esperando vaga
+        self._em_andamento = 0
+        self._lock = threading.Lock()
+        self._ultima_limpeza = time.monotonic()
+
+    def _balde(self, user_id):
+        with self._lock:
+            balde = self._baldes.get(user_id)
+            if balde is None:
+                balde = BaldeTokens(self._taxa_por_usuario, self._rajada_por_usuario)
+                self._baldes[user_id] = balde
+            self._limpar_ociosos()
+            return balde
+
+    def _limpar_ociosos(self):
+        agora = time.monotonic()
+        if agora - self._ultima_limpeza < INTERVALO_LIMPEZA:
+            return
+        self._ultima_limpeza = agora
+        for user_id in [user_id for user_id, balde in self._baldes.items() if balde.cheio()]:
+            del self._baldes[user_id]
+
+    def entrar(self, user_id):
+        """
+        Pede uma vaga para criar um pagamento do usuário
+
+        Bloqueia no máximo `espera_max` segundos. Quando admitido, o chamador
+        deve chamar `sair()` ao fim da criação, com ou sem sucesso.
+
+        Returns:
+            tuple | None: None se admitido; senão (motivo, segundos até poder
+            tentar de novo), com motivo RECUSA_USUARIO ou RECUSA_LOTADO
+        """
+        balde = self._balde(user_id)
+        espera = balde.consumir()
+        if espera > 0:
+            metricas.admissao.inc(resultado="limite_usuario")
+            return RECUSA_USUARIO, espera
+
+        with self._lock:
+            if self._em_andamento < self.max_simultaneas and not self._fila:
+                self._em_andamento += 1
+                metricas.admissao.inc(resultado="admitido")
+                return None
+            if len(self._fila) >= self.max_fila:
+                balde.devolver()
+                metricas.admissao.inc(resultado="fila_cheia")
+                return RECUSA_LOTADO, self.espera_max
+            vez = threading.Event()
+            self._fila.append(vez)
+
+        inicio = time.monotonic()
+        vez.wait(self.espera_max)
+        with self._lock:
+            # A vaga é passada sob o lock em sair(): se o evento não foi marcado, o pedido ainda está na fila
+            if not vez.is_set():
+                self._fila.remove(vez)
+        metricas.espera_admissao.observar(time.monotonic() - inicio)
+        if vez.is_set():
+            metricas.admissao.inc(resultado="admitido")
+            return None
+        balde.devolver()
+        metricas.admissao.inc(resultado="espera_esgotada")
+        return RECUSA_LOTADO, self.espera_max
+
+    def sair(self):
+        """Libera a vaga de uma criação admitida, passando-a ao primeiro da fila"""
+        with self._lock:
+            if self._fila:
+                self._fila.popleft().set()
+            else:
+                self._em_andamento -= 1
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                'em_andamento': self._em_andamento,
+                'fila': len(self._fila),
+                'usuarios': len(self._baldes),
+                'max_simultaneas': self.max_simultaneas,
+            }
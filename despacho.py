@@ -0,0 +1,213 @@
+import logging
+import threading
+import time
+from collections import deque
+
+from telebot import util
+
+import metricas
+
+# Faixas de workers: comandos que só leem memória e comandos que chamam o Mercado Pago
+FAIXA_RAPIDA = "rapida"
+FAIXA_LENTA = "lenta"
+
+# Tipos de update que trazem o usuário em `from_user`
+_CAMPOS_USUARIO = ("message", "edited_message", "callback_query", "chat_join_request",
+                   "my_chat_member", "chat_member", "inline_query", "pre_checkout_query")
+
+
+def _chave_usuario(update):
+    """Usuário que originou o update, ou o próprio update se não houver um"""
+    for campo in _CAMPOS_USUARIO:
+        objeto = getattr(update, campo, None)
+        usuario = getattr(objeto, "from_user", None) if objeto is not None else None
+        if usuario is not None:
+            return usuario.id
+    return ("update", update.update_id)
+
+
+def _comando(update):
+    mensagem = getattr(update, "message", None)
+    if mensagem is None or not mensagem.text:
+        return None
+    return util.extract_command(mensagem.text)
+
+
+class DespachanteUpdates:
+    """
+    Despacho dos updates do Telegram para os handlers do bot
+
+    Fica entre o recebimento (polling ou webhook) e `bot.process_new_updates`.
+    Cada usuário tem no máximo um update em execução: os seguintes esperam
+    na fila dele e saem na ordem de chegada, então dois /pagar do mesmo
+    usuário nunca correm em paralelo. Usuários diferentes não esperam uns
+    pelos outros.
+
+    Os comandos em `comandos_lentos` (bloqueiam no Mercado Pago) rodam em
+    `workers_lentos` threads; o resto em `workers_rapidos`, para que um
+    pico de /pagar não atrase /start e /status. No máximo `tamanho_fila`
+    updates ficam aguardando. Pelo webhook, os seguintes são recusados (o
+    Telegram reenvia); no polling, `receber` espera abrir espaço, e o
+    polling só busca mais updates depois disso.
+
+    Cada update entregue conta como recebido pelo bot (`last_update_id`),
+    então o polling não o busca de novo enquanto ele espera na fila.
+    `parar` deixa de aceitar updates e espera a fila esvaziar.
+    """
+
+    def __init__(self, bot, comandos_lentos=("pagar",), workers_rapidos=4, workers_lentos=8, tamanho_fila=1000):
+        self._bot = bot
+        self._processar_original = bot.process_new_updates
+        self.comandos_lentos = frozenset(comandos_lentos)
+        self._workers = {FAIXA_RAPIDA: max(1, int(workers_rapidos)), FAIXA_LENTA: max(1, int(workers_lentos))}
+        self.tamanho_fila = max(1, int(tamanho_fila))
+        self._lock = threading.Lock()
+        self._prontos = {faixa: deque() for faixa in self._workers}  # (chave, update, faixa, chegada)
+        self._conds = {faixa: threading.Condition(self._lock) for faixa in self._workers}
+        self._vazio = threading.Condition(self._lock)
+        self._espaco = threading.Condition(self._lock)
+        self._por_usuario = {}  # chave -> deque dos updates esperando o que está em execução
+        self._abertos = set()  # update_id dos aceitos e ainda não concluídos
+        self._aceitando = True
+        self._total = 0
+        self._em_execucao = 0
+        self._threads = []
+        self.recebidos = 0
+        self.recusados = 0
+
+    def iniciar(self):
+        """Inicia os workers e passa a receber os updates entregues ao bot"""
+        if self._threads:
+            return
+        self._bot.process_new_updates = self.receber
+        for faixa, workers in self._workers.items():
+            for i in range(workers):
+                thread = threading.Thread(target=self._loop, args=(faixa,), name=f"handler-{faixa}-{i}")
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+        logging.info(f"Despacho de updates: {self._workers[FAIXA_RAPIDA]} workers rápidos, "
+                     f"{self._workers[FAIXA_LENTA]} lentos ({', '.join(sorted(self.comandos_lentos))})")
+
+    def faixa(self, update):
+        return FAIXA_LENTA if _comando(update) in self.comandos_lentos else FAIXA_RAPIDA
+
+    def receber(self, updates):
+        """
+        Substitui `bot.process_new_updates`: enfileira cada update
+
+        Chamado pelo polling. Com a fila cheia, espera abrir espaço. Se o
+        despacho parar antes disso, o update e os seguintes do lote não contam
+        como recebidos: o próximo get_updates (ou o próximo processo) os busca
+        de novo.
+        """
+        for update in updates:
+            if not self.enviar(update, bloquear=True):
+                logging.warning(f"Despacho parado, update {update.update_id} e seguintes ficam no Telegram")
+                return
+
+    def enviar(self, update, bloquear=False):
+        """
+        Enfileira um update
+
+        Args:
+            bloquear: Com a fila cheia, espera abrir espaço em vez de recusar
+
+        Returns:
+            bool: False se o update foi recusado (fila cheia ou despacho parado)
+        """
+        item = (_chave_usuario(update), update, self.faixa(update), time.monotonic())
+        with self._lock:
+            if bloquear and self._aceitando and self._total >= self.tamanho_fila:
+                logging.warning(f"Fila de updates cheia, aguardando para receber o update {update.update_id}")
+                while self._aceitando and self._total >= self.tamanho_fila:
+                    self._espaco.wait()
+            if not self._aceitando or self._total >= self.tamanho_fila:
+                self.recusados += 1
+                return False
+            self._total += 1
+            self.recebidos += 1
+            self._abertos.add(update.update_id)
+            if update.update_id > self._bot.last_update_id:
+                self._bot.last_update_id = update.update_id
+            esperando = self._por_usuario.get(item[0])
+            if esperando is not None:
+                # O usuário já tem um update na frente: sai quando ele terminar
+                esperando.append(item)
+            else:
+                self._por_usuario[item[0]] = deque()
+                self._liberar(item)
+        return True
+
+    def _liberar(self, item):
+        """Põe o update na fila da sua faixa (chamado com o lock adquirido)"""
+        self._prontos[item[2]].append(item)
+        self._conds[item[2]].notify()
+
+    def _loop(self, faixa):
+        prontos = self._prontos[faixa]
+        cond = self._conds[faixa]
+        while True:
+            with cond:
+                while not prontos:
+                    cond.wait()
+                chave, update, _, chegada = prontos.popleft()
+                self._em_execucao += 1
+            metricas.espera_despacho.observar(time.monotonic() - chegada, faixa=faixa)
+            try:
+                self._processar_original([update])
+            except Exception:
+                logging.error(f"Erro ao processar update {update.update_id}", exc_info=True)
+            finally:
+                self._concluir(chave, update.update_id)
+
+    def _concluir(self, chave, update_id):
+        with self._lock:
+            self._total -= 1
+            self._em_execucao -= 1
+            self._abertos.discard(update_id)
+            self._espaco.notify()
+            if not self._abertos:
+                self._vazio.notify_all()
+            esperando = self._por_usuario[chave]
+            if esperando:
+                self._liberar(esperando.popleft())
+            else:
+                del self._por_usuario[chave]
+
+    def parar(self, timeout=None):
+        """
+        Recusa novos updates e espera os aceitos serem processados
+
+        Returns:
+            int | None: Menor update_id ainda não concluído ao fim do timeout
+            (None se todos terminaram); os a partir dele devem ser entregues
+            de novo ao próximo processo
+        """
+        limite = None if timeout is None else time.monotonic() + timeout
+        with self._vazio:
+            self._aceitando = False
+            self._espaco.notify_all()
+            while self._abertos:
+                restante = None if limite is None else limite - time.monotonic()
+                if restante is not None and restante <= 0:
+                    return min(self._abertos)
+                self._vazio.wait(restante)
+            return None
+
+    def estatisticas(self):
+        """
+        Returns:
+            dict: fila (aguardando, por faixa e no total), em_execucao,
+            usuarios (com updates em andamento), recebidos e recusados
+        """
+        with self._lock:
+            return {
+                'fila': self._total - self._em_execucao,
+                'fila_rapida': len(self._prontos[FAIXA_RAPIDA]),
+                'fila_lenta': len(self._prontos[FAIXA_LENTA]),
+                'em_execucao': self._em_execucao,
+                'usuarios': len(self._por_usuario),
+                'recebidos': self.recebidos,
+                'recusados': self.recusados,
+            }
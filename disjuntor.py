@@ -0,0 +1,176 @@
+import threading
+import time
+from collections import deque
+
+# Estados do circuito
+FECHADO = "fechado"
+ABERTO = "aberto"
+MEIO_ABERTO = "meio_aberto"
+
+# Espera sugerida a quem chega enquanto a sonda de recuperação está em andamento (segundos)
+ESPERA_SONDA = 5.0
+
+
+class CircuitoAberto(Exception):
+    """Chamada recusada sem ir à rede porque o serviço está fora"""
+
+    def __init__(self, nome, espera):
+        super().__init__(f"Circuito {nome} aberto, nova tentativa em {espera:.0f}s")
+        self.espera = espera
+
+
+class Disjuntor:
+    """
+    Disjuntor (circuit breaker) para as chamadas a um serviço externo
+
+    Conta, em uma janela deslizante de `janela` segundos, as chamadas que
+    falharam (exceção ou resposta que `falha(resultado)` considera erro) e
+    as que passaram de `chamada_lenta` segundos. Com ao menos
+    `min_chamadas` na janela e a fração de erros ou de lentas acima do
+    limite, o circuito abre: as chamadas seguintes falham na hora com
+    CircuitoAberto, sem ocupar threads nem conexões.
+
+    Passados `tempo_aberto` segundos, uma única chamada de sonda é liberada
+    (meio aberto). Se ela der certo o circuito fecha; se falhar, ele reabre
+    pelo dobro do tempo, até `tempo_aberto_max`.
+    """
+
+    def __init__(self, nome, janela=30, min_chamadas=10, limite_erros=0.5, chamada_lenta=5.0,
+                 limite_lentas=0.8, tempo_aberto=30, tempo_aberto_max=300, falha=None):
+        self.nome = nome
+        self.janela = int(janela)
+        self.min_chamadas = int(min_chamadas)
+        self.limite_erros = float(limite_erros)
+        self.chamada_lenta = float(chamada_lenta)
+        self.limite_lentas = float(limite_lentas)
+        self.tempo_aberto = float(tempo_aberto)
+        self.tempo_aberto_max = float(tempo_aberto_max)
+        self._falha = falha or (lambda resultado: False)
+        self._lock = threading.Lock()
+        self._baldes = deque()  # [segundo, chamadas, erros, lentas], um por segundo com chamadas
+        self._chamadas = 0
+        self._erros = 0
+        self._lentas = 0
+        self.estado = FECHADO
+        self._aberto_ate = 0.0
+        self._duracao_aberto = self.tempo_aberto
+        self._sonda_em_andamento = False
+        self.aberturas = 0
+        self.recusadas = 0
+        self.ao_mudar = None  # função(estado) chamada fora do lock a cada mudança de estado
+
+    def _descartar_antigos(self, segundo):
+        while self._baldes and self._baldes[0][0] <= segundo - self.janela:
+            _, chamadas, erros, lentas = self._baldes.popleft()
+            self._chamadas -= chamadas
+            self._erros -= erros
+            self._lentas -= lentas
+
+    def _zerar_janela(self):
+        self._baldes.clear()
+        self._chamadas = self._erros = self._lentas = 0
+
+    def _abrir(self, agora):
+        self.estado = ABERTO
+        self._aberto_ate = agora + self._duracao_aberto
+        self._sonda_em_andamento = False
+        self.aberturas += 1
+        self._zerar_janela()
+
+    def espera(self):
+        """Segundos até o circuito aceitar chamadas de novo (0 se fechado)"""
+        with self._lock:
+            if self.estado == FECHADO:
+                return 0.0
+            if self.estado == MEIO_ABERTO:
+                return ESPERA_SONDA
+            return max(0.0, self._aberto_ate - time.monotonic())
+
+    def permitir(self):
+        """
+        Diz se uma chamada pode ir à rede agora
+
+        Com o circuito aberto e o tempo vencido, a primeira chamada vira a
+        sonda de recuperação; as demais continuam recusadas até ela terminar.
+        """
+        with self._lock:
+            if self.estado == FECHADO:
+                return True
+            if self.estado == ABERTO and time.monotonic() >= self._aberto_ate:
+                self.estado = MEIO_ABERTO
+            if self.estado == MEIO_ABERTO and not self._sonda_em_andamento:
+                self._sonda_em_andamento = True
+                return True
+            self.recusadas += 1
+            return False
+
+    def registrar(self, sucesso, duracao):
+        """Registra o resultado de uma chamada permitida"""
+        lenta = duracao >= self.chamada_lenta
+        mudou = None
+        with self._lock:
+            agora = time.monotonic()
+            if self.estado == MEIO_ABERTO:
+                if sucesso and not lenta:
+                    self.estado = mudou = FECHADO
+                    self._duracao_aberto = self.tempo_aberto
+                    self._sonda_em_andamento = False
+                    self._zerar_janela()
+                else:
+                    self._duracao_aberto = min(self._duracao_aberto * 2, self.tempo_aberto_max)
+                    self._abrir(agora)
+                    mudou = ABERTO
+            elif self.estado == FECHADO:
+                segundo = int(agora)
+                self._descartar_antigos(segundo)
+                if not self._baldes or self._baldes[-1][0] != segundo:
+                    self._baldes.append([segundo, 0, 0, 0])
+                balde = self._baldes[-1]
+                balde[1] += 1
+                self._chamadas += 1
+                if not sucesso:
+                    balde[2] += 1
+                    self._erros += 1
+                if lenta:
+                    balde[3] += 1
+                    self._lentas += 1
+                if self._chamadas >= self.min_chamadas and (
+                        self._erros >= self.limite_erros * self._chamadas
+                        or self._lentas >= self.limite_lentas * self._chamadas):
+                    self._abrir(agora)
+                    mudou = ABERTO
+            # ABERTO: resposta de uma chamada que saiu antes da abertura, já sem efeito
+
+        if mudou is not None and self.ao_mudar is not None:
+            self.ao_mudar(mudou)
+
+    def chamar(self, funcao, *args, **kwargs):
+        """
+        Executa `funcao` protegida pelo disjuntor
+
+        Raises:
+            CircuitoAberto: Se o circuito está aberto (nada é executado)
+        """
+        if not self.permitir():
+            raise CircuitoAberto(self.nome, self.espera())
+        inicio = time.monotonic()
+        try:
+            resultado = funcao(*args, **kwargs)
+        except Exception:
+            self.registrar(False, time.monotonic() - inicio)
+            raise
+        self.registrar(not self._falha(resultado), time.monotonic() - inicio)
+        return resultado
+
+    def estatisticas(self):
+        with self._lock:
+            self._descartar_antigos(int(time.monotonic()))
+            return {
+                'estado': self.estado,
+                'chamadas': self._chamadas,
+                'erros': self._erros,
+                'lentas': self._lentas,
+                'aberturas': self.aberturas,
+                'recusadas': self.recusadas,
+                'espera': max(0.0, self._aberto_ate - time.monotonic()) if self.estado == ABERTO else 0.0,
+            }
@@ -0,0 +1,288 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+
+from telebot.apihelper import ApiTelegramException
+
+import metricas
+from limites import BaldeTokens
+
+# Tamanho máximo de uma mensagem de texto no Telegram
+LIMITE_TEXTO = 4096
+SEPARADOR = "\n\n"
+
+# Falhas (fora 429) toleradas antes de descartar uma mensagem
+MAX_TENTATIVAS_ENVIO = 3
+
+# Intervalo da limpeza de chats ociosos (segundos)
+INTERVALO_LIMPEZA = 60
+
+
+class _Mensagem:
+    __slots__ = ('texto', 'parse_mode', 'agrupavel', 'tentativas', 'quantidade')
+
+    def __init__(self, texto, parse_mode, agrupavel, quantidade=1):
+        self.texto = texto
+        self.parse_mode = parse_mode
+        self.agrupavel = agrupavel
+        self.tentativas = 0
+        self.quantidade = quantidade  # mensagens originais contidas nesta
+
+
+class _Chat:
+    __slots__ = ('fila', 'balde', 'em_envio', 'agendado')
+
+    def __init__(self, balde):
+        self.fila = deque()
+        self.balde = balde
+        self.em_envio = False
+        self.agendado = False
+
+
+class EnviadorTelegram:
+    """
+    Fila de envio de mensagens do Telegram com controle de taxa
+
+    Os handlers só enfileiram (`enviar` não bloqueia na rede). Workers
+    enviam respeitando um balde de tokens global e um por chat, tratam 429
+    esperando o retry_after informado pelo Telegram e juntam mensagens
+    consecutivas para o mesmo chat em um único envio quando possível.
+    Mensagens de um mesmo chat saem sempre na ordem em que entraram.
+    """
+
+    def __init__(self, bot, taxa_global=25, taxa_por_chat=1, rajada_por_chat=3, workers=4):
+        self._bot = bot
+        self._taxa_por_chat = taxa_por_chat
+        self._rajada_por_chat = rajada_por_chat
+        self._balde_global = BaldeTokens(taxa_global)
+        self._num_workers = max(1, int(workers))
+        self._chats = {}
+        self._prontos = []  # heap (quando, seq, chat_id)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._rodando = False
+        self._threads = []
+        self._pendentes = 0
+        self._ultima_limpeza = time.monotonic()
+        self.enviadas = 0
+        self.agrupadas = 0
+        self.limitadas = 0
+        self.descartadas = 0
+
+    def iniciar(self):
+        """Inicia os workers de envio"""
+        with self._cond:
+            if self._rodando:
+                return
+            self._rodando = True
+        for i in range(self._num_workers):
+            thread = threading.Thread(target=self._loop, name=f"envio-{i}")
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def parar(self, timeout=None):
+        """
+        Encerra os workers, esperando os envios em andamento até `timeout`
+
+        O que não saiu continua na fila, para `retirar_pendentes`.
+        """
+        with self._cond:
+            self._rodando = False
+            self._cond.notify_all()
+        limite = None if timeout is None else time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(None if limite is None else max(0.0, limite - time.monotonic()))
+
+    def enviar(self, chat_id, texto, parse_mode=None, agrupavel=True):
+        """
+        Enfileira uma mensagem de texto
+
+        Args:
+            chat_id: Destino
+            texto: Conteúdo
+            parse_mode: Igual ao de bot.send_message
+            agrupavel: Se False, a mensagem sempre sai sozinha (ex.: o código
+                PIX copia-cola, que o usuário precisa copiar isolado)
+        """
+        with self._cond:
+            estado = self._chats.get(chat_id)
+            if estado is None:
+                estado = _Chat(BaldeTokens(self._taxa_por_chat, self._rajada_por_chat))
+                self._chats[chat_id] = estado
+            estado.fila.append(_Mensagem(texto, parse_mode, agrupavel))
+            self._pendentes += 1
+            if not estado.em_envio and not estado.agendado:
+                self._agendar_chat(chat_id, estado, 0.0)
+            self._limpar_ociosos()
+
+    def _agendar_chat(self, chat_id, estado, atraso):
+        estado.agendado = True
+        heapq.heappush(self._prontos, (time.monotonic() + atraso, next(self._seq), chat_id))
+        self._cond.notify()
+
+    def _limpar_ociosos(self):
+        agora = time.monotonic()
+        if agora - self._ultima_limpeza < INTERVALO_LIMPEZA:
+            return
+        self._ultima_limpeza = agora
+        ociosos = [chat_id for chat_id, estado in self._chats.items()
+                   if not estado.fila and not estado.em_envio and not estado.agendado
+                   and estado.balde.cheio()]
+        for chat_id in ociosos:
+            del self._chats[chat_id]
+
+    def _montar_lote(self, estado):
+        """Retira da fila a próxima mensagem, juntando as seguintes compatíveis"""
+        primeira = estado.fila.popleft()
+        if not primeira.agrupavel:
+            return primeira
+
+        partes = [primeira.texto]
+        quantidade = primeira.quantidade
+        tamanho = len(primeira.texto)
+        while estado.fila:
+            proxima = estado.fila[0]
+            if not proxima.agrupavel or proxima.parse_mode != primeira.parse_mode:
+                break
+            if tamanho + len(SEPARADOR) + len(proxima.texto) > LIMITE_TEXTO:
+                break
+            estado.fila.popleft()
+            partes.append(proxima.texto)
+            quantidade += proxima.quantidade
+            tamanho += len(SEPARADOR) + len(proxima.texto)
+
+        if len(partes) == 1:
+            return primeira
+        self.agrupadas += len(partes) - 1
+        return _Mensagem(SEPARADOR.join(partes), primeira.parse_mode, True, quantidade)
+
+    def _proximo(self):
+        """Bloqueia até haver um chat pronto para envio; retorna (chat_id, estado, mensagem)"""
+        with self._cond:
+            while self._rodando:
+                if not self._prontos:
+                    self._cond.wait()
+                    continue
+
+                quando, _, chat_id = self._prontos[0]
+                espera = quando - time.monotonic()
+                if espera > 0:
+                    self._cond.wait(espera)
+                    continue
+
+                heapq.heappop(self._prontos)
+                estado = self._chats[chat_id]
+                estado.agendado = False
+
+                espera = estado.balde.consumir()
+                if espera > 0:
+                    self._agendar_chat(chat_id, estado, espera)
+                    continue
+                espera = self._balde_global.consumir()
+                if espera > 0:
+                    estado.balde.devolver()
+                    self._agendar_chat(chat_id, estado, espera)
+                    continue
+
+                mensagem = self._montar_lote(estado)
+                estado.em_envio = True
+                return chat_id, estado, mensagem
+            return None
+
+    def _loop(self):
+        while True:
+            proximo = self._proximo()
+            if proximo is None:
+                return
+            chat_id, estado, mensagem = proximo
+
+            atraso = None  # None: enviada ou descartada
+            inicio = time.perf_counter()
+            try:
+                self._bot.send_message(chat_id, mensagem.texto, parse_mode=mensagem.parse_mode)
+                self.enviadas += 1
+                metricas.envios_telegram.inc(resultado="ok")
+            except ApiTelegramException as e:
+                metricas.envios_telegram.inc(resultado=str(e.error_code))
+                if e.error_code == 429:
+                    retry_after = (e.result_json.get('parameters') or {}).get('retry_after', 1)
+                    logging.warning(f"Telegram limitou envios para {chat_id}, aguardando {retry_after}s")
+                    self.limitadas += 1
+                    estado.balde.esvaziar_por(retry_after)
+                    atraso = retry_after
+                elif e.error_code in (400, 403):
+                    # Chat inexistente ou usuário bloqueou o bot: não adianta repetir
+                    logging.warning(f"Mensagem para {chat_id} descartada: {e.description}")
+                    self.descartadas += mensagem.quantidade
+                else:
+                    atraso = self._nova_tentativa(chat_id, mensagem, e)
+            except Exception as e:
+                metricas.envios_telegram.inc(resultado="erro")
+                atraso = self._nova_tentativa(chat_id, mensagem, e)
+            finally:
+                metricas.latencia_telegram.observar(time.perf_counter() - inicio, metodo="sendMessage")
+
+            with self._cond:
+                estado.em_envio = False
+                if atraso is not None:
+                    estado.fila.appendleft(mensagem)
+                else:
+                    self._pendentes -= mensagem.quantidade
+                if estado.fila:
+                    self._agendar_chat(chat_id, estado, atraso or 0.0)
+                self._cond.notify_all()
+
+    def _nova_tentativa(self, chat_id, mensagem, erro):
+        """Retorna o atraso até reenviar, ou None se a mensagem foi descartada"""
+        mensagem.tentativas += 1
+        if mensagem.tentativas >= MAX_TENTATIVAS_ENVIO:
+            logging.error(f"Mensagem para {chat_id} descartada após {mensagem.tentativas} tentativas: {erro}")
+            self.descartadas += mensagem.quantidade
+            return None
+        logging.warning(f"Erro ao enviar mensagem para {chat_id} (tentativa {mensagem.tentativas}): {erro}")
+        return 2 ** mensagem.tentativas
+
+    def aguardar_vazio(self, timeout=None):
+        """Espera até todas as mensagens enfileiradas saírem; retorna False no timeout"""
+        limite = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._pendentes > 0:
+                restante = None if limite is None else limite - time.monotonic()
+                if restante is not None and restante <= 0:
+                    return False
+                self._cond.wait(restante)
+            return True
+
+    def retirar_pendentes(self):
+        """
+        Esvazia a fila, devolvendo o que não foi enviado (após `parar`)
+
+        Returns:
+            list: [(chat_id, texto, parse_mode, agrupavel)] na ordem de cada chat
+        """
+        with self._cond:
+            pendentes = [
+                (chat_id, mensagem.texto, mensagem.parse_mode, mensagem.agrupavel)
+                for chat_id, estado in self._chats.items()
+                for mensagem in estado.fila
+            ]
+            for estado in self._chats.values():
+                estado.fila.clear()
+            self._prontos.clear()
+            self._pendentes = 0
+        return pendentes
+
+    def estatisticas(self):
+        with self._cond:
+            return {
+                'fila': self._pendentes,
+                'chats': len(self._chats),
+                'enviadas': self.enviadas,
+                'agrupadas': self.agrupadas,
+                'limitadas': self.limitadas,
+                'descartadas': self.descartadas,
+            }
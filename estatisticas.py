@@ -0,0 +1,221 @@
+import bisect
+import logging
+import sqlite3
+import threading
+import time
+
+from metricas import BUCKETS_APROVACAO, percentil
+
+# Eventos do funil de vendas, na ordem em que acontecem
+PEDIDO = "pedidos"  # /pagar recebido
+CRIADO = "criados"  # PIX novo criado no Mercado Pago
+REAPROVEITADO = "reaproveitados"  # PIX ainda válido reenviado
+APROVADO = "aprovados"
+REJEITADO = "rejeitados"
+EXPIRADO = "expirados"
+EVENTOS = (PEDIDO, CRIADO, REAPROVEITADO, APROVADO, REJEITADO, EXPIRADO)
+
+# Linha com o acumulado de todo o histórico (os dias reais são números bem maiores)
+DIA_TOTAL = 0
+
+# Janelas do resumo, em dias (None = todo o histórico)
+JANELAS = (("Hoje", 1), ("7 dias", 7), ("30 dias", 30), ("Total", None))
+
+
+class EstatisticasVendas:
+    """
+    Estatísticas de vendas e do funil de pagamento, por dia
+
+    Cada evento só soma em contadores na memória (O(1), sem I/O). A cada
+    `gravar()` os acréscimos acumulados vão para o SQLite em uma transação,
+    somados às linhas do dia e à linha DIA_TOTAL; como a gravação soma em
+    vez de sobrescrever, várias instâncias podem dividir o mesmo banco.
+
+    O tempo até o pagamento é guardado como histograma (buckets de
+    BUCKETS_APROVACAO), então os percentis de qualquer janela saem da soma
+    das contagens. O resumo lê no máximo 30 dias e a linha do total, por
+    mais longo que seja o histórico.
+
+    O que ainda não foi gravado se perde numa queda do processo (no máximo
+    um intervalo de gravação).
+    """
+
+    def __init__(self, caminho, fuso_horas=-3):
+        self.caminho = caminho
+        self._deslocamento = fuso_horas * 3600
+        self._lock = threading.Lock()
+        self._gravacao = threading.Lock()
+        self._acrescimos = {}  # dia -> {evento: quantidade, 'receita': centavos, 'tempo_soma': s, 'tempo': [buckets]}
+        self._conexao = sqlite3.connect(caminho, timeout=10, check_same_thread=False, isolation_level=None)
+        self._conexao.execute("PRAGMA journal_mode=WAL")
+        self._conexao.execute("PRAGMA synchronous=NORMAL")
+        self._conexao.execute(
+            "CREATE TABLE IF NOT EXISTS vendas_diarias ("
+            " dia INTEGER PRIMARY KEY,"
+            + "".join(f" {evento} INTEGER NOT NULL DEFAULT 0," for evento in EVENTOS)
+            + " receita_centavos INTEGER NOT NULL DEFAULT 0,"
+            " tempo_soma REAL NOT NULL DEFAULT 0)"
+        )
+        self._conexao.execute(
+            "CREATE TABLE IF NOT EXISTS vendas_tempo_pagamento ("
+            " dia INTEGER NOT NULL,"
+            " bucket INTEGER NOT NULL,"
+            " contagem INTEGER NOT NULL,"
+            " PRIMARY KEY (dia, bucket))"
+        )
+
+    def dia(self, momento=None):
+        """Número do dia local (dias desde 1970-01-01 no fuso configurado)"""
+        return int(((time.time() if momento is None else momento) + self._deslocamento) // 86400)
+
+    def _do_dia(self, momento=None):
+        """Acréscimos do dia (chamado com o lock adquirido)"""
+        dia = self.dia(momento)
+        acrescimos = self._acrescimos.get(dia)
+        if acrescimos is None:
+            acrescimos = self._acrescimos[dia] = dict.fromkeys(EVENTOS, 0)
+            acrescimos.update(receita=0, tempo_soma=0.0, tempo=[0] * (len(BUCKETS_APROVACAO) + 1))
+        return acrescimos
+
+    def registrar(self, evento, quantidade=1):
+        """Conta `quantidade` ocorrências de um evento do funil hoje"""
+        with self._lock:
+            self._do_dia()[evento] += quantidade
+
+    def registrar_aprovacao(self, valor, duracao):
+        """
+        Conta um pagamento aprovado
+
+        Args:
+            valor: Valor pago (R$)
+            duracao: Segundos entre a criação do PIX e a aprovação
+        """
+        duracao = max(0.0, duracao)
+        indice = bisect.bisect_left(BUCKETS_APROVACAO, duracao)
+        with self._lock:
+            acrescimos = self._do_dia()
+            acrescimos[APROVADO] += 1
+            acrescimos['receita'] += round(valor * 100)
+            acrescimos['tempo_soma'] += duracao
+            acrescimos['tempo'][indice] += 1
+
+    def gravar(self):
+        """
+        Soma no banco os acréscimos acumulados desde a última gravação
+
+        Se a escrita falhar, os acréscimos voltam para a memória e vão na próxima.
+        """
+        with self._gravacao:
+            with self._lock:
+                acrescimos, self._acrescimos = self._acrescimos, {}
+            if not acrescimos:
+                return
+            try:
+                self._somar_no_banco(acrescimos)
+            except Exception:
+                with self._lock:
+                    for dia, valores in acrescimos.items():
+                        atual = self._acrescimos.setdefault(dia, valores)
+                        if atual is not valores:
+                            for campo in EVENTOS + ('receita', 'tempo_soma'):
+                                atual[campo] += valores[campo]
+                            atual['tempo'] = [a + b for a, b in zip(atual['tempo'], valores['tempo'])]
+                raise
+
+    def _somar_no_banco(self, acrescimos):
+        colunas = ", ".join(EVENTOS)
+        somas = ", ".join(f"{evento} = {evento} + excluded.{evento}" for evento in EVENTOS)
+        linhas = []
+        tempos = []
+        for dia, valores in acrescimos.items():
+            linha = tuple(valores[evento] for evento in EVENTOS) + (valores['receita'], valores['tempo_soma'])
+            linhas.append((dia,) + linha)
+            linhas.append((DIA_TOTAL,) + linha)
+            for bucket, contagem in enumerate(valores['tempo']):
+                if contagem:
+                    tempos.append((dia, bucket, contagem))
+                    tempos.append((DIA_TOTAL, bucket, contagem))
+
+        self._conexao.execute("BEGIN IMMEDIATE")
+        try:
+            self._conexao.executemany(
+                f"INSERT INTO vendas_diarias (dia, {colunas}, receita_centavos, tempo_soma)"
+                f" VALUES ({', '.join('?' * (len(EVENTOS) + 3))})"
+                f" ON CONFLICT(dia) DO UPDATE SET {somas},"
+                " receita_centavos = receita_centavos + excluded.receita_centavos,"
+                " tempo_soma = tempo_soma + excluded.tempo_soma",
+                linhas
+            )
+            self._conexao.executemany(
+                "INSERT INTO vendas_tempo_pagamento (dia, bucket, contagem) VALUES (?, ?, ?)"
+                " ON CONFLICT(dia, bucket) DO UPDATE SET contagem = contagem + excluded.contagem",
+                tempos
+            )
+        except Exception:
+            self._conexao.execute("ROLLBACK")
+            raise
+        self._conexao.execute("COMMIT")
+
+    def resumo(self):
+        """
+        Grava o acumulado e soma as janelas de JANELAS
+
+        Returns:
+            dict: {nome da janela: dict com a contagem de cada evento, enviados
+            (PIX criados + reaproveitados), receita (R$), conversao (aprovados /
+            criados, ou None), ticket_medio, tempo_medio, tempo_p50 e tempo_p90
+            (segundos, None sem aprovações)}
+        """
+        try:
+            self.gravar()
+        except Exception:
+            logging.error("Erro ao gravar estatísticas de vendas", exc_info=True)
+
+        hoje = self.dia()
+        maior = max(dias for _, dias in JANELAS if dias)
+        with self._gravacao:
+            diarias = self._conexao.execute(
+                f"SELECT dia, {', '.join(EVENTOS)}, receita_centavos, tempo_soma FROM vendas_diarias"
+                " WHERE dia = ? OR dia > ?",
+                (DIA_TOTAL, hoje - maior)
+            ).fetchall()
+            buckets = self._conexao.execute(
+                "SELECT dia, bucket, contagem FROM vendas_tempo_pagamento WHERE dia = ? OR dia > ?",
+                (DIA_TOTAL, hoje - maior)
+            ).fetchall()
+
+        resumo = {}
+        for nome, dias in JANELAS:
+            def na_janela(dia):
+                return dia == DIA_TOTAL if dias is None else (dia != DIA_TOTAL and dia > hoje - dias)
+
+            somas = [0] * (len(EVENTOS) + 2)
+            for linha in diarias:
+                if na_janela(linha[0]):
+                    somas = [a + b for a, b in zip(somas, linha[1:])]
+            contagens = [0] * (len(BUCKETS_APROVACAO) + 1)
+            for dia, bucket, contagem in buckets:
+                if na_janela(dia) and bucket < len(contagens):
+                    contagens[bucket] += contagem
+            resumo[nome] = self._janela(dict(zip(EVENTOS, somas)), somas[-2] / 100, somas[-1], contagens)
+        return resumo
+
+    @staticmethod
+    def _janela(eventos, receita, tempo_soma, contagens):
+        aprovados = eventos[APROVADO]
+        enviados = eventos[CRIADO] + eventos[REAPROVEITADO]
+        janela = dict(eventos)
+        janela.update(
+            receita=receita,
+            conversao=aprovados / eventos[CRIADO] if eventos[CRIADO] else None,
+            enviados=enviados,
+            ticket_medio=receita / aprovados if aprovados else None,
+            tempo_medio=tempo_soma / aprovados if aprovados else None,
+            tempo_p50=percentil(BUCKETS_APROVACAO, contagens, 0.5) if aprovados else None,
+            tempo_p90=percentil(BUCKETS_APROVACAO, contagens, 0.9) if aprovados else None,
+        )
+        return janela
+
+    def fechar(self):
+        with self._gravacao:
+            self._conexao.close()
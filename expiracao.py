@@ -0,0 +1,108 @@
+import logging
+import math
+import threading
+import time
+
+
+class RodaExpiracao:
+    """
+    Timing wheel das expirações dos pendentes
+
+    O tempo é dividido em fatias de `resolucao` segundos; cada chave fica no
+    conjunto da fatia em que expira. Incluir e esquecer uma chave custam
+    O(1), e a cada tick a roda esvazia as fatias que venceram, então cada
+    expiração custa O(1) amortizado, sem ordenar nada. As fatias vazias não
+    ocupam memória, por isso a roda cobre qualquer prazo (o PIX vale 24h).
+
+    Todas as chaves vencidas em um tick são entregues de uma vez a
+    `ao_expirar(chaves)`, para que a remoção e a gravação sejam feitas em
+    lote.
+    """
+
+    def __init__(self, ao_expirar, resolucao=1.0):
+        self._ao_expirar = ao_expirar
+        self.resolucao = float(resolucao)
+        self._fatias = {}  # índice da fatia -> {chaves}
+        self._fatia_de = {}  # chave -> índice da fatia
+        self._cursor = math.floor(time.time() / self.resolucao)  # próxima fatia a esvaziar
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._thread = None
+        self.expiradas = 0
+
+    def _indice(self, momento):
+        # Arredonda para cima: a fatia só é esvaziada depois do momento da expiração
+        return math.ceil(momento / self.resolucao)
+
+    def acompanhar(self, chave, expira_em):
+        """Inclui (ou move) `chave` para expirar em `expira_em` (epoch); vencidas saem no próximo tick"""
+        with self._lock:
+            self._retirar(chave)
+            indice = max(self._indice(expira_em), self._cursor)
+            self._fatias.setdefault(indice, set()).add(chave)
+            self._fatia_de[chave] = indice
+
+    def esquecer(self, chave):
+        """Para de acompanhar `chave` (ex.: pagamento resolvido antes de expirar)"""
+        with self._lock:
+            self._retirar(chave)
+
+    def _retirar(self, chave):
+        indice = self._fatia_de.pop(chave, None)
+        if indice is None:
+            return
+        fatia = self._fatias.get(indice)
+        if fatia is not None:
+            fatia.discard(chave)
+            if not fatia:
+                del self._fatias[indice]
+
+    def __len__(self):
+        return len(self._fatia_de)
+
+    def girar(self, agora=None):
+        """
+        Esvazia as fatias vencidas até `agora` e entrega as chaves a `ao_expirar`
+
+        Returns:
+            list: Chaves expiradas neste tick
+        """
+        limite = math.floor((time.time() if agora is None else agora) / self.resolucao)
+        vencidas = []
+        with self._lock:
+            if len(self._fatias) < limite - self._cursor:
+                # Muito tempo sem girar (ex.: processo suspenso): mais barato varrer as fatias existentes
+                indices = [indice for indice in self._fatias if indice <= limite]
+            else:
+                indices = range(self._cursor, limite + 1)
+            for indice in indices:
+                for chave in self._fatias.pop(indice, ()):
+                    del self._fatia_de[chave]
+                    vencidas.append(chave)
+            self._cursor = max(self._cursor, limite + 1)
+
+        if vencidas:
+            self.expiradas += len(vencidas)
+            try:
+                self._ao_expirar(vencidas)
+            except Exception:
+                logging.error(f"Erro ao expirar {len(vencidas)} pendentes", exc_info=True)
+        return vencidas
+
+    def iniciar(self):
+        """Gira a roda a cada `resolucao` segundos em uma thread própria"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="expiracao")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def parar(self, timeout=None):
+        """Para de girar, esperando o tick em andamento até `timeout`"""
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _loop(self):
+        while not self._parar.wait(self.resolucao):
+            self.girar()
@@ -0,0 +1,57 @@
+import threading
+import time
+
+
+class BaldeTokens:
+    """
+    Balde de tokens (token bucket) para limitar taxa
+
+    Acumula `taxa` tokens por segundo até `capacidade`. Cada operação
+    consome tokens; sem tokens suficientes, informa quanto esperar.
+    """
+
+    def __init__(self, taxa, capacidade=None):
+        self.taxa = float(taxa)
+        self.capacidade = float(capacidade if capacidade is not None else max(1.0, taxa))
+        self._tokens = self.capacidade
+        self._atualizado = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _repor(self, agora):
+        decorrido = agora - self._atualizado
+        if decorrido > 0:
+            self._tokens = min(self.capacidade, self._tokens + decorrido * self.taxa)
+            self._atualizado = agora
+
+    def consumir(self, quantidade=1):
+        """
+        Tenta consumir tokens
+
+        Returns:
+            float: 0 se consumiu, ou os segundos até haver tokens suficientes
+            (nesse caso nada é consumido)
+        """
+        with self._lock:
+            agora = time.monotonic()
+            self._repor(agora)
+            if self._tokens >= quantidade:
+                self._tokens -= quantidade
+                return 0.0
+            bloqueio = max(0.0, self._atualizado - agora)
+            return bloqueio + (quantidade - self._tokens) / self.taxa
+
+    def devolver(self, quantidade=1):
+        """Devolve tokens consumidos por uma operação que não chegou a acontecer"""
+        with self._lock:
+            self._tokens = min(self.capacidade, self._tokens + quantidade)
+
+    def esvaziar_por(self, segundos):
+        """Zera o balde e bloqueia novos tokens por `segundos` (ex.: retry_after)"""
+        with self._lock:
+            self._tokens = 0.0
+            self._atualizado = max(self._atualizado, time.monotonic() + segundos)
+
+    def cheio(self):
+        with self._lock:
+            self._repor(time.monotonic())
+            return self._tokens >= self.capacidade
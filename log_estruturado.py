@@ -0,0 +1,184 @@
+import atexit
+import json
+import logging
+import queue
+import random
+import re
+from logging.handlers import QueueHandler, QueueListener
+
+import config
+
+# Campos de contexto aceitos em `extra=` e levados para o JSON
+CAMPOS_CONTEXTO = ('payment_id', 'user_id', 'chat_id', 'status', 'operacao')
+
+# Campos de `extra=` que nunca saem em claro
+CAMPOS_SENSIVEIS = ('qr_code', 'email', 'token', 'access_token', 'payer')
+
+# E-mails e códigos PIX copia-cola (BR Code, sempre começa com 000201) no texto das mensagens
+_PADRAO_EMAIL = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+_PADRAO_PIX = re.compile(r"000201\S{20,}")
+
+FORMATO_TEXTO = "%(asctime)s [%(levelname)s] %(message)s"
+
+
+def _segredos():
+    """Credenciais da configuração que nunca devem aparecer nos logs"""
+    return [segredo for segredo in (
+        config.TOKEN_BOT,
+        config.TOKEN_MERCADOPAGO,
+        config.PUBLIC_KEY,
+        config.MP_WEBHOOK_SECRET,
+        config.TELEGRAM_WEBHOOK_SECRET,
+    ) if segredo]
+
+
+def redigir(texto, segredos=()):
+    """Mascara credenciais, e-mails e códigos PIX em um texto com config.mascara_token"""
+    for segredo in segredos:
+        if segredo in texto:
+            texto = texto.replace(segredo, config.mascara_token(segredo))
+    texto = _PADRAO_EMAIL.sub(lambda m: config.mascara_token(m.group(0), 2, 6), texto)
+    return _PADRAO_PIX.sub(lambda m: config.mascara_token(m.group(0), 6, 4), texto)
+
+
+class FormatadorTexto(logging.Formatter):
+    """Formato original do bot, com os dados sensíveis mascarados"""
+
+    def __init__(self):
+        super().__init__(FORMATO_TEXTO, datefmt="%H:%M:%S")
+        self._segredos = _segredos()
+
+    def format(self, record):
+        return redigir(super().format(record), self._segredos)
+
+
+class FormatadorJson(logging.Formatter):
+    """
+    Uma linha JSON por evento
+
+    Inclui os campos de contexto passados em `extra=` (payment_id, user_id,
+    ...). Mensagens, exceções e campos sensíveis são mascarados.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._segredos = _segredos()
+
+    def format(self, record):
+        evento = {
+            'ts': round(record.created, 3),
+            'nivel': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'msg': redigir(record.getMessage(), self._segredos),
+        }
+        for campo in CAMPOS_CONTEXTO:
+            valor = getattr(record, campo, None)
+            if valor is not None:
+                evento[campo] = valor
+        for campo in CAMPOS_SENSIVEIS:
+            valor = getattr(record, campo, None)
+            if valor is not None:
+                evento[campo] = config.mascara_token(str(valor))
+        if record.exc_text:
+            evento['excecao'] = redigir(record.exc_text, self._segredos)
+        return json.dumps(evento, ensure_ascii=False, default=str)
+
+
+class FiltroAmostragem(logging.Filter):
+    """
+    Deixa passar só uma fração dos eventos DEBUG (os de maior volume)
+
+    Com `taxa` 0.1, cerca de 1 em cada 10 eventos de debug é registrado;
+    INFO e acima passam sempre.
+    """
+
+    def __init__(self, taxa):
+        super().__init__()
+        self.taxa = taxa
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or random.random() < self.taxa
+
+
+class _QueueHandlerSemBloqueio(QueueHandler):
+    """
+    Coloca o evento na fila sem esperar (uso interno)
+
+    O evento é preparado no mínimo possível (mensagem interpolada e
+    traceback, que não pode esperar); a formatação, a redação e a escrita
+    ficam com a thread do QueueListener. Com a fila cheia o evento é
+    descartado e contado, em vez de travar quem está logando.
+    """
+
+    def __init__(self, fila):
+        super().__init__(fila)
+        self.descartados = 0
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.descartados += 1
+
+
+_listener = None
+_handler = None
+
+
+def configurar(formato="texto", nivel="INFO", amostragem_debug=1.0, tamanho_fila=10000):
+    """
+    Configura o logging do processo com uma fila e uma thread de escrita
+
+    Quem loga só enfileira o evento; a formatação (texto ou JSON), a
+    redação de dados sensíveis e a escrita no console acontecem em
+    segundo plano. A fila é esvaziada ao encerrar o processo.
+
+    Args:
+        formato: "texto" (padrão) ou "json"
+        nivel: Nível mínimo (nome ou número)
+        amostragem_debug: Fração dos eventos DEBUG registrados (0 a 1)
+        tamanho_fila: Eventos em espera antes de começar a descartar
+    """
+    global _listener, _handler
+    if _listener is not None:
+        return
+
+    saida = logging.StreamHandler()
+    saida.setFormatter(FormatadorJson() if formato == "json" else FormatadorTexto())
+
+    _handler = _QueueHandlerSemBloqueio(queue.Queue(maxsize=tamanho_fila))
+    if amostragem_debug < 1.0:
+        _handler.addFilter(FiltroAmostragem(amostragem_debug))
+
+    raiz = logging.getLogger()
+    for anterior in list(raiz.handlers):
+        raiz.removeHandler(anterior)
+    raiz.addHandler(_handler)
+    raiz.setLevel(nivel)
+
+    _listener = QueueListener(_handler.queue, saida)
+    _listener.start()
+    atexit.register(encerrar)
+
+
+def encerrar():
+    """Escreve o que ainda está na fila e para a thread de escrita"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def descartados():
+    """Eventos perdidos por fila cheia desde o início"""
+    return _handler.descartados if _handler is not None else 0
+
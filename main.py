@@ -1,19 +1,39 @@
 import datetime
-import mercadopago
+import signal
 import telebot
 import time
 import threading
-import traceback
 import json
-import os
+import random
 import logging
 import config
+import conciliacao
+import log_estruturado
+import metricas
+import persistencia
+import servidor_http
+import webhook_mp
+import webhook_telegram
+from admissao_grupo import AGUARDANDO_PEDIDO, CONCEDIDO, FilaAdmissaoGrupo
+from agendador import AgendadorVerificacoes
+from cache_cobrancas import CacheCobrancas
+from controle_admissao import RECUSA_USUARIO, ControleAdmissao
+from despacho import DespachanteUpdates
+from disjuntor import ABERTO, FECHADO, CircuitoAberto
+from envio import EnviadorTelegram
+from estatisticas import CRIADO, EXPIRADO, PEDIDO, REAPROVEITADO, REJEITADO, EstatisticasVendas
+from expiracao import RodaExpiracao
+from politica_verificacao import PoliticaFixa, criar_politica
+from registro import Pendente, RegistroPendentes
+from reinicio import EstadoReinicio
+from reprocesso import FilaReprocesso
 
-# Configuração de logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    datefmt="%H:%M:%S"
+# Configuração de logging: eventos vão para uma fila e são escritos em segundo plano
+log_estruturado.configurar(
+    formato=config.LOG_FORMATO,
+    nivel=config.LOG_NIVEL,
+    amostragem_debug=config.LOG_AMOSTRAGEM_DEBUG,
+    tamanho_fila=config.LOG_FILA_MAX
 )
 
 # 🔑 Credenciais importadas do config.py
@@ -23,44 +43,185 @@ MY_CHAT_ID = config.MY_CHAT_ID
 GROUP_INVITE_LINK = config.GROUP_INVITE_LINK
 GROUP_CHAT_ID = config.GROUP_CHAT_ID
 
-# Arquivo para persistir pagamentos pendentes
+# Arquivos para persistir pagamentos pendentes
 ARQUIVO_PENDENTES = "pendentes.json"
+ARQUIVO_BANCO = config.ARQUIVO_BANCO
 
-# Inicializa SDK e Bot
-sdk = mercadopago.SDK(TOKEN_MERCADOPAGO)
-bot = telebot.TeleBot(TOKEN_BOT)
+# Inicializa o Bot (o SDK do Mercado Pago é compartilhado via config.get_mercadopago_sdk)
+# Os handlers rodam nos workers do despachante, não no pool de threads do TeleBot
+WEBHOOK_TELEGRAM = config.MODO_TELEGRAM == "webhook"
+bot = telebot.TeleBot(TOKEN_BOT, threaded=False)
 
-# Dicionário para armazenar pagamentos pendentes
-pagamentos_pendentes = {}
+# Updates (polling ou webhook) passam pelo despacho: cada usuário em ordem, /pagar em workers próprios
+despachante = DespachanteUpdates(
+    bot,
+    comandos_lentos=config.DESPACHO_COMANDOS_LENTOS,
+    workers_rapidos=config.DESPACHO_WORKERS_RAPIDOS,
+    workers_lentos=config.DESPACHO_WORKERS_LENTOS,
+    tamanho_fila=config.TELEGRAM_FILA_MAX
+)
 
-def salvar_pendentes():
-    """Salva pagamentos pendentes em arquivo JSON"""
-    try:
-        with open(ARQUIVO_PENDENTES, "w") as f:
-            json.dump(pagamentos_pendentes, f, default=str)
-        logging.info(f"Pagamentos pendentes salvos: {len(pagamentos_pendentes)} registros")
-    except Exception as e:
-        logging.error(f"Erro ao salvar pendentes: {e}")
+# Mensagens saem por uma fila com controle de taxa; os handlers nunca bloqueiam no envio
+enviador = EnviadorTelegram(
+    bot,
+    taxa_global=config.TELEGRAM_TAXA_GLOBAL,
+    taxa_por_chat=config.TELEGRAM_TAXA_POR_CHAT,
+    workers=config.TELEGRAM_ENVIO_WORKERS
+)
+
+# Validade do PIX gerado em create_payment
+VALIDADE_PIX = datetime.timedelta(days=1)
+
+# Política de verificação: quando verificar cada pagamento até a expiração do PIX
+if config.MP_WEBHOOK_ATIVO:
+    # Com o webhook do Mercado Pago ativo, o polling vira uma rede de segurança lenta
+    politica = PoliticaFixa(config.INTERVALO_VERIFICACAO_WEBHOOK)
+else:
+    politica = criar_politica(config.POLITICA_VERIFICACAO, **config.PARAMETROS_POLITICA)
+
+# Espera após uma resposta inválida ou erro do Mercado Pago
+INTERVALO_APOS_ERRO = 10
+
+# Por quanto tempo após a expiração do PIX a verificação final insiste com o Mercado
+# Pago fora do ar antes de expirar o pendente sem a consulta (segundos)
+PRAZO_VERIFICACAO_FINAL = 3600
+
+# Valor cobrado pelo acesso ao grupo (R$)
+VALOR_ACESSO = 25
+
+# Tentativas de verificação já feitas por pagamento (não persistido)
+tentativas_verificacao = {}
+
+# Chave do agendador para a conciliação em lote (MODO_VERIFICACAO=lote)
+CHAVE_CONCILIACAO = "conciliacao"
+VERIFICACAO_EM_LOTE = config.MODO_VERIFICACAO == "lote"
+
+# Chave do agendador para renovar e reivindicar leases (MULTI_INSTANCIA)
+CHAVE_LEASES = "leases"
+
+# Chaves do agendador para sondar a volta do Mercado Pago e criar os pedidos guardados
+CHAVE_SONDA = "sonda_mp"
+CHAVE_REPROCESSO = "reprocesso"
+
+# Chave do agendador para gravar as estatísticas de vendas no banco
+CHAVE_ESTATISTICAS = "estatisticas"
+
+# Chave do agendador que procura, logo após o início, o estado salvo por um processo
+# anterior que só encerrou depois deste começar (deploy com sobreposição)
+CHAVE_REINICIO = "reinicio"
+
+# Chave do agendador que expira de uma vez os reprovados na verificação final
+CHAVE_EXPIRACOES = "expiracoes"
+
+# Prefixo das chaves do agendador para consultar um pagamento notificado pelo webhook
+PREFIXO_NOTIFICACAO = "notificacao:"
+JANELA_ESTADO_TARDIO = 120
+INTERVALO_ESTADO_TARDIO = 2
+INICIO = time.monotonic()
+
+# Sinalizada por SIGTERM/SIGINT: o processo para de receber updates e encerra
+parada = threading.Event()
+
+# Todas as chamadas ao Mercado Pago passam pelo disjuntor compartilhado
+disjuntor_mp = config.disjuntor_mp
+
+# Persistência incremental: cada evento grava ou remove só um registro
+# (com MULTI_INSTANCIA, o banco é dividido com as outras instâncias por leases)
+armazenamento = persistencia.criar_armazenamento(
+    config.PERSISTENCIA,
+    ARQUIVO_PENDENTES,
+    ARQUIVO_BANCO,
+    instancia=config.INSTANCIA_ID if config.MULTI_INSTANCIA else None,
+    duracao_lease=config.LEASE_DURACAO
+)
+
+# Registro dos pagamentos pendentes, com índice por usuário e gravação no armazenamento
+pagamentos_pendentes = RegistroPendentes(
+    armazenamento,
+    valor_padrao=VALOR_ACESSO,
+    validade_padrao=VALIDADE_PIX.total_seconds()
+)
+
+# Funil e receita para o /stats: contadores em memória gravados por dia no banco
+vendas = EstatisticasVendas(ARQUIVO_BANCO, fuso_horas=config.ESTATISTICAS_FUSO_HORAS)
+
+# Estado passado ao próximo processo no encerramento (agenda, tentativas, mensagens não enviadas)
+estado_reinicio = EstadoReinicio(ARQUIVO_BANCO)
 
 def carregar_pendentes():
-    """Carrega pagamentos pendentes do arquivo JSON"""
-    global pagamentos_pendentes
+    """Carrega pagamentos pendentes do armazenamento"""
     try:
-        if os.path.exists(ARQUIVO_PENDENTES):
-            with open(ARQUIVO_PENDENTES, "r") as f:
-                pagamentos_pendentes = json.load(f)
-            logging.info(f"Carregados {len(pagamentos_pendentes)} pagamentos pendentes")
+        total = pagamentos_pendentes.carregar()
+        if total:
+            logging.info(f"Carregados {total} pagamentos pendentes")
         else:
-            pagamentos_pendentes = {}
-            logging.info("Nenhum arquivo de pendentes encontrado, iniciando vazio")
+            logging.info("Nenhum pagamento pendente salvo, iniciando vazio")
     except Exception as e:
         logging.error(f"Erro ao carregar pendentes: {e}")
-        pagamentos_pendentes = {}
+
+# PIX ainda válidos por (user_id, valor), reaproveitados em /pagar repetidos
+cache_cobrancas = CacheCobrancas()
+
+# Pedidos de /pagar recusados pelo disjuntor, criados quando o Mercado Pago voltar
+fila_reprocesso = FilaReprocesso(config.REPROCESSO_FILA_MAX)
+
+# Limites das criações de PIX: por usuário, simultâneas e fila de espera
+admissao = ControleAdmissao(
+    taxa_por_usuario=config.ADMISSAO_POR_MINUTO / 60,
+    rajada_por_usuario=config.ADMISSAO_RAJADA,
+    max_simultaneas=config.ADMISSAO_SIMULTANEAS,
+    max_fila=config.ADMISSAO_FILA_MAX,
+    espera_max=config.ADMISSAO_ESPERA_MAX
+)
+
+def _aquecer_cache_cobrancas():
+    """Recoloca no cache os PIX dos pendentes carregados do armazenamento"""
+    for payment_id, info in pagamentos_pendentes.items():
+        if info.qr_code:
+            cache_cobrancas.guardar(info.user_id, info.valor, payment_id, info.qr_code, info.expira_em)
+
+def _chamar_mp(operacao, funcao, *args):
+    """
+    Chama o SDK do Mercado Pago pelo disjuntor
+
+    Só as chamadas que vão à rede entram nas métricas de latência e erro.
+
+    Raises:
+        CircuitoAberto: Se o circuito está aberto (nada é chamado)
+    """
+    def medida():
+        with metricas.chamada_mp(operacao):
+            return funcao(*args)
+    return disjuntor_mp.chamar(medida)
+
+def _espera_circuito(erro):
+    """Atraso até tentar de novo com o circuito aberto, espalhado para não voltar todo mundo junto"""
+    return erro.espera + random.uniform(0, INTERVALO_APOS_ERRO)
+
+def _ler_expiracao(resposta, padrao):
+    """
+    Momento de expiração (epoch) informado pelo Mercado Pago na criação
+
+    Args:
+        resposta: Campo 'response' do pagamento criado
+        padrao: Epoch usado se a data vier ausente ou ilegível
+    """
+    data = resposta.get('date_of_expiration')
+    if not data:
+        return padrao
+    try:
+        momento = datetime.datetime.fromisoformat(data.replace('Z', '+00:00'))
+    except (TypeError, ValueError):
+        logging.warning(f"⚠️ date_of_expiration ilegível: {data!r}")
+        return padrao
+    if momento.tzinfo is None:
+        momento = momento.astimezone()
+    return momento.timestamp()
 
 def create_payment(value, user_id):
     """Cria um pagamento PIX no Mercado Pago"""
-    expire = datetime.datetime.now() + datetime.timedelta(days=1)
-    expire = expire.strftime("%Y-%m-%dT%H:%M:%S.000-03:00")
+    expire = datetime.datetime.now().astimezone() + VALIDADE_PIX
+    expire = expire.isoformat(timespec='milliseconds')
 
     payment_data = {
         "transaction_amount": int(value),
@@ -72,79 +233,516 @@ def create_payment(value, user_id):
             "email": f"user{user_id}@example.com"
         }
     }
+    if config.MP_WEBHOOK_URL:
+        payment_data["notification_url"] = config.MP_WEBHOOK_URL
 
-    logging.info(f"Criando pagamento para usuário {user_id}, valor: R$ {value}")
-    result = sdk.payment().create(payment_data)
-    return result
+    logging.info(f"Criando pagamento para usuário {user_id}, valor: R$ {value}", extra={'user_id': user_id})
+    return _chamar_mp("create", config.get_mercadopago_sdk().payment().create, payment_data)
 
-def verificar_pagamento(payment_id, user_id, chat_id):
-    """Verifica o status do pagamento a cada 10 segundos por 10 minutos"""
-    tentativas = 0
-    max_tentativas = 60  # 10 minutos (60 x 10 segundos)
+def _remover_pendente(payment_id):
+    """
+    Retira o pagamento dos pendentes e do controle de tentativas
 
-    logging.info(f"Iniciando verificação do pagamento {payment_id} para usuário {user_id}")
+    A remoção é atômica: quando polling, conciliação e webhook resolvem o
+    mesmo pagamento ao mesmo tempo, só quem remove primeiro avisa o usuário.
 
-    while tentativas < max_tentativas:
-        try:
-            # Consulta o status do pagamento
-            payment_info = sdk.payment().get(payment_id)
-
-            # Verifica se a resposta é válida
-            if not payment_info or 'response' not in payment_info:
-                logging.warning(f"Resposta inválida ao verificar pagamento {payment_id}")
-                time.sleep(10)
-                tentativas += 1
-                continue
-
-            status = payment_info['response'].get('status')
-            logging.debug(f"Status do pagamento {payment_id}: {status}")
-
-            if status == 'approved':
-                # Pagamento aprovado!
-                logging.info(f"✅ Pagamento {payment_id} APROVADO para usuário {user_id}")
-                bot.send_message(chat_id, "✅ Pagamento aprovado com sucesso!")
-
-                # Tenta aprovar a solicitação no grupo (se o bot for admin)
-                try:
-                    bot.approve_chat_join_request(GROUP_CHAT_ID, user_id)
-                    bot.send_message(chat_id, "🎉 Você foi adicionado ao grupo automaticamente!")
-                    logging.info(f"Usuário {user_id} adicionado ao grupo automaticamente")
-                except Exception as e:
-                    logging.warning(f"Não foi possível aprovar automaticamente usuário {user_id}: {e}")
-                    # Se não conseguir aprovar automaticamente, envia o link
-                    bot.send_message(chat_id, f"🔗 Acesse o grupo através deste link:\n{GROUP_INVITE_LINK}")
-
-                # Remove dos pendentes e salva
-                if payment_id in pagamentos_pendentes:
-                    del pagamentos_pendentes[payment_id]
-                    salvar_pendentes()
-                break
-
-            elif status in ['rejected', 'cancelled']:
-                # Pagamento rejeitado ou cancelado
-                logging.warning(f"❌ Pagamento {payment_id} foi {status}")
-                bot.send_message(chat_id, "❌ Pagamento não foi aprovado. Tente novamente com /pagar")
-                if payment_id in pagamentos_pendentes:
-                    del pagamentos_pendentes[payment_id]
-                    salvar_pendentes()
-                break
-
-            # Aguarda 10 segundos antes de verificar novamente
-            time.sleep(10)
-            tentativas += 1
+    Returns:
+        Pendente | None: O pendente, ou None se outro caminho já o removeu
+    """
+    tentativas_verificacao.pop(payment_id, None)
+    cache_cobrancas.descartar(payment_id)
+    roda_expiracao.esquecer(payment_id)
+    return pagamentos_pendentes.remover(payment_id)
 
-        except Exception as e:
-            logging.error(f"Erro ao verificar pagamento {payment_id}", exc_info=True)
-            time.sleep(10)
-            tentativas += 1
-
-    # Se expirou o tempo
-    if tentativas >= max_tentativas:
-        logging.warning(f"⏰ Tempo expirado para pagamento {payment_id}")
-        bot.send_message(chat_id, "⏰ Tempo de verificação expirou. Se você pagou, entre em contato com o suporte.")
+def _expirar_lote(payment_ids):
+    """
+    Encerra de uma vez os pendentes cujo PIX expirou
+
+    Remove todos com uma única escrita no armazenamento e avisa cada
+    usuário pela fila de envio.
+
+    Returns:
+        int: Quantos foram expirados
+    """
+    removidos = pagamentos_pendentes.remover_varios(payment_ids)
+    if not removidos:
+        return 0
+    expirados = pagamentos_pendentes.marcar_resolvidos(list(removidos), 'expirado')
+    metricas.pagamentos.inc(len(expirados), resultado="expirado")
+    vendas.registrar(EXPIRADO, len(expirados))
+    for payment_id in expirados:
+        info = removidos[payment_id]
+        tentativas_verificacao.pop(payment_id, None)
+        cache_cobrancas.descartar(payment_id)
+        roda_expiracao.esquecer(payment_id)
+        agendador.cancelar(payment_id)
+        logging.warning(f"⏰ Tempo expirado para pagamento {payment_id}",
+                        extra={'payment_id': payment_id, 'user_id': info.user_id, 'status': 'expirado'})
+        enviador.enviar(info.chat_id, "⏰ Tempo de verificação expirou. Se você pagou, entre em contato com o suporte.")
+    return len(expirados)
+
+# Reprovados na verificação final que aguardam o próximo lote de expiração
+_expiracoes_acumuladas = set()
+_expiracoes_lock = threading.Lock()
+
+def _expirar(payment_id):
+    """
+    Põe um pendente reprovado na verificação final no próximo lote de expiração
+
+    As verificações finais de um mesmo tick da roda terminam quase juntas:
+    esperar EXPIRACAO_RESOLUCAO junta as expirações delas em um único
+    _expirar_lote.
+    """
+    with _expiracoes_lock:
+        primeiro = not _expiracoes_acumuladas
+        _expiracoes_acumuladas.add(payment_id)
+    if primeiro:
+        agendador.agendar(CHAVE_EXPIRACOES, config.EXPIRACAO_RESOLUCAO)
+
+def expirar_acumulados():
+    """
+    Expira o lote acumulado por _expirar (executada pelo agendador)
+
+    Returns:
+        None: O próximo lote é agendado pela primeira expiração dele
+    """
+    with _expiracoes_lock:
+        payment_ids = list(_expiracoes_acumuladas)
+        _expiracoes_acumuladas.clear()
+    if payment_ids:
+        _expirar_lote(payment_ids)
+    return None
+
+def _agendar_verificacao_final(payment_ids):
+    """
+    Agenda a verificação final dos pendentes cujo PIX venceu
+
+    Um pagamento feito pouco antes do vencimento só aparece numa consulta
+    feita depois dele; a verificação final (verificar_pagamento) consulta o
+    Mercado Pago e só então aprova ou expira (em lote, por _expirar).
+    """
+    for payment_id in payment_ids:
         if payment_id in pagamentos_pendentes:
-            del pagamentos_pendentes[payment_id]
-            salvar_pendentes()
+            agendador.agendar(payment_id)
+
+# No vencimento do PIX, em lotes por tick, manda os pendentes para a verificação final;
+# os reprovados nela são expirados juntos (_expirar)
+roda_expiracao = RodaExpiracao(_agendar_verificacao_final, resolucao=config.EXPIRACAO_RESOLUCAO)
+
+def _aprovar_no_grupo(user_id):
+    """Aprova o pedido de entrada do usuário no grupo (o bot precisa ser admin)"""
+    with metricas.latencia_telegram.medir(metodo="approveChatJoinRequest"):
+        bot.approve_chat_join_request(GROUP_CHAT_ID, user_id)
+
+def _avisar_admissao(user_id, chat_id, estado):
+    """Informa o usuário sobre a entrada no grupo após o pagamento"""
+    if estado == CONCEDIDO:
+        enviador.enviar(chat_id, "🎉 Você foi adicionado ao grupo automaticamente!")
+    elif estado == AGUARDANDO_PEDIDO:
+        enviador.enviar(chat_id, "🔗 Peça para entrar no grupo por este link; sua entrada será aprovada automaticamente:\n"
+                                 f"{GROUP_INVITE_LINK}")
+    else:
+        # Se não conseguir aprovar automaticamente, envia o link
+        enviador.enviar(chat_id, f"🔗 Acesse o grupo através deste link:\n{GROUP_INVITE_LINK}")
+
+# Aprovações no grupo: fila durável no banco, com taxa limitada e novas tentativas
+fila_grupo = FilaAdmissaoGrupo(
+    ARQUIVO_BANCO,
+    _aprovar_no_grupo,
+    _avisar_admissao,
+    taxa=config.GRUPO_TAXA,
+    lote=config.GRUPO_LOTE,
+    max_tentativas=config.GRUPO_TENTATIVAS_MAX
+)
+
+def _acompanhar(payment_id, info):
+    """Põe na roda de expiração um pendente que acabou de entrar na memória"""
+    roda_expiracao.acompanhar(payment_id, info.expira_em)
+
+def _processar_status(payment_id, status):
+    """
+    Aplica o status consultado no Mercado Pago a um pagamento pendente
+
+    Returns:
+        bool: True se o pagamento foi resolvido (aprovado, rejeitado ou cancelado)
+    """
+    if status not in ['approved', 'rejected', 'cancelled']:
+        return False
+
+    # Remove dos pendentes e salva antes de avisar
+    info = _remover_pendente(payment_id)
+    if info is None:
+        return True
+    if not pagamentos_pendentes.marcar_resolvido(payment_id, status):
+        logging.info(f"Pagamento {payment_id} já foi resolvido por outra instância", extra={'payment_id': payment_id})
+        return True
+
+    user_id = info.user_id
+    chat_id = info.chat_id
+    contexto = {'payment_id': payment_id, 'user_id': user_id, 'status': status}
+
+    if status == 'approved':
+        # Pagamento aprovado!
+        logging.info(f"✅ Pagamento {payment_id} APROVADO para usuário {user_id}", extra=contexto)
+        metricas.pagamentos.inc(resultado="aprovado")
+        metricas.tempo_aprovacao.observar(time.time() - info.criado_em)
+        vendas.registrar_aprovacao(info.valor, time.time() - info.criado_em)
+        enviador.enviar(chat_id, "✅ Pagamento aprovado com sucesso!")
+
+        # A entrada no grupo é aprovada pela fila de admissão, fora desta thread
+        fila_grupo.conceder(payment_id, user_id, chat_id)
+    else:
+        # Pagamento rejeitado ou cancelado
+        logging.warning(f"❌ Pagamento {payment_id} foi {status}", extra=contexto)
+        metricas.pagamentos.inc(resultado="rejeitado")
+        vendas.registrar(REJEITADO)
+        enviador.enviar(chat_id, "❌ Pagamento não foi aprovado. Tente novamente com /pagar")
+
+    return True
+
+def verificar_pagamento(payment_id):
+    """
+    Faz uma verificação do status do pagamento (executada pelo agendador)
+
+    Com o circuito do Mercado Pago aberto, a verificação não conta como
+    tentativa: só é adiada até o circuito aceitar chamadas de novo.
+
+    Depois de `expira_em` é a verificação final: uma última consulta, que
+    aprova o pagamento feito perto do vencimento ou expira o pendente. Se o
+    Mercado Pago não responder em PRAZO_VERIFICACAO_FINAL, expira sem ela.
+
+    Returns:
+        float | None: Segundos até a próxima verificação, ou None para encerrar
+    """
+    info = pagamentos_pendentes.get(payment_id)
+    if info is None:
+        # Já foi resolvido por outro caminho
+        tentativas_verificacao.pop(payment_id, None)
+        return None
+
+    tentativas = tentativas_verificacao.get(payment_id, 0) + 1
+    tentativas_verificacao[payment_id] = tentativas
+
+    agora = time.time()
+    restante = info.expira_em - agora
+    final = restante <= 0
+    if final:
+        if -restante > PRAZO_VERIFICACAO_FINAL:
+            logging.warning(f"Pagamento {payment_id} expirado sem a verificação final: Mercado Pago sem resposta",
+                            extra={'payment_id': payment_id})
+            _expirar(payment_id)
+            return None
+        # Novas tentativas da verificação final não dependem do tempo restante
+        restante = INTERVALO_APOS_ERRO
+
+    if tentativas == 1:
+        logging.info(f"Iniciando verificação do pagamento {payment_id} para usuário {info.user_id}",
+                     extra={'payment_id': payment_id, 'user_id': info.user_id})
+
+    try:
+        # Consulta o status do pagamento
+        payment_info = _chamar_mp("get", config.get_mercadopago_sdk().payment().get, payment_id)
+
+        # Verifica se a resposta é válida
+        if not payment_info or 'response' not in payment_info:
+            logging.warning(f"Resposta inválida ao verificar pagamento {payment_id}", extra={'payment_id': payment_id})
+            return min(INTERVALO_APOS_ERRO, restante)
+
+        status = payment_info['response'].get('status')
+        logging.debug("Status do pagamento %s: %s", payment_id, status, extra={'payment_id': payment_id, 'status': status})
+
+        # 5xx e 429 voltam do disjuntor como resposta, sem status do pagamento
+        if payment_info.get('status') != 200 or not status:
+            logging.warning(f"Mercado Pago respondeu HTTP {payment_info.get('status')} ao verificar pagamento {payment_id}",
+                            extra={'payment_id': payment_id})
+            return min(INTERVALO_APOS_ERRO, restante)
+
+        if final and status != 'approved':
+            # Não foi pago até o vencimento (o Mercado Pago cancela o PIX vencido)
+            _expirar(payment_id)
+            return None
+        if _processar_status(payment_id, status):
+            return None
+
+    except CircuitoAberto as e:
+        # Mercado Pago fora: devolve a tentativa e espera o circuito
+        tentativas_verificacao[payment_id] = tentativas - 1
+        return _espera_circuito(e) if final else min(_espera_circuito(e), restante)
+    except Exception as e:
+        logging.error(f"Erro ao verificar pagamento {payment_id}", exc_info=True, extra={'payment_id': payment_id})
+        return min(INTERVALO_APOS_ERRO, restante)
+
+    # Próxima verificação segundo a política (None: desiste antes da expiração)
+    atraso = politica.proximo_atraso(agora - info.criado_em, restante, tentativas)
+    if atraso is None:
+        _expirar(payment_id)
+    return atraso
+
+def conciliar_pendentes():
+    """
+    Concilia todos os pendentes com uma busca paginada no Mercado Pago
+
+    Usado no modo de verificação em lote: custa uma chamada por página de
+    resultados em vez de uma por pagamento pendente.
+
+    Returns:
+        float: Segundos até a próxima conciliação
+    """
+    pendentes = list(pagamentos_pendentes.items())
+    if not pendentes:
+        return config.INTERVALO_CONCILIACAO
+
+    # Margem para diferenças de relógio com o Mercado Pago
+    desde = datetime.datetime.fromtimestamp(min(info.criado_em for _, info in pendentes) - 300)
+
+    try:
+        status_por_id = conciliacao.consultar_status_em_lote(config.get_mercadopago_sdk(), desde, disjuntor=disjuntor_mp)
+    except CircuitoAberto as e:
+        logging.info(f"Conciliação adiada: circuito do Mercado Pago aberto por mais {e.espera:.0f}s")
+        return max(e.espera, config.INTERVALO_CONCILIACAO)
+    except Exception:
+        logging.error("Erro ao conciliar pagamentos pendentes", exc_info=True)
+        return config.INTERVALO_CONCILIACAO
+
+    resolvidos = 0
+    for payment_id, info in pendentes:
+        status = status_por_id.get(int(payment_id))
+        if status and _processar_status(payment_id, status):
+            resolvidos += 1
+
+    logging.info(f"Conciliação: {len(pendentes)} pendentes, {resolvidos} resolvidos")
+    return config.INTERVALO_CONCILIACAO
+
+def receber_notificacao(payment_id):
+    """
+    Recebe do webhook do Mercado Pago o ID de um pagamento notificado
+
+    Só agenda a consulta (verificar_notificacao), para a resposta HTTP não
+    esperar o Mercado Pago.
+    """
+    try:
+        chave = int(payment_id)
+    except (TypeError, ValueError):
+        logging.warning(f"Notificação com ID de pagamento inválido: {payment_id!r}")
+        return
+    agendador.agendar(f"{PREFIXO_NOTIFICACAO}{chave}", 0)
+
+def verificar_notificacao(chave):
+    """
+    Consulta um pagamento notificado pelo webhook (executada pelo agendador)
+
+    A notificação traz só o ID; o status é consultado e segue o mesmo
+    caminho de aprovação e aviso da verificação por polling.
+
+    Returns:
+        float | None: Segundos até tentar de novo, ou None para encerrar
+    """
+    if chave not in pagamentos_pendentes and config.MULTI_INSTANCIA:
+        # O pendente pode ser de outra instância: assume para responder já
+        info = pagamentos_pendentes.assumir(chave)
+        if info is not None:
+            _acompanhar(chave, info)
+    if chave not in pagamentos_pendentes:
+        logging.debug("Notificação para pagamento %s que não está pendente", chave, extra={'payment_id': chave})
+        return None
+
+    try:
+        payment_info = _chamar_mp("get", config.get_mercadopago_sdk().payment().get, chave)
+        if not payment_info or 'response' not in payment_info:
+            logging.warning(f"Resposta inválida ao consultar pagamento notificado {chave}")
+            return INTERVALO_APOS_ERRO
+        if _processar_status(chave, payment_info['response'].get('status')):
+            agendador.cancelar(chave)
+    except CircuitoAberto as e:
+        logging.info(f"Notificação do pagamento {chave} adiada: circuito do Mercado Pago aberto",
+                     extra={'payment_id': chave})
+        return _espera_circuito(e)
+    except Exception:
+        logging.error(f"Erro ao consultar pagamento notificado {chave}", exc_info=True)
+        return INTERVALO_APOS_ERRO
+    return None
+
+def sincronizar_leases():
+    """
+    Renova os leases desta instância e assume pendentes sem dono
+
+    Pendentes perdidos para outra instância saem da memória e do agendador;
+    os assumidos (novos ou de uma instância que parou) entram no agendador
+    espalhados ao longo do intervalo.
+
+    Returns:
+        float: Segundos até a próxima sincronização
+    """
+    try:
+        perdidos = pagamentos_pendentes.renovar()
+        for payment_id in perdidos:
+            agendador.cancelar(payment_id)
+            roda_expiracao.esquecer(payment_id)
+            tentativas_verificacao.pop(payment_id, None)
+            cache_cobrancas.descartar(payment_id)
+
+        assumidos = pagamentos_pendentes.reivindicar(config.LEASE_LOTE)
+    except Exception:
+        logging.error("Erro ao sincronizar leases", exc_info=True)
+        return config.LEASE_INTERVALO
+
+    for payment_id, info in assumidos.items():
+        _acompanhar(payment_id, info)
+        if info.qr_code:
+            cache_cobrancas.guardar(info.user_id, info.valor, payment_id, info.qr_code, info.expira_em)
+        if not VERIFICACAO_EM_LOTE:
+            agendador.agendar(payment_id, random.uniform(0, config.LEASE_INTERVALO))
+
+    if perdidos or assumidos:
+        logging.info(f"Leases: {len(assumidos)} assumidos, {len(perdidos)} perdidos, {len(pagamentos_pendentes)} com esta instância")
+    return config.LEASE_INTERVALO
+
+def sondar_mercadopago():
+    """
+    Testa a volta do Mercado Pago enquanto o circuito está aberto
+
+    A consulta de métodos de pagamento (leve e sem efeito colateral) serve
+    de chamada de sonda, então o circuito fecha sozinho mesmo sem nenhum
+    /pagar ou verificação chegando.
+
+    Returns:
+        float | None: Segundos até a próxima sonda, ou None com o circuito fechado
+    """
+    if disjuntor_mp.estado == FECHADO:
+        return None
+    try:
+        _chamar_mp("sonda", config.get_mercadopago_sdk().payment_methods().list_all)
+    except CircuitoAberto as e:
+        # Ainda não é hora, ou outra chamada já está sondando
+        return e.espera
+    except Exception as e:
+        logging.warning(f"Sonda do Mercado Pago falhou: {e}")
+    if disjuntor_mp.estado == FECHADO:
+        return None
+    return disjuntor_mp.espera()
+
+def reprocessar_pedidos():
+    """
+    Cria, em ordem de chegada, os PIX dos /pagar guardados durante a queda
+
+    Se o circuito abrir de novo, o restante fica na fila até o próximo
+    fechamento.
+
+    Returns:
+        None: Sempre encerra (o fechamento do circuito agenda a próxima rodada)
+    """
+    criados = 0
+    while disjuntor_mp.estado == FECHADO:
+        pedido = fila_reprocesso.retirar()
+        if pedido is None or not _pagar(*pedido, reprocesso=True):
+            break
+        criados += 1
+    if criados:
+        logging.info(f"🔁 {criados} pedidos de /pagar guardados durante a queda do Mercado Pago atendidos")
+    return None
+
+def _ao_mudar_circuito(estado):
+    """Agenda a sonda quando o circuito abre e o reprocesso quando ele fecha"""
+    if estado == ABERTO:
+        espera = disjuntor_mp.espera()
+        logging.warning(f"⚡ Circuito do Mercado Pago aberto: chamadas recusadas por {espera:.0f}s")
+        agendador.agendar(CHAVE_SONDA, espera)
+    elif estado == FECHADO:
+        logging.info(f"✅ Circuito do Mercado Pago fechado; {len(fila_reprocesso)} pedidos guardados a criar")
+        if fila_reprocesso:
+            agendador.agendar(CHAVE_REPROCESSO)
+
+def gravar_estatisticas():
+    """
+    Grava no banco as estatísticas de vendas acumuladas em memória
+
+    Returns:
+        float: Segundos até a próxima gravação
+    """
+    try:
+        vendas.gravar()
+    except Exception:
+        logging.error("Erro ao gravar estatísticas de vendas", exc_info=True)
+    return config.ESTATISTICAS_INTERVALO
+
+def executar_agendado(chave):
+    """Despacha uma chave vencida do agendador para a rotina correspondente"""
+    if chave == CHAVE_LEASES:
+        return sincronizar_leases()
+    if chave == CHAVE_SONDA:
+        return sondar_mercadopago()
+    if chave == CHAVE_REPROCESSO:
+        return reprocessar_pedidos()
+    if chave == CHAVE_ESTATISTICAS:
+        return gravar_estatisticas()
+    if chave == CHAVE_REINICIO:
+        return buscar_estado_tardio()
+    if chave == CHAVE_EXPIRACOES:
+        return expirar_acumulados()
+    if chave == CHAVE_CONCILIACAO:
+        with metricas.latencia_verificacao.medir(tipo="conciliacao"):
+            return conciliar_pendentes()
+    if isinstance(chave, str) and chave.startswith(PREFIXO_NOTIFICACAO):
+        with metricas.latencia_verificacao.medir(tipo="notificacao"):
+            return verificar_notificacao(int(chave[len(PREFIXO_NOTIFICACAO):]))
+    with metricas.latencia_verificacao.medir(tipo="individual"):
+        return verificar_pagamento(chave)
+
+# Agendador único: um heap de verificações e um pool fixo de workers
+agendador = AgendadorVerificacoes(executar_agendado, workers=config.VERIFICADOR_WORKERS)
+disjuntor_mp.ao_mudar = _ao_mudar_circuito
+
+# Medidores lidos só na exportação de /metrics
+metricas.registro.medidor("bot_pagamentos_pendentes", "Pagamentos aguardando confirmação",
+                          lambda: len(pagamentos_pendentes))
+metricas.registro.medidor("bot_verificacao_fila", "Verificações agendadas",
+                          lambda: agendador.estatisticas()['fila'])
+metricas.registro.medidor("bot_verificacao_atraso_segundos", "Atraso da verificação mais antiga vencida",
+                          lambda: agendador.estatisticas()['atraso_atual'])
+metricas.registro.medidor("bot_envio_fila", "Mensagens aguardando envio ao Telegram",
+                          lambda: enviador.estatisticas()['fila'])
+metricas.registro.medidor("bot_despacho_fila", "Updates do Telegram aguardando um handler",
+                          lambda: despachante.estatisticas()['fila'])
+metricas.registro.medidor("bot_despacho_recusados", "Updates do Telegram descartados com a fila de despacho cheia",
+                          lambda: despachante.recusados)
+metricas.registro.medidor("bot_admissao_em_andamento", "Criações de pagamento em andamento no Mercado Pago",
+                          lambda: admissao.estatisticas()['em_andamento'])
+metricas.registro.medidor("bot_admissao_fila", "Pedidos de /pagar esperando vaga para criar o pagamento",
+                          lambda: admissao.estatisticas()['fila'])
+metricas.registro.medidor("bot_mercadopago_circuito_aberto", "1 enquanto o disjuntor do Mercado Pago recusa chamadas",
+                          lambda: int(disjuntor_mp.estado != FECHADO))
+metricas.registro.medidor("bot_mercadopago_recusadas", "Chamadas ao Mercado Pago recusadas pelo disjuntor",
+                          lambda: disjuntor_mp.recusadas)
+metricas.registro.medidor("bot_reprocesso_fila", "Pedidos de /pagar guardados até o Mercado Pago voltar",
+                          lambda: len(fila_reprocesso))
+metricas.registro.medidor("bot_grupo_fila", "Entradas no grupo aguardando aprovação",
+                          lambda: fila_grupo.estatisticas()['pendente'])
+metricas.registro.medidor("bot_logs_descartados", "Eventos de log descartados com a fila de logs cheia",
+                          log_estruturado.descartados)
+
+def _resumo_mercadopago():
+    """Prontidão do SDK para o /debug"""
+    estado = config.estado_mercadopago()
+    if not estado['pronto']:
+        return f"⏳ aquecendo ({estado['ultimo_erro'] or 'sem resposta ainda'})"
+    idade = time.time() - estado['ultimo_sucesso']
+    situacao = '✅' if estado['saudavel'] else f"⚠️ {estado['falhas_seguidas']} falhas ({estado['ultimo_erro']})"
+    return f"{situacao} {estado['metodos']} métodos em cache, atualizado há {idade:.0f}s"
+
+def _resumo_circuito():
+    """Estado do disjuntor do Mercado Pago para o /debug"""
+    circuito = disjuntor_mp.estatisticas()
+    resumo = f"{circuito['estado']}, {circuito['erros']}/{circuito['chamadas']} erros e {circuito['lentas']} lentas na janela"
+    if circuito['estado'] != FECHADO:
+        resumo += f", sonda em {circuito['espera']:.0f}s"
+    return f"{resumo} ({circuito['aberturas']} aberturas, {circuito['recusadas']} recusadas, {len(fila_reprocesso)} /pagar guardados)"
+
+def _resumo_latencia(histograma, **rotulos):
+    """Formata p50/p99 (em ms) de um histograma para o /debug"""
+    resumo = histograma.resumo(**rotulos)
+    if not resumo['total']:
+        return "sem dados"
+    return f"p50 ≤{resumo['p50'] * 1000:.0f}ms, p99 ≤{resumo['p99'] * 1000:.0f}ms ({resumo['total']} chamadas)"
 
 @bot.message_handler(commands=['start'])
 def cmd_start(message):
@@ -156,21 +754,105 @@ Use /pagar para gerar um PIX de R$ 25 e ter acesso ao grupo VIP.
 
 Após o pagamento, você será adicionado automaticamente!
 """
-    bot.send_message(message.from_user.id, welcome_msg)
+    enviador.enviar(message.from_user.id, welcome_msg)
 
-@bot.message_handler(commands=['pagar'])
-def cmd_pagar(message):
-    logging.info(f"Comando /pagar recebido de {message.from_user.id} ({message.from_user.username})")
+def _enviar_pix(user_id, pix_copia_cola, expira_em):
+    """Envia ao usuário o código PIX copia-cola e as instruções"""
+    restante = max(0, int(expira_em - time.time()))
+    if restante >= VALIDADE_PIX.total_seconds() - 60:
+        validade = "24 horas"
+    else:
+        validade = f"{restante // 3600}h{(restante % 3600) // 60:02d}min"
+    valor_fmt = f"{VALOR_ACESSO:.2f}".replace('.', ',')
+
+    enviador.enviar(user_id, 
+                    "💰 <b>PIX gerado com sucesso!</b>\n\n"
+                    f"Valor: R$ {valor_fmt}\n"
+                    f"Validade: {validade}\n\n"
+                    "📱 Copie o código abaixo e cole no seu app de pagamento:",
+                    parse_mode='HTML')
+
+    enviador.enviar(user_id, 
+                    f'<code>{pix_copia_cola}</code>',
+                    parse_mode='HTML',
+                    agrupavel=False)
+
+    enviador.enviar(user_id,
+                    "⏳ Aguardando confirmação do pagamento...\n"
+                    "Assim que o pagamento for confirmado, você será adicionado ao grupo automaticamente!")
 
+def _pix_disponivel():
+    """
+    Confere no cache de métodos do Mercado Pago se o PIX aceita VALOR_ACESSO
+
+    Sem o cache carregado (aquecimento ainda não terminou), não bloqueia:
+    a criação do pagamento decide.
+    """
+    if not config.estado_mercadopago()['metodos']:
+        return True
+    pix = config.metodo_pagamento('pix')
+    if pix is None or pix.get('status', 'active') != 'active':
+        return False
+    minimo = pix.get('min_allowed_amount')
+    maximo = pix.get('max_allowed_amount')
+    return (minimo is None or VALOR_ACESSO >= minimo) and (maximo is None or VALOR_ACESSO <= maximo)
+
+def _pagar(user_id, chat_id, reprocesso=False):
+    """
+    Envia ao usuário um PIX: reaproveita o ainda válido ou cria um novo
+
+    Com o circuito do Mercado Pago aberto, o pedido é guardado em
+    fila_reprocesso e criado quando o serviço voltar.
+
+    Args:
+        reprocesso: True para um pedido guardado (já passou pela admissão)
+
+    Returns:
+        bool: False se o circuito continuava aberto e o pedido guardado
+        voltou para a fila
+    """
     try:
-        # Cria o pagamento
-        payment = create_payment(25, message.from_user.id)
+        # Reaproveita o PIX ainda válido de um /pagar anterior
+        cobranca = cache_cobrancas.obter(user_id, VALOR_ACESSO)
+        if cobranca is not None and cobranca[0] in pagamentos_pendentes:
+            payment_id, pix_copia_cola, expira_em = cobranca
+            logging.info(f"♻️ Reenviando PIX {payment_id} ainda válido para usuário {user_id}",
+                         extra={'payment_id': payment_id, 'user_id': user_id})
+            metricas.pagamentos.inc(resultado="reaproveitado")
+            vendas.registrar(REAPROVEITADO)
+            _enviar_pix(user_id, pix_copia_cola, expira_em)
+            return True
 
-        # DEBUG: Mostra a resposta completa do Mercado Pago
-        print("DEBUG >>> Resposta bruta do Mercado Pago:", json.dumps(payment, indent=2, ensure_ascii=False))
+        if not _pix_disponivel():
+            logging.warning(f"PIX indisponível no Mercado Pago, /pagar de {user_id} recusado",
+                            extra={'user_id': user_id})
+            enviador.enviar(user_id, "⚠️ O pagamento por PIX está indisponível no momento. Tente novamente mais tarde.")
+            return True
 
-        # Debug: mostra a resposta completa no console
-        logging.debug(f"Resposta do Mercado Pago: {payment}")
+        # Só cria um PIX novo se houver vaga para o usuário e para o processo
+        recusa = None if reprocesso else admissao.entrar(user_id)
+        if recusa is not None:
+            motivo, espera = recusa
+            logging.warning(f"🚦 /pagar de {user_id} recusado ({motivo})",
+                            extra={'user_id': user_id})
+            if motivo == RECUSA_USUARIO:
+                enviador.enviar(user_id,
+                                f"⏳ Você gerou vários PIX em pouco tempo. Tente novamente em {max(1, round(espera))}s.")
+            else:
+                enviador.enviar(user_id,
+                                "🚦 Muitos pedidos neste momento. Tente novamente em alguns segundos.")
+            return True
+
+        # Cria o pagamento
+        try:
+            payment = create_payment(VALOR_ACESSO, user_id)
+        finally:
+            if not reprocesso:
+                admissao.sair()
+
+        # Só o resumo: a resposta completa traz dados do pagador
+        logging.debug("Resposta do Mercado Pago ao criar pagamento: HTTP %s", (payment or {}).get('status'),
+                      extra={'user_id': user_id})
 
         # Validação mais robusta da resposta
         if not payment:
@@ -204,59 +886,89 @@ def cmd_pagar(message):
         if not pix_copia_cola:
             raise Exception("Código PIX copia-cola não gerado")
 
-        # Armazena o pagamento pendente
-        pagamentos_pendentes[payment_id] = {
-            'user_id': message.from_user.id,
-            'chat_id': message.chat.id,
-            'timestamp': str(datetime.datetime.now())  # Convertido para string para JSON
-        }
-        salvar_pendentes()  # Salva imediatamente
+        # Armazena o pagamento pendente (e salva imediatamente)
+        # Vale a expiração que o Mercado Pago registrou, não a que pedimos
+        agora = time.time()
+        expira_em = _ler_expiracao(payment['response'], agora + VALIDADE_PIX.total_seconds())
+        pagamentos_pendentes.adicionar(Pendente(
+            payment_id,
+            user_id=user_id,
+            chat_id=chat_id,
+            valor=VALOR_ACESSO,
+            criado_em=agora,
+            expira_em=expira_em,
+            qr_code=pix_copia_cola
+        ))
+        roda_expiracao.acompanhar(payment_id, expira_em)
+        cache_cobrancas.guardar(user_id, VALOR_ACESSO, payment_id, pix_copia_cola, expira_em)
 
-        logging.info(f"✅ Pagamento {payment_id} criado com sucesso para usuário {message.from_user.id}")
+        logging.info(f"✅ Pagamento {payment_id} criado com sucesso para usuário {user_id}",
+                     extra={'payment_id': payment_id, 'user_id': user_id})
+        metricas.pagamentos.inc(resultado="criado")
+        vendas.registrar(CRIADO)
 
         # Envia o código PIX
-        bot.send_message(message.from_user.id, 
-                        "💰 <b>PIX gerado com sucesso!</b>\n\n"
-                        "Valor: R$ 25,00\n"
-                        "Validade: 24 horas\n\n"
-                        "📱 Copie o código abaixo e cole no seu app de pagamento:",
-                        parse_mode='HTML')
-
-        bot.send_message(message.from_user.id, 
-                        f'<code>{pix_copia_cola}</code>',
-                        parse_mode='HTML')
-
-        bot.send_message(message.from_user.id,
-                        "⏳ Aguardando confirmação do pagamento...\n"
-                        "Assim que o pagamento for confirmado, você será adicionado ao grupo automaticamente!")
-
-        # Inicia verificação em thread separada
-        thread = threading.Thread(target=verificar_pagamento, 
-                                 args=(payment_id, message.from_user.id, message.chat.id))
-        thread.daemon = True
-        thread.start()
+        _enviar_pix(user_id, pix_copia_cola, expira_em)
 
-    except Exception as e:
-        import traceback
-        erro = traceback.format_exc()
-        logging.error(f"Erro detalhado ao criar pagamento para usuário {message.from_user.id}:\n{erro}")
-        bot.send_message(message.from_user.id, "❌ Erro interno ao gerar PIX. Verifique os logs.")
+        # Agenda a verificação no agendador compartilhado
+        # (no modo em lote, a conciliação periódica já cobre este pagamento)
+        if not VERIFICACAO_EM_LOTE:
+            agendador.agendar(payment_id)
+
+    except CircuitoAberto as e:
+        if reprocesso:
+            fila_reprocesso.devolver(user_id, chat_id)
+            return False
+        if fila_reprocesso.guardar(user_id, chat_id):
+            logging.warning(f"⚡ /pagar de {user_id} guardado: circuito do Mercado Pago aberto",
+                            extra={'user_id': user_id})
+            enviador.enviar(user_id,
+                            "⚠️ O Mercado Pago está instável no momento. Seu pedido foi guardado e o PIX "
+                            "será enviado aqui assim que o serviço voltar.")
+        else:
+            logging.warning(f"⚡ /pagar de {user_id} recusado: circuito aberto e fila de reprocesso cheia",
+                            extra={'user_id': user_id})
+            enviador.enviar(user_id,
+                            f"⚠️ O Mercado Pago está fora do ar no momento. Tente novamente em {max(1, round(e.espera / 60))} min.")
+    except Exception:
+        logging.error(f"Erro ao criar pagamento para usuário {user_id}", exc_info=True, extra={'user_id': user_id})
+        enviador.enviar(user_id, "❌ Erro interno ao gerar PIX. Verifique os logs.")
+
+    return True
+
+@bot.message_handler(commands=['pagar'])
+def cmd_pagar(message):
+    logging.info(f"Comando /pagar recebido de {message.from_user.id} ({message.from_user.username})")
+    vendas.registrar(PEDIDO)
+    _pagar(message.from_user.id, message.chat.id)
+
+@bot.chat_join_request_handler()
+def pedido_entrada(pedido):
+    """Aprova o pedido de entrada no grupo de quem já pagou"""
+    if pedido.chat.id != GROUP_CHAT_ID:
+        return
+    if fila_grupo.pedido_recebido(pedido.from_user.id):
+        logging.info(f"Pedido de entrada de {pedido.from_user.id} recebido; aprovação liberada",
+                     extra={'user_id': pedido.from_user.id})
 
 @bot.message_handler(commands=['status'])
 def cmd_status(message):
     """Comando para verificar se há pagamento pendente"""
     logging.info(f"Comando /status recebido de {message.from_user.id}")
 
-    user_pendente = False
-    for payment_id, info in pagamentos_pendentes.items():
-        if info['user_id'] == message.from_user.id:
-            user_pendente = True
-            break
+    pendentes_usuario = pagamentos_pendentes.do_usuario(message.from_user.id)
 
-    if user_pendente:
-        bot.send_message(message.from_user.id, "⏳ Você tem um pagamento pendente sendo verificado...")
+    if pendentes_usuario:
+        agora = time.time()
+        msg = "⏳ Você tem pagamento(s) pendente(s) sendo verificado(s):\n"
+        for payment_id, info in pendentes_usuario:
+            restante = max(0, int(info.expira_em - agora))
+            horas, minutos = restante // 3600, (restante % 3600) // 60
+            valor_fmt = f"{info.valor:.2f}".replace('.', ',')
+            msg += f"\n• ID {payment_id}: R$ {valor_fmt} (expira em {horas}h{minutos:02d}min)"
+        enviador.enviar(message.from_user.id, msg)
     else:
-        bot.send_message(message.from_user.id, "✅ Você não tem pagamentos pendentes.")
+        enviador.enviar(message.from_user.id, "✅ Você não tem pagamentos pendentes.")
 
 # Comando admin para debug (opcional)
 @bot.message_handler(commands=['debug'])
@@ -264,51 +976,390 @@ def cmd_debug(message):
     """Comando de debug - apenas para admin"""
     if str(message.from_user.id) == str(MY_CHAT_ID):
         logging.info(f"Comando /debug executado pelo admin")
+        fila = agendador.estatisticas()
+        envio = enviador.estatisticas()
+        vagas = admissao.estatisticas()
+        updates = despachante.estatisticas()
+        grupo = fila_grupo.estatisticas()
         info = f"""
 🔧 DEBUG INFO:
-- Pagamentos pendentes: {len(pagamentos_pendentes)}
+- Pagamentos pendentes: {len(pagamentos_pendentes)}{f" (instância {config.INSTANCIA_ID})" if config.MULTI_INSTANCIA else ""}
+- Fila de verificação: {fila['fila']} ({fila['em_execucao']} em execução, {fila['workers']} workers)
+- Atraso da verificação: {fila['atraso_atual']:.1f}s (máx. {fila['atraso_maximo']:.1f}s)
+- Expiração automática: {len(roda_expiracao)} acompanhados, {roda_expiracao.expiradas} vencidos
+- Threads ativas: {threading.active_count()}
+- Updates: {updates['fila_rapida']} rápidos e {updates['fila_lenta']} lentos na fila, {updates['em_execucao']} em execução, {updates['recusados']} recusados
+- Espera por handler: rápidos {_resumo_latencia(metricas.espera_despacho, faixa="rapida")}; lentos {_resumo_latencia(metricas.espera_despacho, faixa="lenta")}
+- Admissão: {vagas['em_andamento']}/{vagas['max_simultaneas']} criações, {vagas['fila']} na fila, {metricas.admissao.total() - metricas.admissao.valor(resultado="admitido")} recusados
+- Entradas no grupo: {grupo['pendente']} na fila, {grupo['aguardando_pedido']} aguardando pedido, {grupo['concedido']} aprovadas, {grupo['falhou']} com link
+- Fila de envio: {envio['fila']} mensagens ({envio['agrupadas']} agrupadas, {envio['limitadas']} 429)
+- MP create: {_resumo_latencia(metricas.latencia_mp, operacao="create")}
+- MP get: {_resumo_latencia(metricas.latencia_mp, operacao="get")}
+- Telegram envio: {_resumo_latencia(metricas.latencia_telegram, metodo="sendMessage")}
+- Pagamentos: {metricas.pagamentos.valor(resultado="criado")} criados, {metricas.pagamentos.valor(resultado="aprovado")} aprovados, {metricas.pagamentos.valor(resultado="expirado")} expirados
+- Erros MP: {metricas.erros_mp.total()}
 - Token MP: {'✅' if TOKEN_MERCADOPAGO else '❌'}
+- Mercado Pago: {_resumo_mercadopago()}
+- Circuito MP: {_resumo_circuito()}
 - Token Bot: {'✅' if TOKEN_BOT else '❌'}
 - Group ID: {GROUP_CHAT_ID}
 - Admin ID: {MY_CHAT_ID}
-- Arquivo pendentes: {'✅ Existe' if os.path.exists(ARQUIVO_PENDENTES) else '❌ Não existe'}
+- Armazenamento ({config.PERSISTENCIA}): {'✅ Existe' if armazenamento.existe() else '❌ Não existe'}
 """
-        bot.send_message(message.from_user.id, info)
+        enviador.enviar(message.from_user.id, info)
     else:
         logging.warning(f"Tentativa de /debug por usuário não autorizado: {message.from_user.id}")
 
+def _formatar_duracao(segundos):
+    """Duração curta para o /stats (ex.: 45s, 12min, 3h)"""
+    if segundos is None:
+        return "-"
+    if segundos == float("inf"):
+        return ">24h"
+    if segundos < 60:
+        return f"{segundos:.0f}s"
+    if segundos < 3600:
+        return f"{segundos / 60:.0f}min"
+    return f"{segundos / 3600:.1f}h".replace('.', ',')
+
+def _formatar_janela(nome, janela):
+    """Bloco de uma janela do /stats"""
+    receita = f"{janela['receita']:.2f}".replace('.', ',')
+    conversao = f"{janela['conversao']:.0%}" if janela['conversao'] is not None else "-"
+    ticket = f"R$ {janela['ticket_medio']:.2f}".replace('.', ',') if janela['ticket_medio'] is not None else "-"
+    return (f"📅 {nome}\n"
+            f"- Funil: {janela['pedidos']} /pagar → {janela['enviados']} PIX enviados ({janela['criados']} novos) → "
+            f"{janela['aprovados']} aprovados\n"
+            f"- Conversão (aprovados/criados): {conversao}\n"
+            f"- Rejeitados: {janela['rejeitados']}, expirados: {janela['expirados']}\n"
+            f"- Receita: R$ {receita}\n"
+            f"- Ticket médio: {ticket}\n"
+            f"- Tempo até pagar: médio {_formatar_duracao(janela['tempo_medio'])}, "
+            f"p50 ≤{_formatar_duracao(janela['tempo_p50'])}, p90 ≤{_formatar_duracao(janela['tempo_p90'])}")
+
+@bot.message_handler(commands=['stats'])
+def cmd_stats(message):
+    """Vendas, funil e tempo até o pagamento - apenas para admin"""
+    if str(message.from_user.id) != str(MY_CHAT_ID):
+        logging.warning(f"Tentativa de /stats por usuário não autorizado: {message.from_user.id}")
+        return
+    logging.info("Comando /stats executado pelo admin")
+    resumo = vendas.resumo()
+    blocos = [_formatar_janela(nome, janela) for nome, janela in resumo.items()]
+    blocos.append(f"⏳ Pendentes agora: {len(pagamentos_pendentes)}")
+    enviador.enviar(message.from_user.id, "📊 ESTATÍSTICAS DE VENDAS\n\n" + "\n\n".join(blocos))
+
 # Comando para limpar pendentes antigos (admin)
 @bot.message_handler(commands=['limpar_pendentes'])
 def cmd_limpar_pendentes(message):
-    """Remove pagamentos pendentes com mais de 24h"""
+    """Manda na hora para a verificação final os pagamentos pendentes com mais de 24h"""
     if str(message.from_user.id) == str(MY_CHAT_ID):
-        removidos = 0
-        agora = datetime.datetime.now()
+        limite = time.time() - 86400
+        antigos = [payment_id for payment_id, info in pagamentos_pendentes.items() if info.criado_em < limite]
+        _agendar_verificacao_final(antigos)
+        cache_cobrancas.remover_expirados()
+
+        msg = f"🧹 Limpeza iniciada!\n"
+        msg += f"Em verificação final: {len(antigos)} pagamentos antigos (expiram se não foram pagos)\n"
+        msg += f"Pendentes: {len(pagamentos_pendentes)} pagamentos"
+
+        enviador.enviar(message.from_user.id, msg)
+        logging.info(f"Limpeza de pendentes: {len(antigos)} em verificação final")
+
+def retomar_pendentes():
+    """
+    Carrega os pendentes salvos e agenda sua retomada de forma escalonada
+
+    Não faz chamadas de rede: os vencidos vão para a verificação final e,
+    como os demais, entram no agendador em lotes de RECUPERACAO_LOTE, um lote a cada
+    RECUPERACAO_INTERVALO segundos com atraso aleatório dentro do intervalo.
+    Assim o bot começa a atender enquanto o backlog ainda está sendo
+    conciliado, sem uma rajada de consultas logo após o deploy.
+
+    Com MULTI_INSTANCIA, nada é carregado de uma vez: a instância assume os
+    pendentes aos poucos, por leases, junto com as demais.
+    """
+    if config.MULTI_INSTANCIA:
+        logging.info(f"🧩 Instância {config.INSTANCIA_ID}: pendentes divididos por leases de {config.LEASE_DURACAO:.0f}s")
+        # Leases com este ID são de uma vida anterior do processo (restart com o mesmo
+        # INSTANCIA_ID) e não estão na memória: devolve para serem reivindicados
+        pagamentos_pendentes.liberar()
+        agendador.agendar(CHAVE_LEASES)
+        if VERIFICACAO_EM_LOTE:
+            agendador.agendar(CHAVE_CONCILIACAO)
+        return
+
+    carregar_pendentes()
+    for payment_id, info in pagamentos_pendentes.items():
+        _acompanhar(payment_id, info)
+
+    expirados = roda_expiracao.girar()
+    if expirados:
+        logging.info(f"⏰ {len(expirados)} pendentes já vencidos: verificação final antes de expirar")
+
+    _aquecer_cache_cobrancas()
+
+    # Se o processo anterior encerrou graciosamente, continua de onde ele parou
+    agendados = set()
+    estado = estado_reinicio.retirar(espera=config.ENCERRAMENTO_TIMEOUT + 10)
+    if estado is not None:
+        agendados = _aplicar_estado(estado[0])
+        logging.info(f"♻️ Estado do encerramento anterior (há {time.time() - estado[1]:.0f}s) retomado")
+    else:
+        agendador.agendar(CHAVE_REINICIO, INTERVALO_ESTADO_TARDIO)
+
+    # Verifica se há pagamentos pendentes para retomar
+    restantes = [payment_id for payment_id in pagamentos_pendentes if payment_id not in agendados]
+    if restantes:
+        logging.info(f"⚠️ Retomando verificação de {len(restantes)} pagamentos pendentes")
+        if not VERIFICACAO_EM_LOTE:
+            intervalo = config.RECUPERACAO_INTERVALO
+            for i, payment_id in enumerate(restantes):
+                lote = i // config.RECUPERACAO_LOTE
+                agendador.agendar(payment_id, lote * intervalo + random.uniform(0, intervalo))
+
+    if VERIFICACAO_EM_LOTE:
+        logging.info(f"🔄 Verificação em lote a cada {config.INTERVALO_CONCILIACAO}s")
+        if not agendador.agendado(CHAVE_CONCILIACAO):
+            agendador.agendar(CHAVE_CONCILIACAO)
+
+def _salvar_estado():
+    """
+    Grava para o próximo processo o que não está no armazenamento
+
+    Returns:
+        dict: O estado salvo
+    """
+    pedidos = []
+    while True:
+        pedido = fila_reprocesso.retirar()
+        if pedido is None:
+            break
+        pedidos.append(pedido)
+    dados = {
+        'agenda': [(chave, quando) for chave, quando in agendador.exportar()
+                   if chave == CHAVE_CONCILIACAO or chave in pagamentos_pendentes
+                   or (isinstance(chave, str) and chave.startswith(PREFIXO_NOTIFICACAO))],
+        'tentativas': list(tentativas_verificacao.items()),
+        'mensagens': enviador.retirar_pendentes(),
+        'reprocesso': pedidos,
+    }
+    estado_reinicio.gravar(dados)
+    return dados
+
+def _aplicar_estado(dados, tardio=False):
+    """
+    Retoma o estado salvo pelo processo anterior ao encerrar
+
+    Cada pendente volta a ser verificado no horário que estava agendado; os
+    que venceram durante a troca de processo são espalhados em lotes, como
+    na retomada normal. Mensagens que não chegaram a sair são enviadas
+    agora (só saem uma vez: o processo anterior as retirou da fila).
+
+    Args:
+        tardio: True se o processo anterior encerrou depois deste começar;
+            traz do armazenamento os pendentes criados por ele nesse meio-tempo,
+            sem mexer nos que este processo já incluiu ou resolveu
+
+    Returns:
+        set: Pendentes agendados a partir do estado
+    """
+    if tardio:
+        try:
+            novos = pagamentos_pendentes.mesclar()
+        except Exception as e:
+            logging.error(f"Erro ao carregar pendentes: {e}")
+            novos = {}
+        for payment_id, info in novos.items():
+            _acompanhar(payment_id, info)
+            if info.qr_code:
+                cache_cobrancas.guardar(info.user_id, info.valor, payment_id, info.qr_code, info.expira_em)
+
+    for payment_id, tentativas in dados.get('tentativas', []):
+        if payment_id in pagamentos_pendentes:
+            tentativas_verificacao[payment_id] = tentativas
+
+    agora = time.time()
+    intervalo = config.RECUPERACAO_INTERVALO
+    agendados = set()
+    vencidos = 0
+    for chave, quando in dados.get('agenda', []):
+        if chave == CHAVE_CONCILIACAO:
+            if VERIFICACAO_EM_LOTE:
+                agendador.agendar(chave, quando - agora)
+            continue
+        if isinstance(chave, str) and chave.startswith(PREFIXO_NOTIFICACAO):
+            agendador.agendar(chave, 0)
+            continue
+        if VERIFICACAO_EM_LOTE or chave not in pagamentos_pendentes:
+            continue
+        if quando > agora:
+            agendador.agendar(chave, quando - agora)
+        else:
+            lote = vencidos // config.RECUPERACAO_LOTE
+            agendador.agendar(chave, lote * intervalo + random.uniform(0, intervalo))
+            vencidos += 1
+        agendados.add(chave)
+
+    if tardio and not VERIFICACAO_EM_LOTE:
+        # Trazidos do armazenamento sem horário salvo: entram como os vencidos
+        for payment_id in novos:
+            if payment_id not in agendados and not agendador.agendado(payment_id):
+                lote = vencidos // config.RECUPERACAO_LOTE
+                agendador.agendar(payment_id, lote * intervalo + random.uniform(0, intervalo))
+                vencidos += 1
+                agendados.add(payment_id)
+
+    mensagens = dados.get('mensagens', [])
+    for chat_id, texto, parse_mode, agrupavel in mensagens:
+        enviador.enviar(chat_id, texto, parse_mode=parse_mode, agrupavel=agrupavel)
+
+    for user_id, chat_id in dados.get('reprocesso', []):
+        fila_reprocesso.guardar(user_id, chat_id)
+    if fila_reprocesso:
+        agendador.agendar(CHAVE_REPROCESSO)
+
+    logging.info(f"♻️ Estado retomado: {len(agendados)} verificações nos horários salvos ({vencidos} vencidas), "
+                 f"{len(mensagens)} mensagens a enviar, {len(fila_reprocesso)} pedidos guardados")
+    return agendados
+
+def buscar_estado_tardio():
+    """
+    Procura o estado de um processo anterior que encerrou depois deste começar
 
-        # Cria cópia para iterar
-        pendentes_copy = list(pagamentos_pendentes.items())
+    Returns:
+        float | None: Segundos até a próxima busca, ou None ao fim da janela
+    """
+    try:
+        estado = estado_reinicio.retirar()
+    except Exception:
+        logging.error("Erro ao ler o estado do processo anterior", exc_info=True)
+        estado = None
+    if estado is not None:
+        _aplicar_estado(estado[0], tardio=True)
+        return None
+    if time.monotonic() - INICIO > JANELA_ESTADO_TARDIO:
+        return None
+    return INTERVALO_ESTADO_TARDIO
+
+def iniciar_webhook_mp():
+    """Webhook do Mercado Pago: aprovação detectada assim que notificada"""
+    if not config.MP_WEBHOOK_ATIVO:
+        return
+    if not config.MP_WEBHOOK_SECRET:
+        logging.warning("⚠️ MP_WEBHOOK_SECRET não configurado: todas as notificações serão rejeitadas")
+    receptor_mp = webhook_mp.ReceptorNotificacoesMP(config.MP_WEBHOOK_SECRET, receber_notificacao)
+    servidor_http.registrar_rota("POST", webhook_mp.CAMINHO, receptor_mp.processar)
+    servidor_http.iniciar(config.HTTP_PORTA)
+    logging.info(f"🔔 Webhook do Mercado Pago ativo; polling de segurança a cada {config.INTERVALO_VERIFICACAO_WEBHOOK:.0f}s")
+
+def iniciar_metricas():
+    """Expõe GET /metrics no servidor HTTP embutido"""
+    if not config.METRICAS_ATIVO:
+        return
+    servidor_http.registrar_rota("GET", "/metrics", metricas.registro.rota)
+    servidor_http.iniciar(config.HTTP_PORTA)
+
+def _rota_health(requisicao):
+    """Liveness: o processo responde; o corpo traz a saúde do Mercado Pago"""
+    estado = config.estado_mercadopago()
+    corpo = {'status': 'ok' if estado['saudavel'] else 'degradado', 'mercadopago': estado,
+             'pendentes': len(pagamentos_pendentes)}
+    return 200, json.dumps(corpo), "application/json"
+
+def _rota_ready(requisicao):
+    """Readiness: 503 até o SDK do Mercado Pago estar aquecido"""
+    estado = config.estado_mercadopago()
+    return (200 if estado['pronto'] else 503), json.dumps({'pronto': estado['pronto']}), "application/json"
+
+def iniciar_estatisticas():
+    """Agenda a gravação periódica das estatísticas de vendas"""
+    agendador.agendar(CHAVE_ESTATISTICAS, config.ESTATISTICAS_INTERVALO)
+
+def _confirmar_updates(nao_concluido):
+    """
+    Confirma ao Telegram os updates já processados
 
-        for payment_id, info in pendentes_copy:
-            try:
-                # Converte string de volta para datetime
-                timestamp = datetime.datetime.fromisoformat(info['timestamp'].split('.')[0])
-                diferenca = agora - timestamp
+    O Telegram só dá um update por entregue quando um getUpdates pede um
+    offset maior que o dele; sem essa chamada, o próximo processo receberia
+    de novo os últimos updates processados aqui. Os não concluídos (a partir
+    de `nao_concluido`) ficam para ele.
+    """
+    offset = nao_concluido if nao_concluido is not None else bot.last_update_id + 1
+    if offset <= 1:
+        return
+    try:
+        bot.get_updates(offset=offset, limit=1, timeout=5, long_polling_timeout=0)
+    except Exception as e:
+        logging.warning(f"Não foi possível confirmar os updates processados: {e}")
+
+def encerrar(confirmar_updates=False):
+    """
+    Encerramento gracioso, depois que o processo parou de buscar updates
+
+    Dentro de ENCERRAMENTO_TIMEOUT, em ordem: fecha o servidor HTTP (Telegram
+    e Mercado Pago reenviam ao próximo processo), processa os updates já
+    aceitos, espera as verificações em andamento, para a expiração e a fila
+    do grupo e esvazia a fila de envio. Por fim grava as estatísticas e o
+    estado para o próximo processo (agenda com os horários de cada
+    verificação, tentativas, mensagens que não saíram e pedidos guardados).
+    Com MULTI_INSTANCIA, devolve os leases no lugar de salvar o estado.
 
-                if diferenca.total_seconds() > 86400:  # 24 horas
-                    del pagamentos_pendentes[payment_id]
-                    removidos += 1
-                    logging.info(f"Removido pagamento antigo: {payment_id}")
-            except Exception as e:
-                logging.error(f"Erro ao processar pendente {payment_id}: {e}")
+    Args:
+        confirmar_updates: No polling, confirma ao Telegram os updates
+            processados, para que não voltem para o próximo processo
+    """
+    limite = time.monotonic() + config.ENCERRAMENTO_TIMEOUT
 
-        salvar_pendentes()
+    def restante():
+        return max(0.0, limite - time.monotonic())
 
-        msg = f"🧹 Limpeza concluída!\n"
-        msg += f"Removidos: {removidos} pagamentos antigos\n"
-        msg += f"Restantes: {len(pagamentos_pendentes)} pagamentos"
+    logging.info(f"🛑 Encerrando: até {config.ENCERRAMENTO_TIMEOUT:.0f}s para concluir o que está em andamento")
+    if not config.MULTI_INSTANCIA:
+        estado_reinicio.iniciar_encerramento()
+    servidor_http.parar()
 
-        bot.send_message(message.from_user.id, msg)
-        logging.info(f"Limpeza de pendentes: {removidos} removidos")
+    nao_concluido = despachante.parar(restante())
+    if nao_concluido is not None:
+        logging.warning(f"Updates a partir de {nao_concluido} não concluídos; ficam para o próximo processo")
+    if confirmar_updates:
+        _confirmar_updates(nao_concluido)
+
+    if not agendador.parar(restante()):
+        logging.warning("Verificações ainda em andamento no fim do prazo de encerramento")
+    roda_expiracao.parar(restante())
+    expirar_acumulados()
+    fila_grupo.parar(restante())
+    if not enviador.aguardar_vazio(restante()):
+        logging.warning("Fila de envio não esvaziou no prazo; o restante fica para o próximo processo")
+    enviador.parar(restante())
+
+    gravar_estatisticas()
+    if config.MULTI_INSTANCIA:
+        # Outra instância assume os pendentes sem esperar o lease vencer
+        pagamentos_pendentes.liberar()
+    else:
+        try:
+            dados = _salvar_estado()
+            logging.info(f"💾 Estado salvo para o próximo processo: {len(dados['agenda'])} agendamentos, "
+                         f"{len(dados['mensagens'])} mensagens, {len(dados['reprocesso'])} pedidos guardados")
+        except Exception:
+            logging.error("Erro ao salvar o estado para o próximo processo", exc_info=True)
+    armazenamento.fechar()
+    logging.info("Bot encerrado")
+    log_estruturado.encerrar()
+
+def _ao_sinal(signum, frame):
+    # Só sinaliza: o encerramento roda na thread principal, fora do handler
+    parada.set()
+
+def iniciar_saude():
+    """Expõe GET /health e GET /ready no servidor HTTP embutido"""
+    if not config.SAUDE_ATIVO:
+        return
+    servidor_http.registrar_rota("GET", "/health", _rota_health)
+    servidor_http.registrar_rota("GET", "/ready", _rota_ready)
+    servidor_http.iniciar(config.HTTP_PORTA)
 
 if __name__ == "__main__":
     logging.info("="*50)
@@ -318,22 +1369,67 @@ if __name__ == "__main__":
     logging.info(f"🔑 Token MP: {'Configurado' if TOKEN_MERCADOPAGO else 'NÃO CONFIGURADO!'}")
     logging.info("="*50)
 
-    # Carrega pagamentos pendentes salvos
-    carregar_pendentes()
+    # SIGTERM (restart e deploy) e CTRL+C encerram graciosamente
+    signal.signal(signal.SIGTERM, _ao_sinal)
+    signal.signal(signal.SIGINT, _ao_sinal)
 
-    # Verifica se há pagamentos pendentes para retomar
-    if pagamentos_pendentes:
-        logging.info(f"⚠️ Retomando verificação de {len(pagamentos_pendentes)} pagamentos pendentes")
-        for payment_id, info in pagamentos_pendentes.items():
-            thread = threading.Thread(
-                target=verificar_pagamento, 
-                args=(payment_id, info['user_id'], info['chat_id'])
-            )
-            thread.daemon = True
-            thread.start()
+    # Abre conexões e carrega os métodos de pagamento sem atrasar a inicialização
+    config.aquecer_mercadopago()
+
+    retomar_pendentes()
+    iniciar_estatisticas()
+    enviador.iniciar()
+    despachante.iniciar()
+    fila_grupo.iniciar()
+    agendador.iniciar()
+    roda_expiracao.iniciar()
+    iniciar_webhook_mp()
+    iniciar_metricas()
+    iniciar_saude()
 
+    confirmar_updates = False
     try:
-        logging.info("🚀 Bot rodando... (CTRL+C para parar)")
-        bot.infinity_polling(timeout=30, long_polling_timeout=20, none_stop=True, interval=1)
+        if WEBHOOK_TELEGRAM:
+            receptor_telegram = webhook_telegram.ReceptorUpdatesTelegram(
+                bot,
+                segredo=config.TELEGRAM_WEBHOOK_SECRET,
+                tamanho_fila=config.TELEGRAM_FILA_MAX,
+                workers=config.TELEGRAM_WORKERS,
+                despachante=despachante
+            )
+            receptor_telegram.iniciar()
+            servidor_http.registrar_rota("POST", webhook_telegram.CAMINHO, receptor_telegram.processar)
+            servidor_http.iniciar(config.HTTP_PORTA)
+
+            if config.TELEGRAM_WEBHOOK_URL:
+                bot.set_webhook(
+                    url=config.TELEGRAM_WEBHOOK_URL.rstrip("/") + webhook_telegram.CAMINHO,
+                    secret_token=config.TELEGRAM_WEBHOOK_SECRET,
+                    max_connections=config.TELEGRAM_WORKERS * 10
+                )
+            else:
+                logging.warning("⚠️ TELEGRAM_WEBHOOK_URL não configurada: webhook não registrado no Telegram")
+
+            logging.info("🚀 Bot rodando via webhook... (CTRL+C para parar)")
+            parada.wait()
+        elif config.MODO_TELEGRAM == "nenhum":
+            # Instância extra: só verifica os pendentes que assumir e avisa os usuários
+            logging.info("🚀 Bot rodando sem receber updates (só verificação)... (CTRL+C para parar)")
+            parada.wait()
+        else:
+            # O polling fica em outra thread para que o sinal não espere o long polling terminar
+            logging.info("🚀 Bot rodando... (CTRL+C para parar)")
+            polling = threading.Thread(
+                target=bot.infinity_polling,
+                kwargs={'timeout': 30, 'long_polling_timeout': 20, 'none_stop': True, 'interval': 1},
+                name="polling"
+            )
+            polling.daemon = True
+            polling.start()
+            parada.wait()
+            bot.stop_polling()
+            confirmar_updates = True
+        logging.info("🛑 Sinal de encerramento recebido")
     except Exception as e:
         logging.error("Erro crítico no bot", exc_info=True)
+    encerrar(confirmar_updates=confirmar_updates)
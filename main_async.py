@@ -0,0 +1,114 @@
+"""
+Modo de execução asyncio (opcional): python main_async.py
+
+Os updates chegam pelo AsyncTeleBot e as verificações rodam no
+AgendadorAssincrono. As chamadas bloqueantes ao SDK do Mercado Pago vão
+para um executor limitado, então o número de threads fica fixo mesmo com
+dezenas de milhares de pagamentos pendentes. A lógica de pagamento é a
+mesma do main.py; só a forma de executar muda.
+
+Requer aiohttp (dependência do AsyncTeleBot).
+"""
+import asyncio
+import logging
+import signal
+from concurrent.futures import ThreadPoolExecutor
+
+from telebot.async_telebot import AsyncTeleBot
+
+import config
+import main
+from agendador import AgendadorAssincrono
+
+# Executor único para tudo que bloqueia (SDK do Mercado Pago, aprovação no grupo)
+executor = ThreadPoolExecutor(max_workers=config.ASYNC_EXECUTOR_WORKERS, thread_name_prefix="mp")
+
+# Substitui o agendador com threads pelo assíncrono antes de agendar qualquer coisa
+main.agendador = AgendadorAssincrono(
+    main.executar_agendado,
+    executor,
+    concorrencia=config.ASYNC_EXECUTOR_WORKERS * 4
+)
+
+bot_async = AsyncTeleBot(config.TOKEN_BOT)
+
+async def _em_executor(funcao, *args):
+    return await asyncio.get_running_loop().run_in_executor(executor, funcao, *args)
+
+# Os handlers que só consultam memória e enfileiram mensagens rodam direto no loop
+@bot_async.message_handler(commands=['start'])
+async def cmd_start(message):
+    main.cmd_start(message)
+
+@bot_async.message_handler(commands=['status'])
+async def cmd_status(message):
+    main.cmd_status(message)
+
+@bot_async.message_handler(commands=['debug'])
+async def cmd_debug(message):
+    main.cmd_debug(message)
+
+@bot_async.message_handler(commands=['stats'])
+async def cmd_stats(message):
+    # Lê as estatísticas do banco: fora do loop
+    await _em_executor(main.cmd_stats, message)
+
+@bot_async.message_handler(commands=['limpar_pendentes'])
+async def cmd_limpar_pendentes(message):
+    # Remove em lote no armazenamento: fora do loop
+    await _em_executor(main.cmd_limpar_pendentes, message)
+
+@bot_async.chat_join_request_handler()
+async def pedido_entrada(pedido):
+    # Grava no banco da fila de admissão: fora do loop
+    await _em_executor(main.pedido_entrada, pedido)
+
+@bot_async.message_handler(commands=['pagar'])
+async def cmd_pagar(message):
+    # Cria o pagamento no Mercado Pago: chamada bloqueante
+    await _em_executor(main.cmd_pagar, message)
+
+async def executar():
+    asyncio.get_running_loop().set_default_executor(executor)
+    config.aquecer_mercadopago()
+
+    await _em_executor(main.retomar_pendentes)
+    main.iniciar_estatisticas()
+    main.enviador.iniciar()
+    main.fila_grupo.iniciar()
+    main.agendador.iniciar()
+    main.roda_expiracao.iniciar()
+    main.iniciar_webhook_mp()
+    main.iniciar_metricas()
+    main.iniciar_saude()
+
+    if main.WEBHOOK_TELEGRAM:
+        logging.warning("⚠️ MODO_TELEGRAM=webhook não é suportado no modo asyncio; usando polling")
+
+    # SIGTERM (restart e deploy) e CTRL+C param o polling e encerram graciosamente
+    parada = asyncio.Event()
+    for sinal in (signal.SIGTERM, signal.SIGINT):
+        asyncio.get_running_loop().add_signal_handler(sinal, parada.set)
+
+    logging.info("🚀 Bot rodando em modo asyncio... (CTRL+C para parar)")
+    polling = asyncio.ensure_future(bot_async.infinity_polling(timeout=20, request_timeout=40))
+    await parada.wait()
+    logging.info("🛑 Sinal de encerramento recebido")
+    polling.cancel()
+    await asyncio.gather(polling, return_exceptions=True)
+
+    # Fora do loop: o encerramento espera verificações que dependem dele para concluir
+    await _em_executor(main.encerrar)
+
+if __name__ == "__main__":
+    logging.info("="*50)
+    logging.info("🤖 Bot iniciado (asyncio)!")
+    logging.info(f"📱 Chat ID do Admin: {config.MY_CHAT_ID}")
+    logging.info(f"👥 Grupo ID: {config.GROUP_CHAT_ID}")
+    logging.info(f"🔑 Token MP: {'Configurado' if config.TOKEN_MERCADOPAGO else 'NÃO CONFIGURADO!'}")
+    logging.info("="*50)
+
+    try:
+        asyncio.run(executar())
+    except Exception:
+        logging.error("Erro crítico no bot", exc_info=True)
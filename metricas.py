@@ -0,0 +1,243 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Limites (segundos) dos buckets de latência: de 5ms a 60s
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Limites (segundos) do tempo até a aprovação: de 30s a 24h
+BUCKETS_APROVACAO = (30, 60, 120, 300, 600, 1800, 3600, 7200, 21600, 43200, 86400)
+
+
+def _formatar_rotulos(rotulos):
+    if not rotulos:
+        return ""
+    return "{" + ",".join(f'{chave}="{valor}"' for chave, valor in rotulos) + "}"
+
+
+def percentil(buckets, contagens, p):
+    """
+    Percentil aproximado a partir das contagens por bucket
+
+    Args:
+        buckets: Limites superiores dos buckets, em ordem crescente
+        contagens: Observações em cada bucket, com o +Inf no fim
+        p: Percentil entre 0 e 1
+
+    Returns:
+        float: Limite superior do bucket onde o percentil cai
+    """
+    alvo = p * sum(contagens)
+    acumulado = 0
+    for i, contagem in enumerate(contagens):
+        acumulado += contagem
+        if acumulado >= alvo:
+            return buckets[i] if i < len(buckets) else float("inf")
+    return float("inf")
+
+
+class Contador:
+    """Contador monotônico, opcionalmente separado por rótulos"""
+
+    tipo = "counter"
+
+    def __init__(self, nome, descricao):
+        self.nome = nome
+        self.descricao = descricao
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def inc(self, quantidade=1, **rotulos):
+        chave = tuple(sorted(rotulos.items()))
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + quantidade
+
+    def valor(self, **rotulos):
+        return self._valores.get(tuple(sorted(rotulos.items())), 0)
+
+    def total(self):
+        with self._lock:
+            return sum(self._valores.values())
+
+    def exportar(self):
+        with self._lock:
+            return [f"{self.nome}{_formatar_rotulos(chave)} {valor}" for chave, valor in self._valores.items()]
+
+
+class Medidor:
+    """
+    Valor instantâneo (gauge)
+
+    Pode receber o valor diretamente (`definir`) ou uma função lida na hora
+    da exportação, para não custar nada no caminho quente.
+    """
+
+    tipo = "gauge"
+
+    def __init__(self, nome, descricao, funcao=None):
+        self.nome = nome
+        self.descricao = descricao
+        self._funcao = funcao
+        self._valor = 0
+
+    def definir(self, valor):
+        self._valor = valor
+
+    def valor(self):
+        if self._funcao is not None:
+            try:
+                return self._funcao()
+            except Exception:
+                return float("nan")
+        return self._valor
+
+    def exportar(self):
+        return [f"{self.nome} {self.valor()}"]
+
+
+class Histograma:
+    """Histograma com buckets fixos: observar custa uma busca binária e uma soma"""
+
+    tipo = "histogram"
+
+    def __init__(self, nome, descricao, buckets=BUCKETS_LATENCIA):
+        self.nome = nome
+        self.descricao = descricao
+        self.buckets = tuple(buckets)
+        self._series = {}  # rótulos -> [contagens por bucket (+Inf no fim), soma, total]
+        self._lock = threading.Lock()
+
+    def observar(self, valor, **rotulos):
+        chave = tuple(sorted(rotulos.items()))
+        indice = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(chave)
+            if serie is None:
+                serie = self._series[chave] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            serie[0][indice] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    @contextmanager
+    def medir(self, **rotulos):
+        """Mede a duração do bloco `with`"""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - inicio, **rotulos)
+
+    def resumo(self, **rotulos):
+        """
+        Retorna total, média e percentis aproximados (limite superior do bucket)
+
+        Returns:
+            dict: total, media, p50, p90, p99 (None quando não há observações)
+        """
+        with self._lock:
+            serie = self._series.get(tuple(sorted(rotulos.items())))
+            if serie is None or serie[2] == 0:
+                return {'total': 0, 'media': None, 'p50': None, 'p90': None, 'p99': None}
+            contagens, soma, total = list(serie[0]), serie[1], serie[2]
+
+        return {'total': total, 'media': soma / total,
+                'p50': percentil(self.buckets, contagens, 0.5),
+                'p90': percentil(self.buckets, contagens, 0.9),
+                'p99': percentil(self.buckets, contagens, 0.99)}
+
+    def exportar(self):
+        linhas = []
+        with self._lock:
+            for chave, (contagens, soma, total) in self._series.items():
+                acumulado = 0
+                for limite, contagem in zip(self.buckets + ("+Inf",), contagens):
+                    acumulado += contagem
+                    rotulos = _formatar_rotulos(chave + (("le", limite),))
+                    linhas.append(f"{self.nome}_bucket{rotulos} {acumulado}")
+                linhas.append(f"{self.nome}_sum{_formatar_rotulos(chave)} {soma}")
+                linhas.append(f"{self.nome}_count{_formatar_rotulos(chave)} {total}")
+        return linhas
+
+
+class RegistroMetricas:
+    """Conjunto de métricas exportado em texto no formato do Prometheus"""
+
+    def __init__(self):
+        self._metricas = {}
+        self._lock = threading.Lock()
+
+    def _registrar(self, metrica):
+        with self._lock:
+            return self._metricas.setdefault(metrica.nome, metrica)
+
+    def contador(self, nome, descricao):
+        return self._registrar(Contador(nome, descricao))
+
+    def medidor(self, nome, descricao, funcao=None):
+        return self._registrar(Medidor(nome, descricao, funcao))
+
+    def histograma(self, nome, descricao, buckets=BUCKETS_LATENCIA):
+        return self._registrar(Histograma(nome, descricao, buckets))
+
+    def exportar(self):
+        with self._lock:
+            metricas = list(self._metricas.values())
+        linhas = []
+        for metrica in metricas:
+            linhas.append(f"# HELP {metrica.nome} {metrica.descricao}")
+            linhas.append(f"# TYPE {metrica.nome} {metrica.tipo}")
+            linhas.extend(metrica.exportar())
+        return "\n".join(linhas) + "\n"
+
+    def rota(self, requisicao):
+        """Função de rota para o servidor HTTP embutido (/metrics)"""
+        return 200, self.exportar(), "text/plain; version=0.0.4; charset=utf-8"
+
+
+# Registro global usado pelo bot
+registro = RegistroMetricas()
+
+# Latências das chamadas externas
+latencia_mp = registro.histograma("bot_mercadopago_segundos", "Latência das chamadas ao Mercado Pago")
+latencia_telegram = registro.histograma("bot_telegram_envio_segundos", "Latência dos envios ao Telegram")
+latencia_verificacao = registro.histograma("bot_verificacao_segundos", "Duração de cada verificação de pagamento")
+
+# Resultados dos pagamentos
+pagamentos = registro.contador("bot_pagamentos_total", "Pagamentos por resultado (criado, aprovado, rejeitado, expirado)")
+tempo_aprovacao = registro.histograma(
+    "bot_tempo_ate_aprovacao_segundos", "Tempo entre a criação e a aprovação do pagamento", BUCKETS_APROVACAO
+)
+erros_mp = registro.contador("bot_mercadopago_erros_total", "Chamadas ao Mercado Pago que falharam")
+envios_telegram = registro.contador("bot_telegram_envios_total", "Envios ao Telegram por resultado")
+admissoes_grupo = registro.contador(
+    "bot_grupo_admissoes_total", "Aprovações de entrada no grupo por resultado (concedido, aguardando_pedido, limitado, erro)"
+)
+
+# Controle de admissão das criações de pagamento
+admissao = registro.contador(
+    "bot_admissao_total", "Pedidos de criação de pagamento por resultado (admitido, limite_usuario, fila_cheia, espera_esgotada)"
+)
+espera_admissao = registro.histograma("bot_admissao_espera_segundos", "Tempo na fila de espera por uma vaga de criação")
+
+# Despacho dos updates do Telegram para os handlers
+espera_despacho = registro.histograma(
+    "bot_despacho_espera_segundos", "Tempo entre a chegada de um update e o início do handler, por faixa"
+)
+
+
+@contextmanager
+def chamada_mp(operacao):
+    """Mede uma chamada ao SDK do Mercado Pago, contando as que falham"""
+    inicio = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        erros_mp.inc(operacao=operacao)
+        raise
+    finally:
+        latencia_mp.observar(time.perf_counter() - inicio, operacao=operacao)
+
+
+# Estado do processo
+registro.medidor("bot_threads", "Threads vivas no processo", threading.active_count)
@@ -0,0 +1,328 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Por quanto tempo o registro de um pagamento resolvido é mantido (segundos)
+RETENCAO_RESOLVIDOS = 7 * 24 * 3600
+
+# Intervalo mínimo entre duas limpezas dos resolvidos vencidos (segundos)
+INTERVALO_LIMPEZA_RESOLVIDOS = 3600
+
+
+class ArmazenamentoJson:
+    """
+    Persistência em um único arquivo JSON (formato original)
+
+    Cada alteração reescreve o arquivo inteiro, mas de forma atômica: grava
+    em um arquivo temporário e troca com os.replace, sob um lock.
+    """
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self._dados = {}
+        self._lock = threading.Lock()
+
+    def carregar(self):
+        """Retorna {payment_id: info} com tudo que está salvo"""
+        with self._lock:
+            if os.path.exists(self.caminho):
+                with open(self.caminho, "r") as f:
+                    self._dados = json.load(f)
+            else:
+                self._dados = {}
+            return dict(self._dados)
+
+    def _reescrever(self):
+        temporario = self.caminho + ".tmp"
+        with open(temporario, "w") as f:
+            json.dump(self._dados, f, default=str)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporario, self.caminho)
+
+    def gravar(self, payment_id, info):
+        with self._lock:
+            self._dados[str(payment_id)] = info
+            self._reescrever()
+
+    def remover(self, payment_id):
+        self.remover_varios([payment_id])
+
+    def remover_varios(self, payment_ids):
+        with self._lock:
+            for payment_id in payment_ids:
+                self._dados.pop(str(payment_id), None)
+            self._reescrever()
+
+    def marcar_resolvido(self, payment_id, status):
+        # Um único processo: a remoção atômica em memória já evita duplicidade
+        return True
+
+    def marcar_resolvidos(self, payment_ids, status):
+        return list(payment_ids)
+
+    def existe(self):
+        return os.path.exists(self.caminho)
+
+    def fechar(self):
+        pass
+
+
+class ArmazenamentoSqlite:
+    """
+    Persistência incremental em SQLite (modo WAL)
+
+    Cada evento custa uma escrita pequena em uma transação própria, que
+    sobrevive a uma queda no meio da gravação. Na primeira execução importa
+    o arquivo JSON antigo, se existir.
+
+    Com `instancia`, o banco pode ser compartilhado por vários processos do
+    bot: cada pendente tem um dono e um lease com validade. O dono renova
+    seus leases periodicamente (`renovar`); leases vencidos, de processos
+    que morreram, são assumidos por outro (`reivindicar`). A tabela
+    `resolvidos` garante que cada pagamento é concedido uma única vez, mesmo
+    que dois processos o resolvam ao mesmo tempo.
+    """
+
+    def __init__(self, caminho, arquivo_json_antigo=None, instancia=None, duracao_lease=60):
+        self.caminho = caminho
+        self.instancia = instancia
+        self.duracao_lease = duracao_lease
+        self._arquivo_json_antigo = arquivo_json_antigo
+        self._lock = threading.Lock()
+        self._ultima_limpeza = 0.0
+        self._conexao = sqlite3.connect(caminho, timeout=10, check_same_thread=False, isolation_level=None)
+        self._conexao.execute("PRAGMA journal_mode=WAL")
+        self._conexao.execute("PRAGMA synchronous=NORMAL")
+        self._conexao.execute(
+            "CREATE TABLE IF NOT EXISTS pendentes ("
+            " payment_id TEXT PRIMARY KEY,"
+            " user_id INTEGER,"
+            " dados TEXT NOT NULL,"
+            " dono TEXT,"
+            " lease_ate REAL NOT NULL DEFAULT 0)"
+        )
+        colunas = {linha[1] for linha in self._conexao.execute("PRAGMA table_info(pendentes)")}
+        if 'dono' not in colunas:
+            # Bancos criados antes dos leases
+            self._conexao.execute("ALTER TABLE pendentes ADD COLUMN dono TEXT")
+            self._conexao.execute("ALTER TABLE pendentes ADD COLUMN lease_ate REAL NOT NULL DEFAULT 0")
+        self._conexao.execute("CREATE INDEX IF NOT EXISTS idx_pendentes_user ON pendentes(user_id)")
+        self._conexao.execute("CREATE INDEX IF NOT EXISTS idx_pendentes_dono ON pendentes(dono, lease_ate)")
+        self._conexao.execute(
+            "CREATE TABLE IF NOT EXISTS resolvidos ("
+            " payment_id TEXT PRIMARY KEY,"
+            " status TEXT,"
+            " instancia TEXT,"
+            " resolvido_em REAL NOT NULL)"
+        )
+
+    @contextmanager
+    def _transacao(self, imediata=False):
+        """
+        Agrupa várias escritas em uma única transação (a conexão é autocommit)
+
+        Com `imediata`, o lock de escrita do banco é tomado já no início, para
+        leituras seguidas de escrita que não podem intercalar com outro processo.
+        """
+        self._conexao.execute("BEGIN IMMEDIATE" if imediata else "BEGIN")
+        try:
+            yield self._conexao
+        except Exception:
+            self._conexao.execute("ROLLBACK")
+            raise
+        self._conexao.execute("COMMIT")
+
+    def _migrar_json(self):
+        """Importa o pendentes.json antigo, uma única vez"""
+        caminho = self._arquivo_json_antigo
+        if not caminho or not os.path.exists(caminho):
+            return
+        with open(caminho, "r") as f:
+            antigos = json.load(f)
+        with self._transacao() as conexao:
+            conexao.executemany(
+                "INSERT OR IGNORE INTO pendentes (payment_id, user_id, dados) VALUES (?, ?, ?)",
+                [(str(pid), info.get('user_id'), json.dumps(info, default=str)) for pid, info in antigos.items()]
+            )
+        os.replace(caminho, caminho + ".migrado")
+        logging.info(f"Migrados {len(antigos)} pendentes de {caminho} para {self.caminho}")
+
+    def carregar(self):
+        """Retorna {payment_id: info} com tudo que está salvo"""
+        with self._lock:
+            self._migrar_json()
+            self._limpar_resolvidos(time.time())
+            linhas = self._conexao.execute("SELECT payment_id, dados FROM pendentes").fetchall()
+        return {payment_id: json.loads(dados) for payment_id, dados in linhas}
+
+    def gravar(self, payment_id, info):
+        # Um pendente novo já nasce com lease desta instância; atualizar não troca o dono
+        lease_ate = time.time() + self.duracao_lease if self.instancia else 0
+        with self._lock:
+            self._conexao.execute(
+                "INSERT INTO pendentes (payment_id, user_id, dados, dono, lease_ate) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT(payment_id) DO UPDATE SET user_id = excluded.user_id, dados = excluded.dados",
+                (str(payment_id), info.get('user_id'), json.dumps(info, default=str), self.instancia, lease_ate)
+            )
+
+    def remover(self, payment_id):
+        with self._lock:
+            self._conexao.execute("DELETE FROM pendentes WHERE payment_id = ?", (str(payment_id),))
+
+    def remover_varios(self, payment_ids):
+        with self._lock, self._transacao() as conexao:
+            conexao.executemany(
+                "DELETE FROM pendentes WHERE payment_id = ?",
+                [(str(payment_id),) for payment_id in payment_ids]
+            )
+
+    def reivindicar(self, limite):
+        """
+        Assume até `limite` pendentes sem dono ou com lease vencido
+
+        Returns:
+            dict: {payment_id: info} dos pendentes assumidos
+        """
+        agora = time.time()
+        with self._lock, self._transacao(imediata=True) as conexao:
+            ids = [linha[0] for linha in conexao.execute(
+                "SELECT payment_id FROM pendentes WHERE dono IS NULL OR (dono != ? AND lease_ate < ?) LIMIT ?",
+                (self.instancia, agora, limite)
+            )]
+            conexao.executemany(
+                "UPDATE pendentes SET dono = ?, lease_ate = ? WHERE payment_id = ?",
+                [(self.instancia, agora + self.duracao_lease, payment_id) for payment_id in ids]
+            )
+            linhas = conexao.execute(
+                f"SELECT payment_id, dados FROM pendentes WHERE payment_id IN ({','.join('?' * len(ids))})",
+                ids
+            ).fetchall() if ids else []
+        return {payment_id: json.loads(dados) for payment_id, dados in linhas}
+
+    def assumir(self, payment_id):
+        """
+        Toma o lease de um pendente específico, mesmo que tenha outro dono
+
+        Usado quando a notificação de um pagamento chega a outra instância.
+        O dono anterior percebe na próxima renovação e o descarta.
+
+        Returns:
+            dict | None: Dados do pendente, ou None se não está mais pendente
+        """
+        with self._lock:
+            self._conexao.execute(
+                "UPDATE pendentes SET dono = ?, lease_ate = ? WHERE payment_id = ?",
+                (self.instancia, time.time() + self.duracao_lease, str(payment_id))
+            )
+            linha = self._conexao.execute(
+                "SELECT dados FROM pendentes WHERE payment_id = ?", (str(payment_id),)
+            ).fetchone()
+        return json.loads(linha[0]) if linha else None
+
+    def renovar(self):
+        """
+        Estende os leases desta instância
+
+        Returns:
+            set: IDs (str) que continuam com esta instância; os que faltarem
+            foram assumidos por outra ou resolvidos
+        """
+        agora = time.time()
+        with self._lock:
+            self._conexao.execute(
+                "UPDATE pendentes SET lease_ate = ? WHERE dono = ?", (agora + self.duracao_lease, self.instancia)
+            )
+            return {linha[0] for linha in self._conexao.execute(
+                "SELECT payment_id FROM pendentes WHERE dono = ?", (self.instancia,)
+            )}
+
+    def liberar(self):
+        """Devolve os leases desta instância para que outra assuma na hora (ao encerrar)"""
+        with self._lock:
+            self._conexao.execute("UPDATE pendentes SET dono = NULL, lease_ate = 0 WHERE dono = ?", (self.instancia,))
+
+    def _limpar_resolvidos(self, agora):
+        """
+        Apaga os resolvidos mais velhos que RETENCAO_RESOLVIDOS (chamado com o lock adquirido)
+
+        Roda ao carregar e junto das marcações, no máximo uma vez a cada
+        INTERVALO_LIMPEZA_RESOLVIDOS, em qualquer modo de execução.
+        """
+        if agora - self._ultima_limpeza < INTERVALO_LIMPEZA_RESOLVIDOS:
+            return
+        self._ultima_limpeza = agora
+        self._conexao.execute("DELETE FROM resolvidos WHERE resolvido_em < ?", (agora - RETENCAO_RESOLVIDOS,))
+
+    def marcar_resolvido(self, payment_id, status):
+        """
+        Registra a resolução de um pagamento, uma única vez entre todas as instâncias
+
+        Returns:
+            bool: True se esta chamada registrou; False se já estava resolvido
+        """
+        agora = time.time()
+        with self._lock:
+            self._limpar_resolvidos(agora)
+            cursor = self._conexao.execute(
+                "INSERT OR IGNORE INTO resolvidos (payment_id, status, instancia, resolvido_em) VALUES (?, ?, ?, ?)",
+                (str(payment_id), status, self.instancia, agora)
+            )
+            return cursor.rowcount == 1
+
+    def marcar_resolvidos(self, payment_ids, status):
+        """
+        Versão em lote de `marcar_resolvido`, em uma única transação
+
+        Returns:
+            list: IDs que esta chamada registrou (os demais já estavam resolvidos)
+        """
+        agora = time.time()
+        registrados = []
+        with self._lock, self._transacao() as conexao:
+            self._limpar_resolvidos(agora)
+            for payment_id in payment_ids:
+                cursor = conexao.execute(
+                    "INSERT OR IGNORE INTO resolvidos (payment_id, status, instancia, resolvido_em) VALUES (?, ?, ?, ?)",
+                    (str(payment_id), status, self.instancia, agora)
+                )
+                if cursor.rowcount == 1:
+                    registrados.append(payment_id)
+        return registrados
+
+    def existe(self):
+        return os.path.exists(self.caminho)
+
+    def fechar(self):
+        with self._lock:
+            self._conexao.close()
+
+
+def criar_armazenamento(tipo, arquivo_json, arquivo_banco, instancia=None, duracao_lease=60):
+    """
+    Cria o armazenamento de pendentes configurado
+
+    Args:
+        tipo: "sqlite" (padrão) ou "json"
+        arquivo_json: Caminho do pendentes.json (formato original)
+        arquivo_banco: Caminho do banco SQLite
+        instancia: Identificador desta instância, para dividir os pendentes
+            com outras por leases (só no SQLite)
+        duracao_lease: Validade de cada lease, em segundos
+
+    Returns:
+        ArmazenamentoSqlite | ArmazenamentoJson
+
+    Raises:
+        ValueError: Se pedir várias instâncias com o armazenamento JSON
+    """
+    if tipo == "json":
+        if instancia:
+            raise ValueError("Várias instâncias exigem PERSISTENCIA=sqlite")
+        return ArmazenamentoJson(arquivo_json)
+    return ArmazenamentoSqlite(arquivo_banco, arquivo_json_antigo=arquivo_json,
+                               instancia=instancia, duracao_lease=duracao_lease)
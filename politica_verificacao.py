@@ -0,0 +1,67 @@
+class PoliticaFixa:
+    """
+    Verifica sempre no mesmo intervalo, até a expiração do PIX
+
+    Args:
+        intervalo: Segundos entre verificações
+        janela: Se informado, desiste após esse tempo desde a criação
+            (comportamento antigo: 10s por 10 minutos)
+    """
+
+    def __init__(self, intervalo=10, janela=None):
+        self.intervalo = float(intervalo)
+        self.janela = janela
+
+    def proximo_atraso(self, idade, restante, tentativas):
+        if self.janela is not None and idade >= self.janela:
+            return None
+        return min(self.intervalo, restante)
+
+
+class PoliticaAdaptativa:
+    """
+    Verificações densas logo após a criação e espaçadas depois
+
+    Nos primeiros `densa_por` segundos verifica a cada `intervalo_denso`
+    (é quando a maioria paga). Depois o intervalo acompanha a idade do
+    pagamento (`crescimento` x idade, ou seja, backoff exponencial) até
+    `intervalo_max`, sem nunca passar da expiração do PIX. Não depende de
+    estado, então continua igual após um restart.
+    """
+
+    def __init__(self, densa_por=300, intervalo_denso=10, crescimento=0.25, intervalo_max=1800):
+        self.densa_por = float(densa_por)
+        self.intervalo_denso = float(intervalo_denso)
+        self.crescimento = float(crescimento)
+        self.intervalo_max = float(intervalo_max)
+
+    def proximo_atraso(self, idade, restante, tentativas):
+        if idade < self.densa_por:
+            atraso = self.intervalo_denso
+        else:
+            atraso = min(self.intervalo_max, max(self.intervalo_denso, idade * self.crescimento))
+        return min(atraso, restante)
+
+
+# Políticas disponíveis em POLITICA_VERIFICACAO
+POLITICAS = {
+    'fixa': PoliticaFixa,
+    'adaptativa': PoliticaAdaptativa,
+}
+
+
+def criar_politica(nome, **parametros):
+    """
+    Cria a política de verificação pelo nome
+
+    Qualquer objeto com `proximo_atraso(idade, restante, tentativas)` pode
+    ser usado: recebe a idade do pagamento e o tempo até a expiração (em
+    segundos) e retorna o atraso até a próxima verificação, ou None para
+    encerrar.
+
+    Raises:
+        ValueError: Se o nome não for conhecido
+    """
+    if nome not in POLITICAS:
+        raise ValueError(f"Política de verificação desconhecida: {nome} (opções: {', '.join(POLITICAS)})")
+    return POLITICAS[nome](**parametros)
@@ -0,0 +1,298 @@
+import datetime
+import logging
+import threading
+
+# Validade assumida para registros antigos, que não guardavam a expiração (segundos)
+VALIDADE_PADRAO = 24 * 3600
+
+
+class Pendente:
+    """
+    Um pagamento pendente
+
+    Com __slots__ cada registro ocupa uma fração do dict com as mesmas
+    chaves, o que pesa com centenas de milhares de pendentes em memória.
+    O payment_id é sempre int e os momentos são epoch, seja o pendente
+    recém-criado ou carregado do armazenamento.
+    """
+
+    __slots__ = ('payment_id', 'user_id', 'chat_id', 'valor', 'criado_em', 'expira_em', 'qr_code')
+
+    def __init__(self, payment_id, user_id, chat_id, valor, criado_em, expira_em, qr_code=None):
+        self.payment_id = int(payment_id)
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.valor = valor
+        self.criado_em = float(criado_em)
+        self.expira_em = float(expira_em)
+        self.qr_code = qr_code
+
+    @classmethod
+    def de_dict(cls, payment_id, dados, valor_padrao=None, validade_padrao=VALIDADE_PADRAO):
+        """
+        Monta o pendente a partir do formato salvo no armazenamento
+
+        Registros antigos só têm 'timestamp' (texto ISO) e não têm valor nem
+        expiração; eles recebem `valor_padrao` e `validade_padrao`.
+        """
+        criado_em = dados.get('criado_em')
+        if criado_em is None:
+            criado_em = datetime.datetime.fromisoformat(dados['timestamp']).timestamp()
+        return cls(
+            payment_id,
+            dados['user_id'],
+            dados.get('chat_id', dados['user_id']),
+            dados.get('valor', valor_padrao),
+            criado_em,
+            dados.get('expira_em', criado_em + validade_padrao),
+            dados.get('qr_code')
+        )
+
+    def para_dict(self):
+        """Formato gravado no armazenamento (sem o payment_id, que é a chave)"""
+        return {
+            'user_id': self.user_id,
+            'chat_id': self.chat_id,
+            'valor': self.valor,
+            'criado_em': self.criado_em,
+            'expira_em': self.expira_em,
+            'qr_code': self.qr_code,
+        }
+
+    def __repr__(self):
+        return f"Pendente({self.payment_id}, user_id={self.user_id}, expira_em={self.expira_em:.0f})"
+
+
+class RegistroPendentes:
+    """
+    Registro em memória dos pagamentos pendentes
+
+    Guarda {payment_id (int): Pendente} junto com um índice secundário
+    user_id -> {payment_ids}, ambos alterados sob o mesmo lock. Consultas
+    por usuário (/status, checagem de duplicados) custam O(1).
+
+    Se receber um armazenamento (ver persistencia.py), cada inclusão ou
+    remoção também é gravada nele. Com várias instâncias, o registro guarda
+    só os pendentes cujo lease é desta instância (`reivindicar`, `renovar`).
+    Os registros lidos do armazenamento viram Pendente com `valor_padrao`
+    e `validade_padrao` para os campos que os formatos antigos não tinham.
+    """
+
+    def __init__(self, armazenamento=None, valor_padrao=None, validade_padrao=VALIDADE_PADRAO):
+        self._armazenamento = armazenamento
+        self._valor_padrao = valor_padrao
+        self._validade_padrao = validade_padrao
+        self._pendentes = {}
+        self._por_usuario = {}
+        self._lock = threading.RLock()
+
+    # Leitura no formato de dict, usada pelo restante do bot
+    def __len__(self):
+        return len(self._pendentes)
+
+    def __contains__(self, payment_id):
+        return payment_id in self._pendentes
+
+    def __iter__(self):
+        return iter(self.chaves())
+
+    def get(self, payment_id, padrao=None):
+        return self._pendentes.get(payment_id, padrao)
+
+    def chaves(self):
+        with self._lock:
+            return list(self._pendentes)
+
+    def items(self):
+        """Cópia dos itens, segura para iterar enquanto outras threads alteram"""
+        with self._lock:
+            return list(self._pendentes.items())
+
+    def do_usuario(self, user_id):
+        """Retorna [(payment_id, Pendente)] dos pendentes de um usuário"""
+        with self._lock:
+            return [(payment_id, self._pendentes[payment_id]) for payment_id in self._por_usuario.get(user_id, ())]
+
+    def _indexar(self, payment_id, info):
+        self._por_usuario.setdefault(info.user_id, set()).add(payment_id)
+
+    def _desindexar(self, payment_id, info):
+        ids = self._por_usuario.get(info.user_id)
+        if ids is not None:
+            ids.discard(payment_id)
+            if not ids:
+                del self._por_usuario[info.user_id]
+
+    def _do_armazenamento(self, payment_id, dados):
+        return Pendente.de_dict(payment_id, dados, self._valor_padrao, self._validade_padrao)
+
+    def _persistir(self, operacao, *args):
+        if self._armazenamento is None:
+            return
+        try:
+            getattr(self._armazenamento, operacao)(*args)
+        except Exception as e:
+            logging.error(f"Erro ao persistir pendentes ({operacao}): {e}")
+
+    def adicionar(self, pendente):
+        """Inclui (ou substitui) um pendente e o persiste"""
+        payment_id = pendente.payment_id
+        with self._lock:
+            anterior = self._pendentes.get(payment_id)
+            if anterior is not None:
+                self._desindexar(payment_id, anterior)
+            self._pendentes[payment_id] = pendente
+            self._indexar(payment_id, pendente)
+            self._persistir('gravar', payment_id, pendente.para_dict())
+
+    def remover(self, payment_id):
+        """
+        Retira um pendente de forma atômica
+
+        Returns:
+            Pendente | None: O pendente, ou None se já tinha sido removido
+        """
+        with self._lock:
+            info = self._pendentes.pop(payment_id, None)
+            if info is None:
+                return None
+            self._desindexar(payment_id, info)
+            self._persistir('remover', payment_id)
+            return info
+
+    def remover_varios(self, payment_ids):
+        """Retira vários pendentes com uma única escrita no armazenamento"""
+        removidos = {}
+        with self._lock:
+            for payment_id in payment_ids:
+                info = self._pendentes.pop(payment_id, None)
+                if info is not None:
+                    self._desindexar(payment_id, info)
+                    removidos[payment_id] = info
+            if removidos:
+                self._persistir('remover_varios', list(removidos))
+        return removidos
+
+    def reivindicar(self, limite):
+        """
+        Assume pendentes sem dono (ou de instâncias que pararam) no armazenamento
+
+        Returns:
+            dict: {payment_id: Pendente} dos que passaram a ser desta instância
+        """
+        with self._lock:
+            assumidos = {}
+            for payment_id, dados in self._armazenamento.reivindicar(limite).items():
+                payment_id = int(payment_id)
+                if payment_id not in self._pendentes:
+                    info = self._do_armazenamento(payment_id, dados)
+                    self._pendentes[payment_id] = info
+                    self._indexar(payment_id, info)
+                    assumidos[payment_id] = info
+            return assumidos
+
+    def assumir(self, payment_id):
+        """
+        Traz para esta instância um pendente de outra
+
+        Returns:
+            Pendente | None: None se não está mais pendente
+        """
+        payment_id = int(payment_id)
+        with self._lock:
+            if payment_id in self._pendentes:
+                return self._pendentes[payment_id]
+            dados = self._armazenamento.assumir(payment_id)
+            if dados is None:
+                return None
+            info = self._do_armazenamento(payment_id, dados)
+            self._pendentes[payment_id] = info
+            self._indexar(payment_id, info)
+            return info
+
+    def renovar(self):
+        """
+        Renova os leases desta instância e descarta os que ela perdeu
+
+        Não remove nada do armazenamento: os perdidos continuam pendentes,
+        agora com outra instância (ou já resolvidos por ela).
+
+        Returns:
+            dict: {payment_id: Pendente} dos pendentes descartados
+        """
+        with self._lock:
+            donos = self._armazenamento.renovar()
+            perdidos = {}
+            for payment_id in [payment_id for payment_id in self._pendentes if str(payment_id) not in donos]:
+                info = self._pendentes.pop(payment_id)
+                self._desindexar(payment_id, info)
+                perdidos[payment_id] = info
+            return perdidos
+
+    def liberar(self):
+        """Devolve os leases desta instância no armazenamento"""
+        if self._armazenamento is not None and hasattr(self._armazenamento, 'liberar'):
+            self._armazenamento.liberar()
+
+    def marcar_resolvido(self, payment_id, status):
+        """
+        Registra a resolução no armazenamento, uma única vez entre instâncias
+
+        Returns:
+            bool: False se outra instância já resolveu este pagamento
+        """
+        if self._armazenamento is None:
+            return True
+        try:
+            return self._armazenamento.marcar_resolvido(payment_id, status)
+        except Exception as e:
+            # Na dúvida, concede: o pendente já saiu da memória e não será verificado de novo
+            logging.error(f"Erro ao registrar resolução do pagamento {payment_id}: {e}")
+            return True
+
+    def marcar_resolvidos(self, payment_ids, status):
+        """Versão em lote de `marcar_resolvido`; retorna os IDs que esta instância resolveu"""
+        if self._armazenamento is None:
+            return list(payment_ids)
+        try:
+            return self._armazenamento.marcar_resolvidos(payment_ids, status)
+        except Exception as e:
+            logging.error(f"Erro ao registrar resolução de {len(payment_ids)} pagamentos: {e}")
+            return list(payment_ids)
+
+    def carregar(self):
+        """Substitui o conteúdo pelo que está no armazenamento e reconstrói o índice"""
+        dados = self._armazenamento.carregar() if self._armazenamento is not None else {}
+        with self._lock:
+            self._pendentes = {
+                int(payment_id): self._do_armazenamento(payment_id, info) for payment_id, info in dados.items()
+            }
+            self._por_usuario = {}
+            for payment_id, info in self._pendentes.items():
+                self._indexar(payment_id, info)
+        return len(self._pendentes)
+
+    def mesclar(self):
+        """
+        Traz do armazenamento só os pendentes que não estão na memória
+
+        Ao contrário de `carregar`, não descarta nada: o que foi incluído ou
+        removido na memória desde o início continua valendo. A leitura é
+        feita sob o lock, então um pendente removido (e apagado do
+        armazenamento) no meio da mesclagem não volta.
+
+        Returns:
+            dict: {payment_id: Pendente} dos que entraram na memória
+        """
+        if self._armazenamento is None:
+            return {}
+        with self._lock:
+            novos = {}
+            for payment_id, dados in self._armazenamento.carregar().items():
+                payment_id = int(payment_id)
+                if payment_id not in self._pendentes:
+                    info = self._do_armazenamento(payment_id, dados)
+                    self._pendentes[payment_id] = info
+                    self._indexar(payment_id, info)
+                    novos[payment_id] = info
+            return novos
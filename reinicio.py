@@ -0,0 +1,102 @@
+import json
+import sqlite3
+import threading
+import time
+
+# Instantâneos mais velhos que isso são descartados (ex.: sobra de um deploy antigo)
+VALIDADE = 3600
+
+# Intervalo entre leituras enquanto espera o processo anterior gravar
+INTERVALO_ESPERA = 0.25
+
+
+class EstadoReinicio:
+    """
+    Estado deixado por um processo encerrado para o próximo retomar
+
+    Guarda um único instantâneo em SQLite (JSON em uma linha). Ao começar
+    a encerrar, o processo grava uma marca sem dados (`iniciar_encerramento`)
+    e, no fim, o instantâneo (`gravar`). `retirar` lê e apaga na mesma
+    transação, então o estado é retomado uma única vez; se encontrar só a
+    marca, espera o instantâneo chegar. Se o processo cair sem encerrar,
+    não há instantâneo e o próximo usa a retomada normal.
+    """
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self._lock = threading.Lock()
+        self._conexao = sqlite3.connect(caminho, timeout=10, check_same_thread=False, isolation_level=None)
+        self._conexao.execute("PRAGMA journal_mode=WAL")
+        self._conexao.execute("PRAGMA synchronous=NORMAL")
+        self._conexao.execute(
+            "CREATE TABLE IF NOT EXISTS estado_reinicio ("
+            " id INTEGER PRIMARY KEY CHECK (id = 1),"
+            " dados TEXT,"
+            " gravado_em REAL NOT NULL)"
+        )
+
+    def _substituir(self, dados):
+        with self._lock:
+            self._conexao.execute(
+                "INSERT OR REPLACE INTO estado_reinicio (id, dados, gravado_em) VALUES (1, ?, ?)",
+                (dados, time.time())
+            )
+
+    def iniciar_encerramento(self):
+        """Avisa o próximo processo que um instantâneo está a caminho"""
+        self._substituir(None)
+
+    def gravar(self, dados):
+        """Substitui o instantâneo guardado por `dados` (serializável em JSON)"""
+        self._substituir(json.dumps(dados))
+
+    def _ler_e_apagar(self):
+        """
+        Returns:
+            tuple | None: (dados ou None se só há a marca, gravado_em), ou
+            None sem nada guardado; o instantâneo é apagado, a marca não
+        """
+        with self._lock:
+            self._conexao.execute("BEGIN IMMEDIATE")
+            try:
+                linha = self._conexao.execute("SELECT dados, gravado_em FROM estado_reinicio WHERE id = 1").fetchone()
+                if linha is not None and linha[0] is not None:
+                    self._conexao.execute("DELETE FROM estado_reinicio")
+            except Exception:
+                self._conexao.execute("ROLLBACK")
+                raise
+            self._conexao.execute("COMMIT")
+        return linha
+
+    def retirar(self, espera=0.0):
+        """
+        Lê e apaga o instantâneo
+
+        Args:
+            espera: Se o processo anterior ainda está encerrando (só a marca
+                gravada), quantos segundos esperar pelo instantâneo
+
+        Returns:
+            tuple | None: (dados, gravado_em), ou None se não havia
+            instantâneo válido
+        """
+        limite = time.monotonic() + espera
+        while True:
+            linha = self._ler_e_apagar()
+            if linha is None:
+                return None
+            dados, gravado_em = linha
+            if dados is not None:
+                if time.time() - gravado_em > VALIDADE:
+                    return None
+                return json.loads(dados), gravado_em
+            if time.time() - gravado_em > VALIDADE or time.monotonic() >= limite:
+                # Marca de um processo que morreu no encerramento: não esperar por ela de novo
+                with self._lock:
+                    self._conexao.execute("DELETE FROM estado_reinicio WHERE dados IS NULL")
+                return None
+            time.sleep(INTERVALO_ESPERA)
+
+    def fechar(self):
+        with self._lock:
+            self._conexao.close()
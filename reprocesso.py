@@ -0,0 +1,55 @@
+import threading
+from collections import OrderedDict
+
+
+class FilaReprocesso:
+    """
+    Pedidos de /pagar guardados enquanto o Mercado Pago está fora
+
+    Guarda no máximo um pedido por usuário (um /pagar repetido não gera
+    dois PIX) e até `tamanho_max` pedidos no total, em ordem de chegada.
+    Quando o serviço volta, os pedidos são retirados um a um e criados.
+    """
+
+    def __init__(self, tamanho_max=500):
+        self.tamanho_max = max(0, int(tamanho_max))
+        self._pedidos = OrderedDict()  # user_id -> chat_id
+        self._lock = threading.Lock()
+
+    def guardar(self, user_id, chat_id):
+        """
+        Guarda o pedido do usuário
+
+        Returns:
+            bool: False se a fila está cheia (o pedido não foi guardado)
+        """
+        with self._lock:
+            if user_id in self._pedidos:
+                self._pedidos[user_id] = chat_id
+                return True
+            if len(self._pedidos) >= self.tamanho_max:
+                return False
+            self._pedidos[user_id] = chat_id
+            return True
+
+    def retirar(self):
+        """
+        Retira o pedido mais antigo
+
+        Returns:
+            tuple | None: (user_id, chat_id), ou None se a fila está vazia
+        """
+        with self._lock:
+            if not self._pedidos:
+                return None
+            return self._pedidos.popitem(last=False)
+
+    def devolver(self, user_id, chat_id):
+        """Recoloca no início da fila um pedido que não pôde ser criado"""
+        with self._lock:
+            self._pedidos[user_id] = chat_id
+            self._pedidos.move_to_end(user_id, last=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pedidos)
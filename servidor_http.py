@@ -0,0 +1,104 @@
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# Rotas registradas: (método, caminho) -> função(requisicao) -> (status, corpo, content_type)
+_rotas = {}
+_servidor = None
+
+# Tamanho máximo aceito no corpo de uma requisição
+TAMANHO_MAXIMO_CORPO = 1024 * 1024
+
+
+class Requisicao:
+    """Dados de uma requisição recebida, entregues às funções de rota"""
+
+    __slots__ = ('metodo', 'caminho', 'query', 'cabecalhos', 'corpo')
+
+    def __init__(self, metodo, caminho, query, cabecalhos, corpo):
+        self.metodo = metodo
+        self.caminho = caminho
+        self.query = query
+        self.cabecalhos = cabecalhos
+        self.corpo = corpo
+
+
+def registrar_rota(metodo, caminho, funcao):
+    """
+    Registra uma rota no servidor HTTP embutido
+
+    Args:
+        metodo: "GET" ou "POST"
+        caminho: Caminho exato (ex.: "/webhook/mercadopago")
+        funcao: Recebe uma Requisicao e retorna (status, corpo, content_type)
+    """
+    _rotas[(metodo.upper(), caminho)] = funcao
+
+
+class _Manipulador(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _responder(self, status, corpo=b"", content_type="text/plain; charset=utf-8"):
+        if isinstance(corpo, str):
+            corpo = corpo.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def _despachar(self, metodo):
+        partes = urlsplit(self.path)
+        funcao = _rotas.get((metodo, partes.path))
+        if funcao is None:
+            self._responder(404, "not found")
+            return
+
+        tamanho = int(self.headers.get("Content-Length") or 0)
+        if tamanho > TAMANHO_MAXIMO_CORPO:
+            self._responder(413, "payload too large")
+            return
+        corpo = self.rfile.read(tamanho) if tamanho else b""
+
+        query = {chave: valores[-1] for chave, valores in parse_qs(partes.query).items()}
+        requisicao = Requisicao(metodo, partes.path, query, self.headers, corpo)
+        try:
+            status, resposta, content_type = funcao(requisicao)
+        except Exception:
+            logging.error(f"Erro ao processar {metodo} {partes.path}", exc_info=True)
+            status, resposta, content_type = 500, "internal error", "text/plain; charset=utf-8"
+        self._responder(status, resposta, content_type)
+
+    def do_GET(self):
+        self._despachar("GET")
+
+    def do_POST(self):
+        self._despachar("POST")
+
+    def log_message(self, format, *args):
+        logging.debug(f"HTTP {self.address_string()} {format % args}")
+
+
+def iniciar(porta, host="0.0.0.0"):
+    """Inicia o servidor HTTP embutido em uma thread própria (idempotente)"""
+    global _servidor
+    if _servidor is not None:
+        return _servidor
+
+    _servidor = ThreadingHTTPServer((host, porta), _Manipulador)
+    _servidor.daemon_threads = True
+    thread = threading.Thread(target=_servidor.serve_forever, name="servidor-http")
+    thread.daemon = True
+    thread.start()
+    logging.info(f"🌐 Servidor HTTP ouvindo em {host}:{porta} ({len(_rotas)} rotas)")
+    return _servidor
+
+
+def parar():
+    """Encerra o servidor HTTP embutido"""
+    global _servidor
+    if _servidor is not None:
+        _servidor.shutdown()
+        _servidor.server_close()
+        _servidor = None
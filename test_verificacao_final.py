@@ -0,0 +1,80 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+# O main abre o banco e lê pendentes.json no diretório atual: isola em um temporário
+_diretorio = tempfile.TemporaryDirectory(prefix="teste-bot-")
+_anterior = os.getcwd()
+os.chdir(_diretorio.name)
+os.environ.update(
+    TELEGRAM_TOKEN="123456:teste",
+    MERCADOPAGO_ACCESS_TOKEN="TEST-teste",
+    PUBLIC_KEY="TEST-teste",
+    MY_CHAT_ID="1",
+    GROUP_CHAT_ID="-1001",
+    GROUP_INVITE_LINK="https://t.me/+teste",
+    ARQUIVO_BANCO=os.path.join(_diretorio.name, "pendentes.db"),
+    MP_WEBHOOK_ATIVO="false",
+    METRICAS_ATIVO="false",
+)
+
+import main  # noqa: E402
+from registro import Pendente  # noqa: E402
+
+
+def tearDownModule():
+    os.chdir(_anterior)
+    _diretorio.cleanup()
+
+
+class _SdkFalso:
+    """SDK do Mercado Pago que responde sempre `resposta` ao GET do pagamento"""
+
+    def __init__(self, resposta):
+        self._resposta = resposta
+
+    def payment(self):
+        return self
+
+    def get(self, payment_id):
+        return self._resposta
+
+
+class TestVerificacaoFinal(unittest.TestCase):
+    PAYMENT_ID = 4242
+
+    def setUp(self):
+        agora = time.time()
+        main.pagamentos_pendentes.adicionar(Pendente(
+            self.PAYMENT_ID, user_id=7, chat_id=7, valor=25, criado_em=agora - 3600, expira_em=agora - 5, qr_code="qr"
+        ))
+        self.mensagens = []
+        enviar = mock.patch.object(main.enviador, "enviar", lambda chat_id, texto, **_: self.mensagens.append(texto))
+        enviar.start()
+        self.addCleanup(enviar.stop)
+        self.addCleanup(main._remover_pendente, self.PAYMENT_ID)
+
+    def _verificar(self, resposta):
+        with mock.patch.object(main.config, "get_mercadopago_sdk", lambda: _SdkFalso(resposta)):
+            return main.verificar_pagamento(self.PAYMENT_ID)
+
+    def test_erro_do_mercado_pago_nao_expira(self):
+        atraso = self._verificar({'status': 500, 'response': {'message': 'internal_error'}})
+
+        self.assertEqual(atraso, main.INTERVALO_APOS_ERRO)
+        self.assertIn(self.PAYMENT_ID, main.pagamentos_pendentes)
+        self.assertEqual(self.mensagens, [])
+
+    def test_pendente_confirmado_expira(self):
+        atraso = self._verificar({'status': 200, 'response': {'id': self.PAYMENT_ID, 'status': 'pending'}})
+        main.expirar_acumulados()
+
+        self.assertIsNone(atraso)
+        self.assertNotIn(self.PAYMENT_ID, main.pagamentos_pendentes)
+        self.assertEqual(len(self.mensagens), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,198 @@
+import hashlib
+import hmac
+import json
+import logging
+import sys
+import threading
+import time
+import uuid
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+
+# Caminho da rota de notificações no servidor HTTP embutido
+CAMINHO = "/webhook/mercadopago"
+
+# Quantas notificações recentes são lembradas para descartar reenvios
+MAX_NOTIFICACOES_LEMBRADAS = 10000
+
+
+def _parse_assinatura(cabecalho):
+    """Separa o cabeçalho x-signature ("ts=...,v1=...") em um dict"""
+    partes = {}
+    for item in (cabecalho or "").split(","):
+        chave, _, valor = item.strip().partition("=")
+        if chave and valor:
+            partes[chave] = valor
+    return partes
+
+
+def _manifesto(data_id, request_id, ts):
+    """Monta o template assinado pelo Mercado Pago"""
+    manifesto = ""
+    if data_id:
+        manifesto += f"id:{data_id};"
+    if request_id:
+        manifesto += f"request-id:{request_id};"
+    manifesto += f"ts:{ts};"
+    return manifesto
+
+
+def assinar(segredo, data_id, request_id, ts):
+    """Calcula a assinatura v1 (HMAC-SHA256) de uma notificação"""
+    return hmac.new(
+        segredo.encode(),
+        _manifesto(data_id, request_id, ts).encode(),
+        hashlib.sha256
+    ).hexdigest()
+
+
+def validar_assinatura(segredo, cabecalho_assinatura, request_id, data_id):
+    """
+    Valida o cabeçalho x-signature de uma notificação do Mercado Pago
+
+    Args:
+        segredo: Chave secreta do webhook (painel do Mercado Pago)
+        cabecalho_assinatura: Valor do cabeçalho x-signature
+        request_id: Valor do cabeçalho x-request-id
+        data_id: Parâmetro data.id da URL
+
+    Returns:
+        bool: True se a assinatura confere
+    """
+    if not segredo:
+        return False
+
+    partes = _parse_assinatura(cabecalho_assinatura)
+    ts = partes.get("ts")
+    recebida = partes.get("v1")
+    if not ts or not recebida:
+        return False
+
+    # IDs alfanuméricos são assinados em minúsculas
+    if data_id and not data_id.isdigit():
+        data_id = data_id.lower()
+
+    esperada = assinar(segredo, data_id, request_id, ts)
+    return hmac.compare_digest(esperada, recebida)
+
+
+class ReceptorNotificacoesMP:
+    """
+    Recebe notificações de pagamento do Mercado Pago
+
+    Valida a assinatura, descarta reenvios da mesma notificação e entrega o
+    ID do pagamento para `ao_notificar`, que agenda a consulta do status sem
+    prender a requisição. A notificação só é lembrada depois de entregue:
+    se `ao_notificar` falhar, a resposta é 500 e o reenvio do Mercado Pago
+    é tratado normalmente.
+    """
+
+    def __init__(self, segredo, ao_notificar):
+        self._segredo = segredo
+        self._ao_notificar = ao_notificar
+        self._vistas = OrderedDict()
+        self._lock = threading.Lock()
+        self.recebidas = 0
+        self.duplicadas = 0
+        self.rejeitadas = 0
+
+    def _ja_vista(self, chave):
+        with self._lock:
+            if chave in self._vistas:
+                self._vistas.move_to_end(chave)
+                return True
+            return False
+
+    def _lembrar(self, chave):
+        with self._lock:
+            self._vistas[chave] = True
+            self._vistas.move_to_end(chave)
+            if len(self._vistas) > MAX_NOTIFICACOES_LEMBRADAS:
+                self._vistas.popitem(last=False)
+
+    def processar(self, requisicao):
+        """Função de rota para o servidor HTTP embutido"""
+        try:
+            corpo = json.loads(requisicao.corpo or b"{}")
+        except ValueError:
+            corpo = {}
+
+        data_id = requisicao.query.get("data.id") or str(corpo.get("data", {}).get("id") or "")
+        tipo = requisicao.query.get("type") or corpo.get("type")
+        request_id = requisicao.cabecalhos.get("x-request-id")
+
+        if not validar_assinatura(self._segredo, requisicao.cabecalhos.get("x-signature"), request_id, data_id):
+            self.rejeitadas += 1
+            logging.warning(f"Notificação do Mercado Pago com assinatura inválida (data.id={data_id})")
+            return 401, "invalid signature", "text/plain; charset=utf-8"
+
+        self.recebidas += 1
+        if tipo != "payment" or not data_id:
+            return 200, "ignored", "text/plain; charset=utf-8"
+
+        # O ID da notificação se repete nos reenvios; sem ele, usa o x-request-id
+        chave = str(corpo.get("id") or request_id or f"{data_id}:{corpo.get('action')}")
+        if self._ja_vista(chave):
+            self.duplicadas += 1
+            logging.debug("Notificação %s repetida, ignorando", chave)
+            return 200, "duplicate", "text/plain; charset=utf-8"
+
+        logging.info(f"🔔 Notificação do Mercado Pago para pagamento {data_id} ({corpo.get('action')})")
+        try:
+            self._ao_notificar(data_id)
+        except Exception:
+            logging.error(f"Erro ao tratar notificação do pagamento {data_id}", exc_info=True)
+            return 500, "error", "text/plain; charset=utf-8"
+        self._lembrar(chave)
+        return 200, "ok", "text/plain; charset=utf-8"
+
+
+def notificar_fake(url, segredo, payment_id, action="payment.updated", notificacao_id=None):
+    """
+    Envia uma notificação assinada como o Mercado Pago faria
+
+    Serve para testar o receptor localmente, sem acesso à rede externa.
+
+    Returns:
+        int: Status HTTP da resposta
+    """
+    request_id = str(uuid.uuid4())
+    ts = str(int(time.time() * 1000))
+    corpo = json.dumps({
+        "id": notificacao_id or int(time.time() * 1000),
+        "live_mode": False,
+        "type": "payment",
+        "action": action,
+        "data": {"id": str(payment_id)},
+    }).encode()
+    assinatura = assinar(segredo, str(payment_id), request_id, ts)
+
+    requisicao = urllib.request.Request(
+        f"{url}?data.id={payment_id}&type=payment",
+        data=corpo,
+        method="POST",
+        headers={
+            "Content-Type": "application/json",
+            "x-request-id": request_id,
+            "x-signature": f"ts={ts},v1={assinatura}",
+        },
+    )
+    try:
+        with urllib.request.urlopen(requisicao, timeout=10) as resposta:
+            return resposta.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+if __name__ == "__main__":
+    # Uso: python webhook_mp.py <payment_id> [url]
+    import config
+
+    if len(sys.argv) < 2:
+        print("Uso: python webhook_mp.py <payment_id> [url]")
+        sys.exit(1)
+
+    url = sys.argv[2] if len(sys.argv) > 2 else f"http://127.0.0.1:{config.HTTP_PORTA}{CAMINHO}"
+    status = notificar_fake(url, config.MP_WEBHOOK_SECRET or "", sys.argv[1])
+    print(f"Notificação enviada para {url}: HTTP {status}")
@@ -0,0 +1,144 @@
+import hmac
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import telebot
+
+# Caminho da rota de updates no servidor HTTP embutido
+CAMINHO = "/webhook/telegram"
+
+
+class ReceptorUpdatesTelegram:
+    """
+    Recebe updates do Telegram via webhook
+
+    Cada update recebido vai para uma fila limitada consumida por um número
+    fixo de workers, que chamam `bot.process_new_updates`. Com a fila cheia
+    a requisição recebe 503 e o Telegram reenvia depois (backpressure), em
+    vez de acumular updates sem limite na memória.
+
+    Com um `despachante` (DespachanteUpdates), os updates vão direto para
+    ele, que já tem fila e workers próprios; o 503 vem da fila dele.
+    """
+
+    def __init__(self, bot, segredo=None, tamanho_fila=1000, workers=4, despachante=None):
+        self._bot = bot
+        self._segredo = segredo
+        self._despachante = despachante
+        self._fila = queue.Queue(maxsize=tamanho_fila)
+        self._num_workers = max(1, int(workers))
+        self._threads = []
+        self.recebidos = 0
+        self.recusados = 0
+
+    def iniciar(self):
+        """Inicia os workers que consomem a fila de updates"""
+        if self._despachante is not None:
+            return
+        for i in range(self._num_workers):
+            thread = threading.Thread(target=self._loop, name=f"updates-{i}")
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _loop(self):
+        while True:
+            update = self._fila.get()
+            try:
+                self._bot.process_new_updates([update])
+            except Exception:
+                logging.error(f"Erro ao processar update {update.update_id}", exc_info=True)
+            finally:
+                self._fila.task_done()
+
+    def tamanho_fila(self):
+        return self._fila.qsize()
+
+    def processar(self, requisicao):
+        """Função de rota para o servidor HTTP embutido"""
+        if self._segredo:
+            recebido = requisicao.cabecalhos.get("X-Telegram-Bot-Api-Secret-Token") or ""
+            if not hmac.compare_digest(recebido, self._segredo):
+                logging.warning("Update do Telegram com secret token inválido")
+                return 401, "invalid secret token", "text/plain; charset=utf-8"
+
+        try:
+            update = telebot.types.Update.de_json(requisicao.corpo.decode("utf-8"))
+        except Exception:
+            logging.warning("Update do Telegram com JSON inválido")
+            return 400, "invalid update", "text/plain; charset=utf-8"
+
+        try:
+            if self._despachante is not None:
+                if not self._despachante.enviar(update):
+                    raise queue.Full
+            else:
+                self._fila.put_nowait(update)
+        except queue.Full:
+            self.recusados += 1
+            logging.warning(f"Fila de updates cheia, recusando update {update.update_id}")
+            return 503, "busy", "text/plain; charset=utf-8"
+
+        self.recebidos += 1
+        return 200, "ok", "text/plain; charset=utf-8"
+
+
+def update_fake(texto, user_id, update_id=None, username="teste"):
+    """Monta o JSON de um Update com uma mensagem de texto privada"""
+    agora = int(time.time())
+    usuario = {"id": user_id, "is_bot": False, "first_name": username, "username": username}
+    mensagem = {
+        "message_id": agora,
+        "from": usuario,
+        "chat": {"id": user_id, "type": "private", "first_name": username, "username": username},
+        "date": agora,
+        "text": texto,
+    }
+    if texto.startswith("/"):
+        comando = texto.split()[0]
+        mensagem["entities"] = [{"offset": 0, "length": len(comando), "type": "bot_command"}]
+    return {"update_id": update_id or agora, "message": mensagem}
+
+
+def enviar_update_fake(url, texto, user_id, segredo=None):
+    """
+    Envia um Update montado localmente para o webhook, como o Telegram faria
+
+    Returns:
+        int: Status HTTP da resposta
+    """
+    cabecalhos = {"Content-Type": "application/json"}
+    if segredo:
+        cabecalhos["X-Telegram-Bot-Api-Secret-Token"] = segredo
+
+    requisicao = urllib.request.Request(
+        url,
+        data=json.dumps(update_fake(texto, user_id)).encode(),
+        method="POST",
+        headers=cabecalhos,
+    )
+    try:
+        with urllib.request.urlopen(requisicao, timeout=10) as resposta:
+            return resposta.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+if __name__ == "__main__":
+    # Uso: python webhook_telegram.py <user_id> [texto] [url]
+    import config
+
+    if len(sys.argv) < 2:
+        print("Uso: python webhook_telegram.py <user_id> [texto] [url]")
+        sys.exit(1)
+
+    texto = sys.argv[2] if len(sys.argv) > 2 else "/start"
+    url = sys.argv[3] if len(sys.argv) > 3 else f"http://127.0.0.1:{config.HTTP_PORTA}{CAMINHO}"
+    status = enviar_update_fake(url, texto, int(sys.argv[1]), config.TELEGRAM_WEBHOOK_SECRET)
+    print(f"Update '{texto}' enviado para {url}: HTTP {status}")